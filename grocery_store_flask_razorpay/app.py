@@ -1,9 +1,21 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import sqlite3, os, hmac, hashlib
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, has_app_context, make_response, stream_with_context, abort
+import sqlite3, os, re, hmac, hashlib, uuid, io, tempfile, shutil, json, time, threading
+import click
+from functools import wraps
+from markupsafe import Markup, escape
+from datetime import datetime, timedelta, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageOps
+from werkzeug.http import is_resource_modified
+from PIL import Image, ImageOps, features
+from db_pool import ConnectionPool, PooledConnection
+from migration_helper import Migration, run_migrations
+from site_cache import VersionStamps, VersionedCache, PageCache
+from job_queue import JobQueue, JobWorker
+from data_export import EXPORT_FORMATS, export_stream, group_rows, iter_cursor, stream_chunks
+from resilience import CircuitBreaker, CircuitOpenError, retry_call
+from session_store import SqliteSessionInterface
+from flask.sessions import SecureCookieSessionInterface
 
 # Load environment variables from .env files if available (without hard import)
 import importlib.util, importlib
@@ -23,6 +35,34 @@ except ImportError:
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.secret_key = os.environ.get('APP_SECRET_KEY', 'change-this-secret-key')
 DB_PATH = 'store.db'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+# SQLite connection profiles, applied as PRAGMAs on every new connection.
+# 'legacy' keeps SQLite defaults (rollback journal, synchronous=FULL, no mmap).
+DB_PROFILES = {
+    'legacy': {},
+    'wal': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',   # durable across app crashes; WAL fsyncs on checkpoint
+        'cache_size': -20000,      # negative = KiB, i.e. ~20MB page cache per connection
+        'mmap_size': 134217728,    # 128MB memory-mapped reads
+        'temp_store': 'memory',
+        'busy_timeout': 5000,      # ms to wait on a locked database before failing
+    },
+    'wal_durable': {
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'cache_size': -20000,
+        'mmap_size': 134217728,
+        'temp_store': 'memory',
+        'busy_timeout': 10000,
+    },
+}
+DB_PROFILE = os.environ.get('DB_PROFILE', 'wal')
+if DB_PROFILE not in DB_PROFILES:
+    print(f"[INIT] Unknown DB_PROFILE '{DB_PROFILE}', falling back to 'wal'")
+    DB_PROFILE = 'wal'
 
 # Reusable SQL and message constants (avoid duplication)
 SQL_SELECT_PRODUCT_BY_ID = 'SELECT * FROM products WHERE id=?'
@@ -42,6 +82,11 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)  # 30 days session
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True if using HTTPS in production
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent JavaScript access to session cookie
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF protection
+# SESSION_BACKEND=sqlite keeps session data (cart, filters, flashes) in the
+# sessions table and only a signed id in the cookie; 'cookie' is Flask's
+# signed-cookie session. Existing cookie sessions are taken over on first visit.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '2048'))
 
 # Image upload configuration
 UPLOAD_FOLDER = 'static/product_images'
@@ -50,17 +95,101 @@ MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
 IMAGE_DEFAULT_SIZE = (800, 800)  # Default bounding box for uploaded images
 IMAGE_JPEG_QUALITY = 85
 
+# Encoded images and derivatives are stored under their SHA-256, so identical
+# bytes are kept once and a URL never changes content (served as immutable).
+IMAGE_CAS_PREFIX = 'product_images/cas/'
+IMAGE_CAS_FOLDER = os.path.join('static', IMAGE_CAS_PREFIX)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Responsive derivatives of each product image (bounding boxes, never upscaled)
+IMAGE_VARIANT_SIZES = {
+    'thumb': (160, 160),
+    'card': (400, 400),
+    'detail': (800, 800),
+}
+# (format key, Pillow format, MIME type, save options); best compression first
+IMAGE_VARIANT_FORMATS = [
+    ('avif', 'AVIF', 'image/avif', {'quality': 55, 'speed': 6}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+# AVIF needs Pillow 11.3+ (pinned in requirements.txt); WebP needs libwebp
+IMAGE_VARIANT_FORMATS = [f for f in IMAGE_VARIANT_FORMATS if f[0] == 'jpg' or features.check(f[0])]
+
+# Uploads are stored raw and encoded by the image worker (see Image jobs).
+# IMAGE_WORKER=thread drains the queue inside each web process; with
+# IMAGE_WORKER=external run `flask run-image-worker` as its own service.
+IMAGE_RAW_FOLDER = os.path.join(UPLOAD_FOLDER, 'raw')
+IMAGE_WORKER = os.environ.get('IMAGE_WORKER', 'thread')
+IMAGE_WORKER_PROCESSES = int(os.environ.get('IMAGE_WORKER_PROCESSES', '2'))
+
+# Garbage collection of unreferenced image files (see Garbage collection).
+# Files younger than IMAGE_GC_MIN_AGE seconds are never touched, so an upload
+# whose row is not committed yet survives. Orphans are moved to the quarantine
+# folder and purged after IMAGE_QUARANTINE_DAYS. IMAGE_GC_INTERVAL_HOURS > 0
+# schedules a collection through the image worker.
+IMAGE_GC_MIN_AGE = float(os.environ.get('IMAGE_GC_MIN_AGE', '3600'))
+IMAGE_GC_BATCH_SIZE = int(os.environ.get('IMAGE_GC_BATCH_SIZE', '500'))
+IMAGE_GC_INTERVAL_HOURS = float(os.environ.get('IMAGE_GC_INTERVAL_HOURS', '0'))
+IMAGE_QUARANTINE_FOLDER = os.environ.get('IMAGE_QUARANTINE_FOLDER', os.path.join('data', 'image_quarantine'))
+IMAGE_QUARANTINE_DAYS = float(os.environ.get('IMAGE_QUARANTINE_DAYS', '7'))
+# Raw uploads of failed image jobs are kept this long for a retry from
+# /admin/image-jobs, then collected like any other orphan
+IMAGE_FAILED_RAW_DAYS = float(os.environ.get('IMAGE_FAILED_RAW_DAYS', '7'))
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(IMAGE_CAS_FOLDER, exist_ok=True)
+os.makedirs(IMAGE_RAW_FOLDER, exist_ok=True)
 app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_SIZE
 
+# In-process caches invalidated across workers by version stamp files
+CACHE_STAMP_DIR = os.environ.get('CACHE_STAMP_DIR', os.path.join('data', 'cache_stamps'))
+cache_stamps = VersionStamps(CACHE_STAMP_DIR)
+site_cache = VersionedCache(cache_stamps)
+
+# Rendered catalog pages for anonymous visitors (PAGE_CACHE_TTL=0 disables)
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', '256'))
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', '60'))
+page_cache = PageCache(cache_stamps, max_entries=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
+
+def bump_cache_version(*names):
+    """Invalidate cached data for the given stamps in every worker process."""
+    for name in names:
+        cache_stamps.bump(name)
+
 
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET')
 RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET')
 
+# Gateway calls: per-attempt timeout, attempts, and a circuit breaker that
+# fails fast after RAZORPAY_BREAKER_FAILURES consecutive failed calls.
+# RAZORPAY_API_BASE points the SDK elsewhere, e.g. http://127.0.0.1:9010/v1
+# for the fake gateway in mock_services.py.
+RAZORPAY_API_BASE = os.environ.get('RAZORPAY_API_BASE')
+RAZORPAY_TIMEOUT = float(os.environ.get('RAZORPAY_TIMEOUT', '5'))
+RAZORPAY_RETRIES = int(os.environ.get('RAZORPAY_RETRIES', '3'))
+RAZORPAY_BREAKER_FAILURES = int(os.environ.get('RAZORPAY_BREAKER_FAILURES', '5'))
+RAZORPAY_BREAKER_RESET = float(os.environ.get('RAZORPAY_BREAKER_RESET', '30'))
+# A customer request (checkout, /pay) gets fewer tries and a total time budget;
+# reconcile-payments uses the full RAZORPAY_RETRIES
+RAZORPAY_REQUEST_RETRIES = int(os.environ.get('RAZORPAY_REQUEST_RETRIES', '2'))
+RAZORPAY_REQUEST_BUDGET = float(os.environ.get('RAZORPAY_REQUEST_BUDGET', '6'))
+
+# Razorpay webhooks are queued in an inbox and processed by a worker (see
+# Webhooks). WEBHOOK_WORKER=thread runs it inside each web process; with
+# WEBHOOK_WORKER=external run `flask run-webhook-worker` as its own service.
+WEBHOOK_WORKER = os.environ.get('WEBHOOK_WORKER', 'thread')
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', '50'))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_RETRY_DELAY = float(os.environ.get('WEBHOOK_RETRY_DELAY', '5'))
+WEBHOOK_PAID_EVENTS = ('payment.captured', 'order.paid')
+
 client = None
 if razorpay and RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET),
+                             **({'base_url': RAZORPAY_API_BASE} if RAZORPAY_API_BASE else {}))
 
 # Optional HTTP client (requests) for external integrations
 try:
@@ -77,6 +206,25 @@ SITE_ANNOUNCEMENT = os.environ.get('SITE_ANNOUNCEMENT', '')
 # Brevo (Sendinblue) optional integration
 BREVO_API_KEY = os.environ.get('BREVO_API_KEY')
 BREVO_LIST_ID = os.environ.get('BREVO_LIST_ID')  # integer string
+# Subscribers reach Brevo through the newsletter outbox (see Newsletter
+# subscription). NEWSLETTER_SYNC=thread sends from each web process; with
+# NEWSLETTER_SYNC=external run `flask sync-newsletter --loop` as its own service.
+BREVO_API_BASE = os.environ.get('BREVO_API_BASE', 'https://api.brevo.com/v3').rstrip('/')
+BREVO_TIMEOUT = float(os.environ.get('BREVO_TIMEOUT', '10'))
+BREVO_RETRIES = int(os.environ.get('BREVO_RETRIES', '2'))
+BREVO_BREAKER_FAILURES = int(os.environ.get('BREVO_BREAKER_FAILURES', '3'))
+BREVO_BREAKER_RESET = float(os.environ.get('BREVO_BREAKER_RESET', '60'))
+NEWSLETTER_SYNC = os.environ.get('NEWSLETTER_SYNC', 'thread')
+NEWSLETTER_BATCH_SIZE = int(os.environ.get('NEWSLETTER_BATCH_SIZE', '500'))
+NEWSLETTER_BATCH_WINDOW = float(os.environ.get('NEWSLETTER_BATCH_WINDOW', '5'))
+NEWSLETTER_SYNC_INTERVAL = float(os.environ.get('NEWSLETTER_SYNC_INTERVAL', '60'))
+NEWSLETTER_RETRY_DELAY = float(os.environ.get('NEWSLETTER_RETRY_DELAY', '30'))
+NEWSLETTER_MAX_ATTEMPTS = int(os.environ.get('NEWSLETTER_MAX_ATTEMPTS', '8'))
+NEWSLETTER_CLAIM_TIMEOUT = float(os.environ.get('NEWSLETTER_CLAIM_TIMEOUT', '600'))  # seconds before a 'sending' row is reclaimed
+# Community like/comment counters are adjusted by +-1 on each toggle (see
+# Community counters); a reconciliation through the image worker every
+# COMMUNITY_RECONCILE_INTERVAL_HOURS corrects any drift (0 disables it).
+COMMUNITY_RECONCILE_INTERVAL_HOURS = float(os.environ.get('COMMUNITY_RECONCILE_INTERVAL_HOURS', '24'))
 WHATSAPP_NUMBER = os.environ.get('WHATSAPP_NUMBER')  # e.g., +919876543210
 
 
@@ -97,71 +245,123 @@ def save_product_image(file, product_id):
         return None
     
     try:
-        # Save with secure filename
-        filename = secure_filename(f"product_{product_id}_{int(datetime.now().timestamp())}.jpg")
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        img, image_path = encode_product_image(file)
+        if not has_image_variants(image_path):
+            record_image_variants(image_path, generate_image_variants(img))
+        return image_path
+    except Exception as e:
+        flash(f'Error uploading image: {str(e)}', 'error')
+        return None
 
-        # Open image and normalize
-        img = Image.open(file)
-        # Correct orientation from EXIF if present
-        try:
-            img = ImageOps.exif_transpose(img)
-        except Exception:
-            pass
-        # Convert to RGB for consistent JPEG output
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
 
-        # Fit into bounding box without upscaling
-        img = ImageOps.contain(img, IMAGE_DEFAULT_SIZE, Image.LANCZOS)
+def encode_product_image(source):
+    """Normalize an upload (file or path) and store it as a JPEG in the image store.
+    Returns (normalized RGB image, image path).
+    """
+    # Open image and normalize
+    img = Image.open(source)
+    # Correct orientation from EXIF if present
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        pass
+    # Convert to RGB for consistent JPEG output
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
 
-        # Save optimized JPEG
-        img.save(filepath, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    # Fit into bounding box without upscaling
+    img = ImageOps.contain(img, IMAGE_DEFAULT_SIZE, Image.LANCZOS)
 
-        return f'product_images/{filename}'
-    except Exception as e:
-        flash(f'Error uploading image: {str(e)}', 'error')
-        return None
+    # Save optimized JPEG
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    return img, store_image_bytes(buffer.getvalue(), 'jpg')
 
 
 def replace_product_image(pid, current_image_path, uploaded_file):
-    """Save a new image for a product and remove the previous one if present.
-    Returns the final image path to store for the product.
+    """Queue a new image for a product; the worker swaps it in and releases the
+    previous one once encoded. Returns the image path to keep storing until then.
     """
     if not uploaded_file or uploaded_file.filename == '':
         return current_image_path
-    new_image_path = save_product_image(uploaded_file, pid)
-    if new_image_path:
-        if current_image_path:
-            old_filepath = os.path.join('static', current_image_path)
-            if os.path.exists(old_filepath):
-                try:
-                    os.remove(old_filepath)
-                except OSError:
-                    # Ignore file removal errors
-                    pass
-        return new_image_path
+    queue_product_image(uploaded_file, pid, replace_path=current_image_path)
     return current_image_path
 
 
+def store_image_bytes(data: bytes, ext: str) -> str:
+    """Write data to the content-addressed store (once) and return its image path."""
+    digest = hashlib.sha256(data).hexdigest()
+    image_path = f'{IMAGE_CAS_PREFIX}{digest[:2]}/{digest}.{ext}'
+    filepath = os.path.join('static', image_path)
+    if not os.path.exists(filepath):
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Write then rename, so a reader never sees a partial file under the final name
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix='.upload-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    else:
+        # Reused file: refresh its mtime so the garbage collector treats it as new
+        os.utime(filepath)
+    return image_path
+
+
+SQL_IMAGE_REF_COUNT = '''SELECT
+    (SELECT COUNT(*) FROM products WHERE image_path = :path)
+    + (SELECT COUNT(*) FROM product_images WHERE image_path = :path)
+    + (SELECT COUNT(*) FROM catalog_images WHERE image_path = :path) AS refs'''
+
+
+def release_image(image_path) -> bool:
+    """Delete an image and its derivatives once no row references it.
+    Call after removing or repointing the caller's own reference.
+    Returns True if the file was unlinked.
+    """
+    if not image_path:
+        return False
+    conn = get_db()
+    try:
+        # Count and unlink under the write lock: finish_product_image checks the
+        # file under the same lock before committing a reference to it
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute(SQL_IMAGE_REF_COUNT, {'path': image_path}).fetchone()['refs']:
+            conn.rollback()
+            return False
+        variants_removed = delete_image_variants(conn, image_path)
+        removed = True
+        filepath = os.path.join('static', image_path)
+        if os.path.exists(filepath):
+            try:
+                os.remove(filepath)
+            except OSError:
+                # Ignore file removal errors
+                removed = False
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if variants_removed:
+        bump_cache_version('image_variants')
+    return removed
+
+
 def save_product_catalog_images(product_id, image_files):
-    """Save multiple images for a product catalog/gallery.
-    Returns list of saved image paths.
+    """Queue multiple images for a product catalog/gallery.
+    Each is added to product_images when the worker has encoded it.
+    Returns list of job ids.
     """
     if not image_files:
         return []
     
-    saved_images = []
+    job_ids = []
     for idx, file in enumerate(image_files):
         if file and file.filename != '':
-            image_path = save_product_image(file, product_id)
-            if image_path:
-                saved_images.append({
-                    'path': image_path,
-                    'order': idx,
-                    'is_primary': 1 if idx == 0 else 0
-                })
-    return saved_images
+            job_id = queue_product_image(file, product_id, kind='gallery_image', order=idx, is_primary=1 if idx == 0 else 0)
+            if job_id:
+                job_ids.append(job_id)
+    return job_ids
 
 
 def add_product_images_to_db(product_id, image_data_list):
@@ -178,6 +378,7 @@ def add_product_images_to_db(product_id, image_data_list):
         conn.commit()
     finally:
         conn.close()
+    bump_cache_version('catalog')
 
 
 def get_product_images(product_id):
@@ -214,25 +415,16 @@ def user_verified_purchase(email: str, product_id: int) -> bool:
 
 
 def compute_review_stats(product_id: int):
-    """Compute average rating, total count, and per-star breakdown for approved reviews."""
+    """Average rating, total count, and per-star breakdown for approved reviews
+    (one product_review_stats lookup)."""
     conn = get_db()
-    stats = {'avg_rating': 0.0, 'total': 0, 'breakdown': {5: 0, 4: 0, 3: 0, 2: 0, 1: 0}}
-    rows = conn.execute(
-        'SELECT rating, COUNT(*) as c FROM product_reviews WHERE product_id=? AND is_approved=1 GROUP BY rating',
-        (product_id,)
-    ).fetchall()
-    total = 0
-    ssum = 0
-    for r in rows:
-        rating = int(r['rating'])
-        cnt = int(r['c'])
-        if rating in stats['breakdown']:
-            stats['breakdown'][rating] = cnt
-        total += cnt
-        ssum += rating * cnt
-    stats['total'] = total
-    stats['avg_rating'] = round((ssum / total) if total else 0.0, 1)
+    row = conn.execute('SELECT * FROM product_review_stats WHERE product_id=?', (product_id,)).fetchone()
     conn.close()
+    stats = {'avg_rating': 0.0, 'total': 0, 'breakdown': {5: 0, 4: 0, 3: 0, 2: 0, 1: 0}}
+    if row is not None and row['review_count']:
+        stats['total'] = row['review_count']
+        stats['avg_rating'] = round(row['avg_rating'], 1)
+        stats['breakdown'] = {star: row[f'stars_{star}'] for star in (5, 4, 3, 2, 1)}
     return stats
 
 
@@ -269,21 +461,66 @@ def compute_review_stats_bulk(product_ids: list[int]):
     placeholders = ",".join(["?"] * len(product_ids))
     conn = get_db()
     rows = conn.execute(
-        f'''SELECT product_id, AVG(rating) as avg_rating, COUNT(*) as total
-            FROM product_reviews
-            WHERE is_approved=1 AND product_id IN ({placeholders})
-            GROUP BY product_id''',
+        f'SELECT product_id, avg_rating, review_count FROM product_review_stats '
+        f'WHERE review_count > 0 AND product_id IN ({placeholders})',
         tuple(product_ids)
     ).fetchall()
     conn.close()
     for r in rows:
-        pid = int(r['product_id'])
-        avg_rating = float(r['avg_rating']) if r['avg_rating'] is not None else 0.0
-        total = int(r['total']) if r['total'] is not None else 0
-        result[pid] = {'avg_rating': round(avg_rating, 1), 'total': total}
+        result[r['product_id']] = {'avg_rating': round(r['avg_rating'], 1), 'total': r['review_count']}
     return result
 
 
+# product_review_stats is kept in step with product_reviews by the triggers of
+# migration 26, in the same transaction as the review write (including
+# cascades from product deletes). rebuild/verify exist for repairs.
+SQL_REVIEW_STATS_FROM_REVIEWS = '''SELECT product_id, COUNT(*) AS review_count, SUM(rating) AS rating_sum,
+           SUM(rating = 1) AS stars_1, SUM(rating = 2) AS stars_2, SUM(rating = 3) AS stars_3,
+           SUM(rating = 4) AS stars_4, SUM(rating = 5) AS stars_5
+    FROM product_reviews WHERE is_approved = 1
+      AND product_id IN (SELECT id FROM products)
+    GROUP BY product_id'''
+REVIEW_STATS_COLUMNS = ('review_count', 'rating_sum', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+
+
+def rebuild_review_stats(conn):
+    """Recompute product_review_stats from product_reviews (caller commits)."""
+    conn.execute('DELETE FROM product_review_stats')
+    conn.execute(f"INSERT INTO product_review_stats (product_id, {', '.join(REVIEW_STATS_COLUMNS)}) "
+                 f'{SQL_REVIEW_STATS_FROM_REVIEWS}')
+
+
+def verify_review_stats() -> list:
+    """Compare product_review_stats with a fresh aggregate; returns
+    (product_id, stored, expected) for every product that differs."""
+    conn = get_db()
+    stored = {r['product_id']: tuple(r[c] for c in REVIEW_STATS_COLUMNS)
+              for r in conn.execute('SELECT * FROM product_review_stats WHERE review_count > 0').fetchall()}
+    expected = {r['product_id']: tuple(r[c] for c in REVIEW_STATS_COLUMNS)
+                for r in conn.execute(SQL_REVIEW_STATS_FROM_REVIEWS).fetchall()}
+    conn.close()
+    return [(pid, stored.get(pid), expected.get(pid))
+            for pid in sorted(stored.keys() | expected.keys()) if stored.get(pid) != expected.get(pid)]
+
+
+@app.cli.command('review-stats')
+@click.option('--rebuild', is_flag=True, help='Recompute the table from product_reviews')
+def review_stats_command(rebuild):
+    """Verify (or rebuild) the materialized review aggregates."""
+    init_db()
+    if rebuild:
+        conn = get_db()
+        conn.execute('BEGIN IMMEDIATE')
+        rebuild_review_stats(conn)
+        conn.commit(); conn.close()
+        bump_cache_version('catalog')
+        print('[REVIEWS] Rebuilt product_review_stats')
+    mismatches = verify_review_stats()
+    for pid, stored, expected in mismatches[:20]:
+        print(f'[REVIEWS] Product {pid}: stored {stored}, expected {expected}')
+    print(f'[REVIEWS] {len(mismatches)} product(s) out of step' if mismatches else '[REVIEWS] product_review_stats is consistent')
+
+
 def delete_product_image(image_id):
     """Delete a single image from product_images table and from filesystem."""
     conn = get_db()
@@ -295,29 +532,675 @@ def delete_product_image(image_id):
         conn.execute('DELETE FROM product_images WHERE id=?', (image_id,))
         conn.commit()
         conn.close()
+        bump_cache_version('catalog')
         
-        # Delete from filesystem
-        filepath = os.path.join('static', image_path)
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except OSError:
-                pass
+        # Delete from filesystem unless another product or region still uses it
+        release_image(image_path)
         return True
     conn.close()
     return False
 
 
+# ==========================
+# Image variants
+# ==========================
+
+def generate_image_variants(img):
+    """Store every size/format derivative of img (the normalized RGB upload).
+
+    Files go to the content-addressed store. Sizes that come out identical to
+    a smaller one (small originals) are skipped.
+    Returns a list of dicts describing the stored files.
+    """
+    variants, seen_sizes = [], set()
+    for variant, box in IMAGE_VARIANT_SIZES.items():
+        resized = ImageOps.contain(img, box, Image.LANCZOS) if (img.width > box[0] or img.height > box[1]) else img
+        if resized.size in seen_sizes:
+            continue
+        seen_sizes.add(resized.size)
+        for fmt, pil_format, _, options in IMAGE_VARIANT_FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            variants.append({
+                'variant': variant,
+                'format': fmt,
+                'width': resized.width,
+                'height': resized.height,
+                'path': store_image_bytes(buffer.getvalue(), fmt),
+                'bytes': buffer.tell(),
+            })
+    return variants
+
+
+def insert_image_variants(conn, image_path, variants):
+    """Replace the image_variants rows for image_path (caller commits)."""
+    conn.execute('DELETE FROM image_variants WHERE source_path=?', (image_path,))
+    conn.executemany(
+        'INSERT INTO image_variants (source_path, variant, format, width, height, path, bytes, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(image_path, v['variant'], v['format'], v['width'], v['height'], v['path'], v['bytes'], datetime.now().isoformat())
+         for v in variants]
+    )
+
+
+def record_image_variants(image_path, variants):
+    """Replace the image_variants rows for image_path."""
+    conn = get_db()
+    insert_image_variants(conn, image_path, variants)
+    conn.commit()
+    conn.close()
+    bump_cache_version('image_variants')
+
+
+def has_image_variants(image_path, conn=None) -> bool:
+    own = conn is None
+    conn = conn or get_db()
+    row = conn.execute('SELECT 1 FROM image_variants WHERE source_path=? LIMIT 1', (image_path,)).fetchone()
+    if own:
+        conn.close()
+    return row is not None
+
+
+def delete_image_variants(conn, image_path) -> bool:
+    """Remove the derivative rows of an image being deleted, and their files
+    unless an identical derivative of another image shares them (caller commits).
+    Returns True if there were any."""
+    rows = conn.execute('SELECT path FROM image_variants WHERE source_path=?', (image_path,)).fetchall()
+    conn.execute('DELETE FROM image_variants WHERE source_path=?', (image_path,))
+    shared = {r['path'] for r in conn.execute(
+        f"SELECT path FROM image_variants WHERE path IN ({','.join('?' * len(rows))})", [r['path'] for r in rows]
+    ).fetchall()} if rows else set()
+    for row in rows:
+        if row['path'] in shared:
+            continue
+        try:
+            os.remove(os.path.join('static', row['path']))
+        except OSError:
+            pass
+    return bool(rows)
+
+
+def _load_image_variants():
+    """{source_path: {format: [(width, path, variant), ...] by width}}"""
+    conn = get_db()
+    rows = conn.execute('SELECT source_path, variant, format, width, path FROM image_variants ORDER BY source_path, width').fetchall()
+    conn.close()
+    variants = {}
+    for r in rows:
+        variants.setdefault(r['source_path'], {}).setdefault(r['format'], []).append((r['width'], r['path'], r['variant']))
+    return variants
+
+
+def get_image_variants(image_path):
+    try:
+        return site_cache.get('image_variants', ('image_variants',), _load_image_variants).get(image_path, {})
+    except sqlite3.Error:
+        return {}
+
+
+@app.template_global()
+def image_variant_url(image_path, variant='detail', fmt='jpg'):
+    """URL of one derivative, falling back to the nearest smaller size or the original."""
+    candidates = get_image_variants(image_path).get(fmt, [])
+    wanted = IMAGE_VARIANT_SIZES[variant][0]
+    chosen = [path for width, path, _ in candidates if width <= wanted]
+    return url_for('static', filename=chosen[-1] if chosen else image_path)
+
+
+@app.template_global()
+def responsive_image(image_path, alt='', sizes='100vw', variant='card', **attrs):
+    """<picture> with AVIF/WebP sources and a JPEG <img srcset> fallback.
+
+    variant picks the default src for browsers without srcset support; extra
+    keyword arguments become <img> attributes (class_ for class).
+    Images without derivatives render as a plain <img>.
+    """
+    img_attrs = ''.join(
+        f' {escape(name.rstrip("_").replace("_", "-"))}="{escape(value)}"' for name, value in attrs.items() if value is not None
+    )
+    variants = get_image_variants(image_path)
+    if not variants:
+        return Markup(f'<img src="{escape(url_for("static", filename=image_path))}" alt="{escape(alt)}"{img_attrs}>')
+
+    def srcset(fmt):
+        return ', '.join(f'{url_for("static", filename=path)} {width}w' for width, path, _ in variants.get(fmt, []))
+
+    parts = ['<picture class="responsive-image">']
+    for fmt, _, mime, _ in IMAGE_VARIANT_FORMATS:
+        if fmt != 'jpg' and fmt in variants:
+            parts.append(f'<source type="{mime}" srcset="{escape(srcset(fmt))}" sizes="{escape(sizes)}">')
+    parts.append(
+        f'<img src="{escape(image_variant_url(image_path, variant))}" srcset="{escape(srcset("jpg"))}" '
+        f'sizes="{escape(sizes)}" alt="{escape(alt)}"{img_attrs}>'
+    )
+    parts.append('</picture>')
+    return Markup(''.join(parts))
+
+
+def backfill_image_variants(force=False):
+    """Generate derivatives for product images that have none (or all, if force)."""
+    conn = get_db()
+    paths = [r['image_path'] for r in conn.execute(
+        'SELECT image_path FROM products WHERE image_path IS NOT NULL AND image_path != \'\' '
+        'UNION SELECT image_path FROM product_images WHERE image_path IS NOT NULL'
+    ).fetchall()]
+    done = {r['source_path'] for r in conn.execute('SELECT DISTINCT source_path FROM image_variants').fetchall()}
+    conn.close()
+    generated, missing, original_bytes, variant_bytes = 0, 0, 0, 0
+    for image_path in paths:
+        if image_path in done and not force:
+            continue
+        filepath = os.path.join('static', image_path)
+        if not os.path.exists(filepath):
+            missing += 1
+            continue
+        with Image.open(filepath) as img:
+            img = img.convert('RGB')
+            variants = generate_image_variants(img)
+        record_image_variants(image_path, variants)
+        generated += 1
+        original_bytes += os.path.getsize(filepath)
+        card = [v['bytes'] for v in variants if v['variant'] == 'card'] or [v['bytes'] for v in variants]
+        variant_bytes += min(card)
+    return {'generated': generated, 'missing': missing, 'original_bytes': original_bytes, 'card_bytes': variant_bytes}
+
+
+@app.cli.command('generate-image-variants')
+@click.option('--force', is_flag=True, help='Regenerate derivatives that already exist')
+def generate_image_variants_command(force):
+    """Create responsive derivatives for existing product images."""
+    init_db()
+    result = backfill_image_variants(force=force)
+    print(f"[IMAGES] Generated variants for {result['generated']} image(s), {result['missing']} missing on disk")
+    if result['card_bytes']:
+        print(f"[IMAGES] Originals {result['original_bytes']} bytes -> smallest card variants {result['card_bytes']} bytes")
+
+
+# ==========================
+# Image jobs
+# ==========================
+
+def queue_product_image(file, product_id, kind='product_image', **payload):
+    """Store an upload as-is and queue it for encoding; returns the job id.
+
+    kind 'product_image' sets products.image_path when done (removing
+    payload['replace_path'], if any); 'gallery_image' adds a product_images row
+    with payload['order'] / payload['is_primary'].
+    """
+    if not file or file.filename == '':
+        return None
+    if not allowed_file(file.filename):
+        flash('Invalid file type. Allowed: JPG, PNG, GIF', 'error')
+        return None
+    token = uuid.uuid4().hex[:8]
+    stem = secure_filename(f"product_{product_id}_{int(datetime.now().timestamp())}_{token}")
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    raw_path = f'product_images/raw/{stem}.{ext}'
+    try:
+        file.save(os.path.join('static', raw_path))
+    except Exception as e:
+        flash(f'Error uploading image: {str(e)}', 'error')
+        return None
+    payload.update({'product_id': product_id, 'raw_path': raw_path})
+    job_id = image_jobs.enqueue(kind, payload)
+    if IMAGE_WORKER == 'thread':
+        image_worker.start_background()
+    return job_id
+
+
+def process_product_image(payload):
+    """Encode a raw upload and its derivatives (runs in the worker's process pool).
+    Derivatives are skipped when the same image was stored before.
+    """
+    raw_file = os.path.join('static', payload['raw_path'])
+    img, image_path = encode_product_image(raw_file)
+    variants = None if has_image_variants(image_path) else generate_image_variants(img)
+    return {'image_path': image_path, 'variants': variants}
+
+
+def finish_product_image(job, result):
+    payload = job['payload']
+    for _ in range(3):
+        conn = get_db()
+        # Under the write lock release_image cannot run, so a file checked here
+        # stays until the reference below is committed
+        conn.execute('BEGIN IMMEDIATE')
+        image_path = result['image_path']
+        if os.path.exists(os.path.join('static', image_path)) and (
+                result['variants'] is not None or has_image_variants(image_path, conn)):
+            break
+        conn.rollback()
+        conn.close()
+        # The last row using identical bytes released them while this job was
+        # encoding: encode again, which writes the file and derivatives back
+        result = process_product_image(payload)
+    else:
+        raise RuntimeError(f'{image_path} keeps being released while it is stored')
+    try:
+        if result['variants'] is not None:
+            insert_image_variants(conn, image_path, result['variants'])
+        if job['kind'] == 'gallery_image':
+            updated = conn.execute(
+                'INSERT INTO product_images (product_id, image_path, display_order, is_primary, created_at) '
+                'SELECT id, ?, ?, ?, ? FROM products WHERE id=?',
+                (image_path, payload.get('order', 0), payload.get('is_primary', 0), datetime.now().isoformat(),
+                 payload['product_id'])
+            ).rowcount
+        else:
+            updated = conn.execute('UPDATE products SET image_path=? WHERE id=?',
+                                   (image_path, payload['product_id'])).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if result['variants'] is not None:
+        bump_cache_version('image_variants')
+    if updated:
+        if job['kind'] != 'gallery_image' and payload.get('replace_path') != image_path:
+            release_image(payload.get('replace_path'))
+        bump_cache_version('catalog')
+    else:
+        # Product was deleted while the image was queued
+        release_image(image_path)
+    try:
+        os.remove(os.path.join('static', payload['raw_path']))
+    except OSError:
+        pass
+
+
+image_jobs = JobQueue(lambda: get_db(), table='image_jobs')
+image_worker = JobWorker(
+    image_jobs,
+    {
+        'product_image': (process_product_image, finish_product_image),
+        'gallery_image': (process_product_image, finish_product_image),
+    },
+    processes=IMAGE_WORKER_PROCESSES,
+)
+
+
+@app.cli.command('run-image-worker')
+@click.option('--processes', type=int, default=IMAGE_WORKER_PROCESSES, help='Encoder processes')
+@click.option('--once', is_flag=True, help='Drain the queue once and exit')
+def run_image_worker_command(processes, once):
+    """Encode queued product image uploads."""
+    init_db()
+    image_worker.processes = processes
+    image_worker.batch_size = max(processes, 1)
+    schedule_image_gc()
+    schedule_community_reconcile()
+    if once:
+        handled = 0
+        while True:
+            batch = image_worker.run_once()
+            if not batch:
+                break
+            handled += batch
+        image_worker.shutdown()
+        print(f'[WORKER] Processed {handled} image job(s): {image_worker.stats()}')
+        return
+    print(f'[WORKER] Draining image_jobs with {processes} process(es); Ctrl+C to stop')
+    try:
+        image_worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def migrate_images_to_cas():
+    """Move images stored under legacy names into the content-addressed store,
+    repointing every reference (and derivative rows) to the new path."""
+    conn = get_db()
+    legacy_paths = [r['image_path'] for r in conn.execute(
+        'SELECT image_path FROM products UNION SELECT image_path FROM product_images '
+        'UNION SELECT image_path FROM catalog_images'
+    ).fetchall() if r['image_path'] and not r['image_path'].startswith(IMAGE_CAS_PREFIX)]
+    moved, missing = 0, 0
+    for old_path in legacy_paths:
+        filepath = os.path.join('static', old_path)
+        if not os.path.exists(filepath):
+            missing += 1
+            continue
+        with open(filepath, 'rb') as f:
+            new_path = store_image_bytes(f.read(), old_path.rsplit('.', 1)[-1].lower())
+        for table in ('products', 'product_images', 'catalog_images'):
+            conn.execute(f'UPDATE {table} SET image_path=? WHERE image_path=?', (new_path, old_path))
+        if has_image_variants(new_path):
+            conn.execute('DELETE FROM image_variants WHERE source_path=?', (old_path,))
+        else:
+            conn.execute('UPDATE image_variants SET source_path=? WHERE source_path=?', (new_path, old_path))
+        conn.commit()
+        os.remove(filepath)
+        moved += 1
+    conn.close()
+    if moved:
+        bump_cache_version('catalog', 'catalog_images', 'image_variants')
+    return {'moved': moved, 'missing': missing}
+
+
+@app.cli.command('migrate-images-to-cas')
+def migrate_images_to_cas_command():
+    """Rename legacy product/catalog images to content-addressed paths."""
+    init_db()
+    result = migrate_images_to_cas()
+    print(f"[IMAGES] Moved {result['moved']} image(s) into the content-addressed store, {result['missing']} missing on disk")
+
+
+# ==========================
+# Garbage collection
+# ==========================
+
+# Rows left behind by deletes made before foreign keys were enforced:
+# table -> condition selecting the dangling rows
+DANGLING_ROWS = {
+    'product_images': 'NOT EXISTS (SELECT 1 FROM products p WHERE p.id = product_images.product_id)',
+    'product_regions': 'NOT EXISTS (SELECT 1 FROM products p WHERE p.id = product_regions.product_id) '
+                       'OR NOT EXISTS (SELECT 1 FROM regions r WHERE r.id = product_regions.region_id)',
+    'product_reviews': 'NOT EXISTS (SELECT 1 FROM products p WHERE p.id = product_reviews.product_id)',
+    'review_votes': 'NOT EXISTS (SELECT 1 FROM product_reviews r WHERE r.id = review_votes.review_id)',
+}
+
+SQL_REFERENCED_IMAGE_PATHS = '''
+    SELECT image_path FROM products WHERE image_path IN ({marks})
+    UNION SELECT image_path FROM product_images WHERE image_path IN ({marks})
+    UNION SELECT image_path FROM catalog_images WHERE image_path IN ({marks})
+    UNION SELECT path FROM image_variants WHERE path IN ({marks})'''
+
+# Derivative rows of a source image nothing references any more
+SQL_UNUSED_IMAGE_VARIANTS = '''source_path NOT IN (
+        SELECT image_path FROM products WHERE image_path IS NOT NULL
+        UNION SELECT image_path FROM product_images WHERE image_path IS NOT NULL
+        UNION SELECT image_path FROM catalog_images WHERE image_path IS NOT NULL)
+    AND COALESCE(created_at, '') < ?'''
+
+
+def delete_dangling_rows(conn, table, condition, params=(), batch_size=IMAGE_GC_BATCH_SIZE, dry_run=False) -> int:
+    """Delete rows matching condition in batches of batch_size, committing each."""
+    if dry_run:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {condition}', params).fetchone()[0]
+    deleted = 0
+    while True:
+        cur = conn.execute(
+            f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)',
+            (*params, batch_size)
+        )
+        conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            return deleted
+
+
+def iter_upload_files(folder=UPLOAD_FOLDER):
+    """Yield (image path relative to static/, DirEntry) for every file under folder."""
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_upload_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield os.path.relpath(entry.path, 'static').replace(os.sep, '/'), entry
+
+
+def purge_image_quarantine(max_age_days=IMAGE_QUARANTINE_DAYS) -> int:
+    """Remove quarantine runs older than max_age_days; returns the number removed."""
+    if not os.path.isdir(IMAGE_QUARANTINE_FOLDER):
+        return 0
+    cutoff = datetime.now().timestamp() - max_age_days * 86400
+    purged = 0
+    with os.scandir(IMAGE_QUARANTINE_FOLDER) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                purged += 1
+    return purged
+
+
+def collect_image_garbage(mode='quarantine', min_age=IMAGE_GC_MIN_AGE, batch_size=IMAGE_GC_BATCH_SIZE):
+    """Remove dangling rows, then every file under UPLOAD_FOLDER no row references.
+
+    mode is 'quarantine' (move orphans under IMAGE_QUARANTINE_FOLDER), 'delete'
+    or 'dry-run' (count only). The upload folder is streamed and checked against
+    the database batch_size files at a time, so memory stays flat however many
+    images there are. Raw uploads of queued/processing image jobs are always
+    kept, those of failed jobs for IMAGE_FAILED_RAW_DAYS.
+    """
+    if mode not in ('quarantine', 'delete', 'dry-run'):
+        raise ValueError(f'Unknown garbage collection mode: {mode}')
+    dry_run = mode == 'dry-run'
+    started = datetime.now()
+    cutoff = started.timestamp() - min_age
+    stats = {'mode': mode, 'rows': {}, 'scanned': 0, 'orphans': 0, 'orphan_bytes': 0}
+
+    conn = get_db()
+    for table, condition in DANGLING_ROWS.items():
+        stats['rows'][table] = delete_dangling_rows(conn, table, condition, batch_size=batch_size, dry_run=dry_run)
+    stats['rows']['image_variants'] = delete_dangling_rows(
+        conn, 'image_variants', SQL_UNUSED_IMAGE_VARIANTS, (datetime.fromtimestamp(cutoff).isoformat(),),
+        batch_size=batch_size, dry_run=dry_run)
+    # Order history is kept even for deleted products; only reported
+    stats['order_items_without_product'] = conn.execute(
+        'SELECT COUNT(*) FROM order_items oi WHERE oi.product_id IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM products p WHERE p.id = oi.product_id)'
+    ).fetchone()[0]
+    failed_cutoff = (started - timedelta(days=IMAGE_FAILED_RAW_DAYS)).isoformat()
+    pending_raw = {r[0] for r in conn.execute(
+        "SELECT json_extract(payload, '$.raw_path') FROM image_jobs "
+        "WHERE status IN ('queued', 'processing') OR (status = 'failed' AND finished_at >= ?)",
+        (failed_cutoff,)
+    ).fetchall()}
+    if stats['rows']['image_variants'] and not dry_run:
+        bump_cache_version('image_variants')
+
+    quarantine_dir = os.path.join(IMAGE_QUARANTINE_FOLDER, started.strftime('%Y%m%d-%H%M%S'))
+
+    def sweep(batch):
+        marks = ','.join('?' * len(batch))
+        paths = list(batch)
+        referenced = {r[0] for r in conn.execute(SQL_REFERENCED_IMAGE_PATHS.format(marks=marks), paths * 4).fetchall()}
+        for image_path, entry in batch.items():
+            if image_path in referenced or image_path in pending_raw:
+                continue
+            try:
+                st = os.stat(entry.path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime >= cutoff:
+                # Touched since the scan (an upload reused it)
+                continue
+            stats['orphans'] += 1
+            stats['orphan_bytes'] += st.st_size
+            if mode == 'delete':
+                os.remove(entry.path)
+            elif mode == 'quarantine':
+                target = os.path.join(quarantine_dir, image_path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(entry.path, target)
+
+    batch = {}
+    for image_path, entry in iter_upload_files():
+        stats['scanned'] += 1
+        if entry.stat().st_mtime >= cutoff:
+            continue
+        batch[image_path] = entry
+        if len(batch) >= batch_size:
+            sweep(batch)
+            batch = {}
+    if batch:
+        sweep(batch)
+    conn.close()
+
+    stats['quarantine_purged'] = 0 if dry_run else purge_image_quarantine()
+    stats['seconds'] = round((datetime.now() - started).total_seconds(), 2)
+    return stats
+
+
+def run_image_gc_job(payload):
+    """Image worker handler for a scheduled collection."""
+    return collect_image_garbage(mode=payload.get('mode', 'quarantine'))
+
+
+def schedule_image_gc(job=None, result=None):
+    """Queue the next collection IMAGE_GC_INTERVAL_HOURS from now, unless one is pending."""
+    if IMAGE_GC_INTERVAL_HOURS <= 0:
+        return None
+    if result:
+        print(f"[GC] Removed {result['orphans']} orphaned image(s), {result['orphan_bytes']} bytes; rows {result['rows']}")
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        pending = conn.execute(
+            "SELECT 1 FROM image_jobs WHERE kind='image_gc' AND status IN ('queued', 'processing') AND id != ?",
+            (job['id'] if job else 0,)
+        ).fetchone()
+        job_id = None
+        if not pending:
+            job_id = image_jobs.enqueue('image_gc', {'mode': 'quarantine'}, conn=conn,
+                                        delay=IMAGE_GC_INTERVAL_HOURS * 3600)
+        conn.commit()
+        return job_id
+    finally:
+        conn.close()
+
+
+image_worker.handlers['image_gc'] = (run_image_gc_job, schedule_image_gc)
+
+
+@app.cli.command('collect-garbage')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+@click.option('--delete', is_flag=True, help='Delete orphaned files instead of quarantining them')
+@click.option('--min-age', type=float, default=IMAGE_GC_MIN_AGE, help='Skip files modified in the last N seconds')
+@click.option('--batch-size', type=int, default=IMAGE_GC_BATCH_SIZE, help='Files/rows handled per database round trip')
+def collect_garbage_command(dry_run, delete, min_age, batch_size):
+    """Remove dangling rows and unreferenced product/catalog image files."""
+    init_db()
+    mode = 'dry-run' if dry_run else 'delete' if delete else 'quarantine'
+    stats = collect_image_garbage(mode=mode, min_age=min_age, batch_size=batch_size)
+    action = {'dry-run': 'Would remove', 'delete': 'Deleted', 'quarantine': 'Quarantined'}[mode]
+    print(f"[GC] Scanned {stats['scanned']} file(s) in {stats['seconds']}s; {action} {stats['orphans']} orphan(s), "
+          f"{stats['orphan_bytes'] / 1024:.1f} KB")
+    for table, count in stats['rows'].items():
+        print(f'[GC]   {table}: {count} dangling row(s)')
+    if stats['order_items_without_product']:
+        print(f"[GC]   order_items: {stats['order_items_without_product']} row(s) reference deleted products (kept)")
+    if mode == 'quarantine' and stats['orphans']:
+        print(f'[GC] Quarantine: {IMAGE_QUARANTINE_FOLDER} (purged after {IMAGE_QUARANTINE_DAYS:g} days)')
+
+
 ########################
 # Database utilities
 ########################
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# PRAGMA read-back values are numeric for these settings
+_PRAGMA_ENUMS = {
+    'synchronous': {'off': 0, 'normal': 1, 'full': 2, 'extra': 3},
+    'temp_store': {'default': 0, 'file': 1, 'memory': 2},
+}
+
+
+def apply_db_profile(conn, profile_name=None):
+    """Apply the PRAGMAs of a database profile to a connection."""
+    profile = DB_PROFILES[profile_name or DB_PROFILE]
+    for pragma, value in profile.items():
+        conn.execute(f'PRAGMA {pragma}={value}')
+
+
+def read_db_pragmas(conn):
+    """Read back the current values of every PRAGMA any profile may set."""
+    names = sorted({k for profile in DB_PROFILES.values() for k in profile})
+    return {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in names}
+
+
+def check_db_profile(conn):
+    """Compare the active connection settings with the selected profile.
+    Returns a list of mismatch descriptions (empty when everything applied).
+    """
+    actual = read_db_pragmas(conn)
+    mismatches = []
+    for pragma, expected in DB_PROFILES[DB_PROFILE].items():
+        want = _PRAGMA_ENUMS.get(pragma, {}).get(str(expected).lower(), expected)
+        got = actual.get(pragma)
+        if isinstance(got, str):
+            got, want = got.lower(), str(want).lower()
+        if pragma == 'mmap_size' and got != want:
+            # Builds compiled with a lower SQLITE_MAX_MMAP_SIZE silently cap the value
+            if got and got < want:
+                continue
+        if got != want:
+            mismatches.append(f'{pragma}: expected {expected}, got {got}')
+    return mismatches
+
+
+def _sql_lower(value):
+    """Python str.lower() for SQL; SQLite's LOWER() only folds ASCII."""
+    return (value or '').lower()
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, factory=PooledConnection, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    apply_db_profile(conn)
+    # Off by default in SQLite; needed for the ON DELETE CASCADE clauses
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.create_function('py_lower', 1, _sql_lower, deterministic=True)
     return conn
 
 
+db_pool = ConnectionPool(_connect, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+
+
+def get_db():
+    """Return the connection borrowed for the current app context.
+
+    Inside a request every call shares one pooled connection (conn.close() is a
+    no-op there); it is handed back to the pool in release_db(). Outside an app
+    context a standalone connection is returned and closing it is real.
+    """
+    if not has_app_context():
+        return _connect()
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+
+@app.after_request
+def immutable_image_headers(response):
+    # Content-addressed files never change under the same URL
+    if request.path.startswith(f'{app.static_url_path}/{IMAGE_CAS_PREFIX}') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+
+server_sessions = SqliteSessionInterface(lambda: _connect(), cache_size=SESSION_CACHE_SIZE,
+                                         legacy=SecureCookieSessionInterface())
+if SESSION_BACKEND == 'sqlite':
+    app.session_interface = server_sessions
+
+
+def regenerate_session():
+    """Give the session a new id when the login state changes (session fixation).
+    Signed-cookie sessions have no id to move."""
+    regenerate = getattr(session, 'regenerate', None)
+    if regenerate:
+        regenerate()
+
+
+@app.cli.command('sweep-sessions')
+def sweep_sessions_command():
+    """Delete expired server-side sessions."""
+    init_db()
+    print(f'[SESSION] Deleted {server_sessions.sweep()} expired session(s)')
+
+
 def init_db():
     """Initialize database with schema and run migrations if needed."""
     conn = get_db()
@@ -560,6 +1443,9 @@ def init_db():
         ))
     
     conn.commit()
+    # Verify the database profile actually took effect (e.g. WAL is unavailable on some network filesystems)
+    for mismatch in check_db_profile(conn):
+        print(f"[INIT] DB profile '{DB_PROFILE}' not fully applied: {mismatch}")
     # Seed Karnataka regions if none
     cur = conn.cursor()
     cur.execute('SELECT COUNT(*) as c FROM regions')
@@ -576,6 +1462,7 @@ def init_db():
         ]
         cur.executemany('INSERT INTO regions (name, state) VALUES (?, ?)', karnataka_regions)
         conn.commit()
+        bump_cache_version('regions')
     
     # Track applied migrations (v1 = initial setup with schema)
     cur.execute('SELECT MAX(version) as max_v FROM schema_version')
@@ -637,6 +1524,490 @@ def init_db():
     
     conn.close()
 
+    # v6+: structured migrations (see SCHEMA_MIGRATIONS)
+    result = run_migrations(SCHEMA_MIGRATIONS, db_path=DB_PATH, verbose=False)
+    for version, error in result['failed']:
+        print(f"[INIT] Migration v{version} failed: {error}")
+
+
+# FTS5 index mirroring products (external content), kept in sync by triggers
+SQL_CREATE_PRODUCTS_FTS = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END;
+    INSERT INTO products_fts(products_fts) VALUES ('rebuild');
+'''
+SQL_DROP_PRODUCTS_FTS = '''
+    DROP TRIGGER IF EXISTS products_fts_ai;
+    DROP TRIGGER IF EXISTS products_fts_ad;
+    DROP TRIGGER IF EXISTS products_fts_au;
+    DROP TABLE IF EXISTS products_fts;
+'''
+
+# Last-modified time per product (sitemap <lastmod>); recursive_triggers is off,
+# so the touch UPDATE inside the trigger does not fire it again.
+SQL_CREATE_PRODUCTS_UPDATED_AT = '''
+    ALTER TABLE products ADD COLUMN updated_at TEXT;
+    UPDATE products SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime');
+    CREATE TRIGGER IF NOT EXISTS products_touch_ai AFTER INSERT ON products WHEN new.updated_at IS NULL BEGIN
+        UPDATE products SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_touch_au AFTER UPDATE ON products WHEN new.updated_at IS old.updated_at BEGIN
+        UPDATE products SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+    END;
+'''
+SQL_DROP_PRODUCTS_UPDATED_AT = '''
+    DROP TRIGGER IF EXISTS products_touch_ai;
+    DROP TRIGGER IF EXISTS products_touch_au;
+    ALTER TABLE products DROP COLUMN updated_at;
+'''
+# Only content edits touch updated_at: stock moves on every sale and must not
+# churn <lastmod> (see migration 31)
+PRODUCT_CONTENT_COLUMNS = ('name, description, price, mrp, size, image_path, category, product_status, '
+                           'is_homepage, estimated_delivery_days, estimated_delivery_date')
+SQL_LIMIT_PRODUCTS_TOUCH = f'''
+    DROP TRIGGER IF EXISTS products_touch_au;
+    CREATE TRIGGER products_touch_au AFTER UPDATE OF {PRODUCT_CONTENT_COLUMNS} ON products
+    WHEN new.updated_at IS old.updated_at BEGIN
+        UPDATE products SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+    END;
+'''
+
+
+# SQLite cannot alter a foreign key, so product_regions is rebuilt; rows whose
+# product or region is already gone are dropped on the way.
+SQL_REBUILD_PRODUCT_REGIONS = '''
+    CREATE TABLE product_regions_new (
+        product_id INTEGER NOT NULL,
+        region_id INTEGER NOT NULL,
+        UNIQUE(product_id, region_id),
+        FOREIGN KEY(product_id) REFERENCES products(id){on_delete},
+        FOREIGN KEY(region_id) REFERENCES regions(id){on_delete}
+    );
+    INSERT OR IGNORE INTO product_regions_new (product_id, region_id)
+        SELECT product_id, region_id FROM product_regions
+        WHERE product_id IN (SELECT id FROM products) AND region_id IN (SELECT id FROM regions);
+    DROP TABLE product_regions;
+    ALTER TABLE product_regions_new RENAME TO product_regions;
+'''
+
+# Counts cover approved reviews only, like the storefront
+SQL_REVIEW_STATS_ADD = '''INSERT INTO product_review_stats (product_id, review_count, rating_sum,
+                                          stars_1, stars_2, stars_3, stars_4, stars_5)
+            SELECT {r}.product_id, 1, {r}.rating, {r}.rating = 1, {r}.rating = 2, {r}.rating = 3, {r}.rating = 4, {r}.rating = 5
+            WHERE {r}.is_approved = 1 AND EXISTS (SELECT 1 FROM products WHERE id = {r}.product_id)
+            ON CONFLICT(product_id) DO UPDATE SET
+                review_count = review_count + 1, rating_sum = rating_sum + excluded.rating_sum,
+                stars_1 = stars_1 + excluded.stars_1, stars_2 = stars_2 + excluded.stars_2,
+                stars_3 = stars_3 + excluded.stars_3, stars_4 = stars_4 + excluded.stars_4,
+                stars_5 = stars_5 + excluded.stars_5;'''
+SQL_REVIEW_STATS_REMOVE = '''UPDATE product_review_stats SET
+                review_count = review_count - 1, rating_sum = rating_sum - {r}.rating,
+                stars_1 = stars_1 - ({r}.rating = 1), stars_2 = stars_2 - ({r}.rating = 2),
+                stars_3 = stars_3 - ({r}.rating = 3), stars_4 = stars_4 - ({r}.rating = 4),
+                stars_5 = stars_5 - ({r}.rating = 5)
+            WHERE product_id = {r}.product_id AND {r}.is_approved = 1;'''
+SQL_CREATE_REVIEW_STATS = f'''
+    CREATE TABLE IF NOT EXISTS product_review_stats (
+        product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+        review_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        stars_1 INTEGER NOT NULL DEFAULT 0,
+        stars_2 INTEGER NOT NULL DEFAULT 0,
+        stars_3 INTEGER NOT NULL DEFAULT 0,
+        stars_4 INTEGER NOT NULL DEFAULT 0,
+        stars_5 INTEGER NOT NULL DEFAULT 0,
+        avg_rating REAL GENERATED ALWAYS AS (CAST(rating_sum AS REAL) / NULLIF(review_count, 0)) VIRTUAL
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_product_reviews_stats_insert AFTER INSERT ON product_reviews
+    BEGIN
+        {SQL_REVIEW_STATS_ADD.format(r='NEW')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_reviews_stats_delete AFTER DELETE ON product_reviews
+    BEGIN
+        {SQL_REVIEW_STATS_REMOVE.format(r='OLD')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_reviews_stats_update
+    AFTER UPDATE OF product_id, rating, is_approved ON product_reviews
+    BEGIN
+        {SQL_REVIEW_STATS_REMOVE.format(r='OLD')}
+        {SQL_REVIEW_STATS_ADD.format(r='NEW')}
+    END;
+    INSERT OR IGNORE INTO product_review_stats (product_id, {', '.join(REVIEW_STATS_COLUMNS)})
+    {SQL_REVIEW_STATS_FROM_REVIEWS};
+'''
+
+# product_visibility holds one (region_id, product_id) row for every region a
+# product is listed in: its mapped regions, or every region when it has none
+# (global). Triggers keep it in step with products, regions and product_regions.
+SQL_PRODUCT_VISIBILITY_REFRESH = '''DELETE FROM product_visibility WHERE product_id = {pid};
+        INSERT OR IGNORE INTO product_visibility (region_id, product_id)
+            SELECT r.id, {pid} FROM regions r
+            WHERE EXISTS (SELECT 1 FROM products WHERE id = {pid})
+              AND (NOT EXISTS (SELECT 1 FROM product_regions WHERE product_id = {pid})
+                   OR EXISTS (SELECT 1 FROM product_regions WHERE product_id = {pid} AND region_id = r.id));'''
+SQL_PRODUCT_VISIBILITY_FROM_MAPPINGS = '''SELECT r.id AS region_id, p.id AS product_id FROM products p, regions r
+    WHERE NOT EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id)
+       OR EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id AND pr.region_id = r.id)'''
+SQL_CREATE_PRODUCT_VISIBILITY = f'''
+    CREATE TABLE IF NOT EXISTS product_visibility (
+        region_id INTEGER NOT NULL REFERENCES regions(id) ON DELETE CASCADE,
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        PRIMARY KEY (region_id, product_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_product_visibility_product ON product_visibility(product_id);
+    CREATE TRIGGER IF NOT EXISTS trg_products_visibility_insert AFTER INSERT ON products
+    BEGIN
+        {SQL_PRODUCT_VISIBILITY_REFRESH.format(pid='NEW.id')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_regions_visibility_insert AFTER INSERT ON product_regions
+    BEGIN
+        {SQL_PRODUCT_VISIBILITY_REFRESH.format(pid='NEW.product_id')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_product_regions_visibility_delete AFTER DELETE ON product_regions
+    BEGIN
+        {SQL_PRODUCT_VISIBILITY_REFRESH.format(pid='OLD.product_id')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_regions_visibility_insert AFTER INSERT ON regions
+    BEGIN
+        INSERT OR IGNORE INTO product_visibility (region_id, product_id)
+            SELECT NEW.id, p.id FROM products p
+            WHERE NOT EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id);
+    END;
+    INSERT OR IGNORE INTO product_visibility (region_id, product_id) {SQL_PRODUCT_VISIBILITY_FROM_MAPPINGS};
+'''
+
+# Versioned schema changes applied by init_db() after the built-in v1-v5 steps.
+# Secondary indexes for the hot lookup paths; SQLite appends the rowid to every
+# index, so single-column indexes also serve 'ORDER BY id DESC' without a sort.
+SCHEMA_MIGRATIONS = [
+    Migration(
+        version=6,
+        description='Index products by category for catalog listings',
+        up='CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)',
+        down='DROP INDEX IF EXISTS idx_products_category',
+    ),
+    Migration(
+        version=7,
+        description='Index homepage products by category',
+        up='CREATE INDEX IF NOT EXISTS idx_products_homepage ON products(is_homepage, category)',
+        down='DROP INDEX IF EXISTS idx_products_homepage',
+    ),
+    Migration(
+        version=8,
+        description='Index orders by customer email and date',
+        up='CREATE INDEX IF NOT EXISTS idx_orders_email ON orders(email, created_at)',
+        down='DROP INDEX IF EXISTS idx_orders_email',
+    ),
+    Migration(
+        version=9,
+        description='Index orders by Razorpay order id for payment callbacks',
+        up='CREATE INDEX IF NOT EXISTS idx_orders_razorpay_order_id ON orders(razorpay_order_id)',
+        down='DROP INDEX IF EXISTS idx_orders_razorpay_order_id',
+    ),
+    Migration(
+        version=10,
+        description='Covering index on order_items by order',
+        up='CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id, product_id)',
+        down='DROP INDEX IF EXISTS idx_order_items_order',
+    ),
+    Migration(
+        version=11,
+        description='Covering index on order_items by product',
+        up='CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id, order_id)',
+        down='DROP INDEX IF EXISTS idx_order_items_product',
+    ),
+    Migration(
+        version=12,
+        description='Covering index on approved product reviews by rating',
+        up='CREATE INDEX IF NOT EXISTS idx_product_reviews_product ON product_reviews(product_id, is_approved, rating)',
+        down='DROP INDEX IF EXISTS idx_product_reviews_product',
+    ),
+    Migration(
+        version=13,
+        description='Index community comments by post',
+        up='CREATE INDEX IF NOT EXISTS idx_community_comments_post ON community_comments(post_id, created_at)',
+        down='DROP INDEX IF EXISTS idx_community_comments_post',
+    ),
+    Migration(
+        version=14,
+        description='Index community posts by featured flag and date',
+        up='CREATE INDEX IF NOT EXISTS idx_community_posts_featured ON community_posts(is_featured, created_at)',
+        down='DROP INDEX IF EXISTS idx_community_posts_featured',
+    ),
+    Migration(
+        version=15,
+        description='Full-text search index over product name, description and category',
+        up_func=lambda conn: conn.executescript(SQL_CREATE_PRODUCTS_FTS),
+        down_func=lambda conn: conn.executescript(SQL_DROP_PRODUCTS_FTS),
+    ),
+    Migration(
+        version=16,
+        description='Track product modification time for sitemap lastmod',
+        up_func=lambda conn: conn.executescript(SQL_CREATE_PRODUCTS_UPDATED_AT),
+        down_func=lambda conn: conn.executescript(SQL_DROP_PRODUCTS_UPDATED_AT),
+    ),
+    Migration(
+        version=17,
+        description='Responsive image derivatives per source image',
+        up='''
+            CREATE TABLE IF NOT EXISTS image_variants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_path TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                format TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                bytes INTEGER,
+                created_at TEXT,
+                UNIQUE(source_path, variant, format)
+            )
+        ''',
+        down='DROP TABLE IF EXISTS image_variants',
+    ),
+    Migration(
+        version=18,
+        description='Background job queue for image uploads',
+        up_func=lambda conn: conn.executescript('''
+            CREATE TABLE IF NOT EXISTS image_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                error TEXT,
+                result TEXT,
+                created_at TEXT NOT NULL,
+                available_at REAL NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                duration_ms REAL,
+                worker_pid INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_image_jobs_status ON image_jobs(status, available_at);
+        '''),
+        down='DROP TABLE IF EXISTS image_jobs',
+    ),
+    Migration(
+        version=19,
+        description='Index image references for content-addressed store reference counts',
+        up_func=lambda conn: conn.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_products_image_path ON products(image_path);
+            CREATE INDEX IF NOT EXISTS idx_product_images_image_path ON product_images(image_path);
+            CREATE INDEX IF NOT EXISTS idx_catalog_images_image_path ON catalog_images(image_path);
+            CREATE INDEX IF NOT EXISTS idx_image_variants_path ON image_variants(path);
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_products_image_path;
+            DROP INDEX IF EXISTS idx_product_images_image_path;
+            DROP INDEX IF EXISTS idx_catalog_images_image_path;
+            DROP INDEX IF EXISTS idx_image_variants_path;
+        '''),
+    ),
+    Migration(
+        version=20,
+        description='Cascade product and region deletes to product_regions',
+        up_func=lambda conn: conn.executescript(SQL_REBUILD_PRODUCT_REGIONS.format(on_delete=' ON DELETE CASCADE')),
+        down_func=lambda conn: conn.executescript(SQL_REBUILD_PRODUCT_REGIONS.format(on_delete='')),
+    ),
+    Migration(
+        version=21,
+        description='Index orders for the admin order browser filters',
+        up_func=lambda conn: conn.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_orders_payment_status ON orders(payment_status);
+            CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at);
+            CREATE INDEX IF NOT EXISTS idx_orders_city ON orders(city COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_orders_pincode ON orders(pincode);
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_orders_payment_status;
+            DROP INDEX IF EXISTS idx_orders_created_at;
+            DROP INDEX IF EXISTS idx_orders_city;
+            DROP INDEX IF EXISTS idx_orders_pincode;
+        '''),
+    ),
+    Migration(
+        version=22,
+        description='Track stock reserved by orders',
+        # NULL for orders placed before stock was tracked; 1 while an order holds stock
+        up_func=lambda conn: conn.executescript('''
+            ALTER TABLE orders ADD COLUMN stock_reserved INTEGER;
+            CREATE INDEX IF NOT EXISTS idx_orders_stock_reserved ON orders(created_at) WHERE stock_reserved = 1;
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_orders_stock_reserved;
+            ALTER TABLE orders DROP COLUMN stock_reserved;
+        '''),
+    ),
+    Migration(
+        version=23,
+        description='Track payment gateway order creation for reconciliation',
+        # NULL without a gateway; 'creating' -> 'created', or 'failed' until reconciled
+        up_func=lambda conn: conn.executescript('''
+            ALTER TABLE orders ADD COLUMN gateway_state TEXT;
+            ALTER TABLE orders ADD COLUMN gateway_error TEXT;
+            CREATE INDEX IF NOT EXISTS idx_orders_gateway_pending ON orders(id)
+                WHERE gateway_state IN ('creating', 'failed');
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_orders_gateway_pending;
+            ALTER TABLE orders DROP COLUMN gateway_state;
+            ALTER TABLE orders DROP COLUMN gateway_error;
+        '''),
+    ),
+    Migration(
+        version=24,
+        description='Inbox for Razorpay webhook events',
+        # image_jobs layout (see job_queue.py) plus the Razorpay event id
+        up_func=lambda conn: conn.executescript('''
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 8,
+                error TEXT,
+                result TEXT,
+                created_at TEXT NOT NULL,
+                available_at REAL NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                duration_ms REAL,
+                worker_pid INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_webhook_events_status ON webhook_events(status, available_at);
+            CREATE INDEX IF NOT EXISTS idx_webhook_events_created_at ON webhook_events(created_at);
+        '''),
+        down='DROP TABLE IF EXISTS webhook_events',
+    ),
+    Migration(
+        version=25,
+        description='Outbox of newsletter subscribers to sync to Brevo',
+        # One row per subscriber: pending -> sending -> sent, or failed after NEWSLETTER_MAX_ATTEMPTS
+        up_func=lambda conn: conn.executescript('''
+            CREATE TABLE IF NOT EXISTS newsletter_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subscriber_id INTEGER NOT NULL UNIQUE REFERENCES newsletter_subscribers(id) ON DELETE CASCADE,
+                email TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                error TEXT,
+                brevo_process_id INTEGER,
+                created_at TEXT NOT NULL,
+                sent_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_newsletter_outbox_pending ON newsletter_outbox(available_at)
+                WHERE status = 'pending';
+        '''),
+        down='DROP TABLE IF EXISTS newsletter_outbox',
+    ),
+    Migration(
+        version=26,
+        description='Materialized review aggregates per product, maintained by triggers',
+        up_func=lambda conn: conn.executescript(SQL_CREATE_REVIEW_STATS),
+        down_func=lambda conn: conn.executescript('''
+            DROP TRIGGER IF EXISTS trg_product_reviews_stats_insert;
+            DROP TRIGGER IF EXISTS trg_product_reviews_stats_delete;
+            DROP TRIGGER IF EXISTS trg_product_reviews_stats_update;
+            DROP TABLE IF EXISTS product_review_stats;
+        '''),
+    ),
+    Migration(
+        version=27,
+        description='Normalized, indexed category key on products',
+        # Virtual generated column: always in step with category, no backfill or triggers
+        up_func=lambda conn: conn.executescript('''
+            ALTER TABLE products ADD COLUMN category_key TEXT GENERATED ALWAYS AS (lower(trim(category))) VIRTUAL;
+            CREATE INDEX IF NOT EXISTS idx_products_category_key ON products(category_key, id);
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_products_category_key;
+            ALTER TABLE products DROP COLUMN category_key;
+        '''),
+    ),
+    Migration(
+        version=28,
+        description='Materialized product visibility per region',
+        # "All Regions" used to be saved as a mapping to every region; such
+        # products are stored as global (no mappings) so new regions list them too
+        up_func=lambda conn: conn.executescript('''
+            DELETE FROM product_regions WHERE product_id IN (
+                SELECT product_id FROM product_regions GROUP BY product_id
+                HAVING COUNT(*) >= (SELECT COUNT(*) FROM regions)
+            );
+        ''' + SQL_CREATE_PRODUCT_VISIBILITY),
+        down_func=lambda conn: conn.executescript('''
+            DROP TRIGGER IF EXISTS trg_products_visibility_insert;
+            DROP TRIGGER IF EXISTS trg_product_regions_visibility_insert;
+            DROP TRIGGER IF EXISTS trg_product_regions_visibility_delete;
+            DROP TRIGGER IF EXISTS trg_regions_visibility_insert;
+            DROP TABLE IF EXISTS product_visibility;
+        '''),
+    ),
+    Migration(
+        version=29,
+        description='Server-side session store',
+        up_func=lambda conn: conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                rev INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+        '''),
+        down='DROP TABLE IF EXISTS sessions',
+    ),
+    Migration(
+        version=30,
+        description='Claim time of newsletter outbox rows being sent',
+        # Rows left in 'sending' by a sender that died are reclaimed after
+        # NEWSLETTER_CLAIM_TIMEOUT; rows already stuck are due at once
+        up_func=lambda conn: conn.executescript('''
+            ALTER TABLE newsletter_outbox ADD COLUMN claimed_at REAL;
+            UPDATE newsletter_outbox SET claimed_at = 0 WHERE status = 'sending';
+            CREATE INDEX IF NOT EXISTS idx_newsletter_outbox_sending ON newsletter_outbox(claimed_at)
+                WHERE status = 'sending';
+        '''),
+        down_func=lambda conn: conn.executescript('''
+            DROP INDEX IF EXISTS idx_newsletter_outbox_sending;
+            ALTER TABLE newsletter_outbox DROP COLUMN claimed_at;
+        '''),
+    ),
+    Migration(
+        version=31,
+        description='Touch products.updated_at on content edits only, not stock changes',
+        up_func=lambda conn: conn.executescript(SQL_LIMIT_PRODUCTS_TOUCH),
+        down_func=lambda conn: conn.executescript('''
+            DROP TRIGGER IF EXISTS products_touch_au;
+            CREATE TRIGGER products_touch_au AFTER UPDATE ON products WHEN new.updated_at IS old.updated_at BEGIN
+                UPDATE products SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = new.id;
+            END;
+        '''),
+    ),
+]
+
 
 # Initialize database on first request
 _db_initialized = False
@@ -647,51 +2018,59 @@ def setup():
     if not _db_initialized:
         init_db()
         _db_initialized = True
+        if IMAGE_WORKER == 'thread':
+            image_worker.start_background()
+        if WEBHOOK_WORKER == 'thread':
+            webhook_worker.start_background()
+        if NEWSLETTER_SYNC == 'thread':
+            start_newsletter_sender()
+        schedule_image_gc()
+        schedule_community_reconcile()
 
 ########################
 # Template context
 ########################
 
+def _load_regions():
+    conn = get_db()
+    regions = conn.execute(SQL_SELECT_REGION_ID_NAME_ORDERED).fetchall()
+    conn.close()
+    return regions, {r['id']: r['name'] for r in regions}
+
+
+def _load_catalog_images():
+    conn = get_db()
+    images = conn.execute('SELECT region, position, image_path, alt_text FROM catalog_images ORDER BY region, position').fetchall()
+    conn.close()
+    catalog_images = {}
+    for img in images:
+        catalog_images.setdefault(img['region'], []).append({
+            'position': img['position'],
+            'path': img['image_path'],
+            'alt': img['alt_text']
+        })
+    return catalog_images
+
+
 @app.context_processor
 def inject_site_meta():
-    # Fetch regions for header selector; safe if DB not initialized yet
-    regions = []
+    # Regions for header selector and catalog carousel images come from the
+    # site cache; they are reloaded only after an admin bumps their version.
+    # Safe if DB not initialized yet.
+    regions, region_names = [], {}
     try:
-        conn = get_db()
-        regions = conn.execute(SQL_SELECT_REGION_ID_NAME_ORDERED).fetchall()
-        conn.close()
+        regions, region_names = site_cache.get('regions', ('regions',), _load_regions)
     except Exception:
         pass
     # Current selected region
     current_region_id = session.get('region_id')
-    current_region_name = None
-    try:
-        if current_region_id:
-            conn = get_db()
-            r = conn.execute('SELECT name FROM regions WHERE id=?', (current_region_id,)).fetchone()
-            conn.close()
-            if r:
-                current_region_name = r['name']
-    except Exception:
-        pass
+    current_region_name = region_names.get(current_region_id) if current_region_id else None
     # Current selected product status
     current_product_status = session.get('product_status')
     
-    # Fetch catalog images
     catalog_images = {}
     try:
-        conn = get_db()
-        images = conn.execute('SELECT region, position, image_path, alt_text FROM catalog_images ORDER BY region, position').fetchall()
-        conn.close()
-        for img in images:
-            region = img['region']
-            if region not in catalog_images:
-                catalog_images[region] = []
-            catalog_images[region].append({
-                'position': img['position'],
-                'path': img['image_path'],
-                'alt': img['alt_text']
-            })
+        catalog_images = site_cache.get('catalog_images', ('catalog_images',), _load_catalog_images)
     except Exception:
         pass
     
@@ -711,30 +2090,315 @@ def inject_site_meta():
     }
 
 ########################
-# Helper functions
+# Page cache
+########################
+
+# Everything a cached page depends on besides the request itself: products and
+# reviews ('catalog'), image derivatives, and the header/carousel data from
+# inject_site_meta.
+PAGE_CACHE_STAMPS = ('catalog', 'regions', 'catalog_images', 'image_variants')
+
+
+def anonymous_page_key():
+    """Key identifying the current page for an anonymous visitor, or None.
+
+    Logged-in pages show the account menu and cart, and pending flash messages
+    must be rendered (and consumed) fresh, so those requests get None.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if session.get('admin_logged_in') or session.get('user_logged_in') or '_flashes' in session:
+        return None
+    return (request.full_path, session.get('region_id'), session.get('product_status'))
+
+
+def page_cache_key():
+    """Cache key for the current request, or None when it must not be cached."""
+    if request.method != 'GET' or not page_cache.enabled:
+        return None
+    return anonymous_page_key()
+
+
+def cached_page(view):
+    """Serve a view's rendered HTML from page_cache for anonymous visitors.
+
+    Only plain 200 HTML (a str from render_template) is stored; redirects and
+    responses from views that touched the session are always left uncached.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = page_cache_key()
+        if key is None:
+            return view(*args, **kwargs)
+        version = page_cache.version(PAGE_CACHE_STAMPS)
+        html = page_cache.get(key, version)
+        if html is not None:
+            return html
+        rv = view(*args, **kwargs)
+        if isinstance(rv, str) and not session.modified:
+            page_cache.put(key, version, rv)
+        return rv
+    return wrapper
+
+########################
+# Conditional GET
+########################
+
+# Cache-Control per route class. Catalog HTML depends on the session (region and
+# status filters), so only the browser may keep it and must revalidate each time;
+# crawler documents are the same for everyone and may be shared for a while.
+CACHE_CONTROL_POLICIES = {
+    'page': 'private, no-cache',
+    'crawler': 'public, max-age=3600',
+}
+
+
+def stamps_last_modified(stamp_names):
+    """Time of the latest bump of stamp_names, or None if any was never bumped."""
+    times = [cache_stamps.modified_at(name) for name in stamp_names]
+    if not times or None in times:
+        return None
+    return datetime.fromtimestamp(int(max(times)), tz=timezone.utc)
+
+
+def conditional_get(policy, stamp_names=PAGE_CACHE_STAMPS, per_session=True):
+    """Answer If-None-Match / If-Modified-Since with 304 before running the view.
+
+    The strong ETag hashes the page key with the version of stamp_names, and
+    Last-Modified is the latest bump of those stamps, so a revalidation costs a
+    few stat() calls and no query or render. With stamp_names=None the ETag is
+    a hash of the rendered body instead (only bandwidth is saved).
+    Personalized requests (see anonymous_page_key) get no validators.
+    """
+    cache_control = CACHE_CONTROL_POLICIES[policy]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = anonymous_page_key() if per_session else request.full_path
+            if key is None or stamp_names is None:
+                response = make_response(view(*args, **kwargs))
+                response.headers['Cache-Control'] = cache_control
+                if key is not None and response.status_code == 200:
+                    response.add_etag()
+                    response.make_conditional(request)
+                return response
+            version = site_cache.version(stamp_names)
+            etag = hashlib.sha1(repr((request.host, key, version)).encode()).hexdigest()[:32]
+            last_modified = stamps_last_modified(stamp_names)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or session.modified:
+                    response.headers['Cache-Control'] = cache_control
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+########################
+# Helper functions
+########################
+
+def calculate_estimated_date(product_row):
+    exp_date = product_row['estimated_delivery_date']
+    if exp_date:
+        try:
+            datetime.strptime(exp_date, '%Y-%m-%d')
+            return exp_date
+        except Exception:
+            return exp_date
+    days = product_row['estimated_delivery_days']
+    if days:
+        return (datetime.now() + timedelta(days=int(days))).strftime('%Y-%m-%d')
+    return (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+
+
+def cart_total(cart_items):
+    return sum(item['price'] * item['quantity'] for item in cart_items)
+
+########################
+# Product listings
+########################
+
+PRODUCTS_PER_PAGE = 12
+
+# ORDER BY for each sort option; ties keep newest-first like the default listing
+LISTING_SORTS = {
+    'new': 'p.id DESC',
+    'price_low': 'COALESCE(p.price, 0) ASC, p.id DESC',
+    'price_high': 'COALESCE(p.price, 0) DESC, p.id DESC',
+    'name_az': "py_lower(p.name) ASC, p.id DESC",
+    # Primary-key lookups into product_review_stats; unrated products last
+    'rating': '(SELECT s.avg_rating FROM product_review_stats s WHERE s.product_id = p.id) DESC NULLS LAST, '
+              '(SELECT s.review_count FROM product_review_stats s WHERE s.product_id = p.id) DESC, p.id DESC',
+}
+
+# Listed in the region (mapped there, or global): one range of the
+# product_visibility primary key instead of two subqueries per product
+SQL_PRODUCT_IN_REGION = 'p.id IN (SELECT pv.product_id FROM product_visibility pv WHERE pv.region_id = ?)'
+
+
+def catalog_filters(region_id=None, product_status=None, category='Products'):
+    """Build WHERE conditions and params for the storefront catalog filters.
+    region_id/product_status take the session values ('all' or empty means no filter).
+    """
+    where = ['p.category = ?']
+    params = [category]
+    if region_id and region_id != 'all':
+        # Available in the region, or globally available (no mappings)
+        where.append(SQL_PRODUCT_IN_REGION)
+        params.append(region_id)
+    if product_status and product_status != 'all':
+        where.append('p.product_status = ?')
+        params.append(product_status)
+    return where, params
+
+
+def fetch_product_listing(where, params, sort='new', page=1, clamp_page=True, per_page=PRODUCTS_PER_PAGE,
+                          from_sql='products p', columns='', order_by=None):
+    """Count, sort and paginate a product listing in SQLite.
+
+    where/params: conditions on products aliased as p (joined with AND).
+    from_sql/columns: FROM clause (products must be aliased p) and extra select
+    columns, e.g. to drive the listing from the full-text index.
+    order_by: explicit ORDER BY overriding the sort option (e.g. search relevance).
+    Returns dict with products (current page), total_products, total_pages,
+    page (clamped to the last page when clamp_page) and new_product_ids
+    (the first 4 products of the whole sorted listing).
+    """
+    where_sql = ' AND '.join(where) if where else '1'
+    order_sql = order_by or LISTING_SORTS.get(sort, LISTING_SORTS['new'])
+    select_sql = f'p.*, {columns}' if columns else 'p.*'
+    conn = get_db()
+    total = conn.execute(f'SELECT COUNT(*) AS c FROM {from_sql} WHERE {where_sql}', params).fetchone()['c']
+    total_pages = (total + per_page - 1) // per_page
+    if clamp_page and page > total_pages and total_pages > 0:
+        page = total_pages
+    products = conn.execute(
+        f'SELECT {select_sql} FROM {from_sql} WHERE {where_sql} ORDER BY {order_sql} LIMIT ? OFFSET ?',
+        [*params, per_page, (page - 1) * per_page]
+    ).fetchall()
+    if page == 1:
+        new_product_ids = {p['id'] for p in products[:4]}
+    else:
+        new_product_ids = {r['id'] for r in conn.execute(
+            f'SELECT p.id FROM {from_sql} WHERE {where_sql} ORDER BY {order_sql} LIMIT 4', params
+        ).fetchall()}
+    conn.close()
+    return {
+        'products': products,
+        'total_products': total,
+        'total_pages': total_pages,
+        'page': page,
+        'new_product_ids': new_product_ids,
+    }
+
+
+########################
+# Product search
 ########################
 
-def calculate_estimated_date(product_row):
-    exp_date = product_row['estimated_delivery_date']
-    if exp_date:
-        try:
-            datetime.strptime(exp_date, '%Y-%m-%d')
-            return exp_date
-        except Exception:
-            return exp_date
-    days = product_row['estimated_delivery_days']
-    if days:
-        return (datetime.now() + timedelta(days=int(days))).strftime('%Y-%m-%d')
-    return (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+# BM25 column weights: name matches count most, then description, then category
+SQL_SEARCH_RELEVANCE = 'bm25(products_fts, 10.0, 2.0, 1.0), p.id DESC'
+SQL_SEARCH_SNIPPET = "snippet(products_fts, 1, char(2), char(3), '…', 16) AS search_snippet"
+_search_fts_enabled = None
 
 
-def cart_total(cart_items):
-    return sum(item['price'] * item['quantity'] for item in cart_items)
+def search_fts_enabled() -> bool:
+    """True when the products_fts index exists (SQLite built with FTS5)."""
+    global _search_fts_enabled
+    if _search_fts_enabled is None:
+        conn = get_db()
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='products_fts'").fetchone()
+        conn.close()
+        _search_fts_enabled = row is not None
+    return _search_fts_enabled
+
+
+def fts_match_query(q: str):
+    """Turn user input into an FTS5 query: every word must match as a prefix.
+    Returns None when the input has no searchable words.
+    """
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return None
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+# FTS must be the outer loop: with products outer, SQLite re-runs the MATCH per row
+SQL_SEARCH_FROM = 'products_fts CROSS JOIN products p ON p.id = products_fts.rowid'
+
+
+def search_filters(q: str, where: list, params: list, ranked=True):
+    """Add the text-search condition for q to where/params.
+
+    Uses the FTS5 index when available and falls back to LIKE otherwise.
+    Returns the FROM clause to list from: SQL_SEARCH_FROM when ranked FTS
+    results (bm25, snippets) are possible, otherwise None. With ranked=False
+    the FTS match is a rowid subquery so the caller's own FROM still works.
+    """
+    match = fts_match_query(q) if search_fts_enabled() else None
+    if match is None:
+        like = f'%{q}%'
+        where.append('(p.name LIKE ? OR p.description LIKE ?)')
+        params.extend([like, like])
+        return None
+    if ranked:
+        where.append('products_fts MATCH ?')
+        params.append(match)
+        return SQL_SEARCH_FROM
+    where.append('p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)')
+    params.append(match)
+    return None
+
+
+def highlight_snippet(snippet):
+    """Escape an FTS snippet and turn its match markers into <mark> tags."""
+    if not snippet:
+        return None
+    return Markup(str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+
+def rebuild_search_index():
+    """Rebuild products_fts from the products table and merge its segments."""
+    conn = get_db()
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) AS c FROM products').fetchone()['c']
+    conn.close()
+    return count
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text product search index."""
+    init_db()
+    if not search_fts_enabled():
+        print('products_fts is not available (SQLite without FTS5?)')
+        return
+    print(f'Rebuilt search index for {rebuild_search_index()} products')
+
 
 def set_product_regions(product_id: int, region_ids: list):
-    """Replace product's region mappings with provided list of region ids."""
+    """Replace product's region mappings with provided list of region ids.
+
+    'all', or a selection covering every region (the form's "All Regions"
+    toggle ticks each box), stores no mappings, so the product also shows in
+    regions added later.
+    """
     try:
         conn = get_db()
+        selected = {str(r) for r in (region_ids or [])}
+        all_regions = {str(row['id']) for row in conn.execute('SELECT id FROM regions').fetchall()}
+        if 'all' in selected or (all_regions and all_regions <= selected):
+            region_ids = []
         # Remove existing
         conn.execute(SQL_DELETE_PRODUCT_REGIONS, (product_id,))
         # Add new
@@ -747,13 +2411,94 @@ def set_product_regions(product_id: int, region_ids: list):
     except Exception:
         pass
 
+
+def verify_product_visibility() -> dict:
+    """Compare product_visibility with the mappings; returns missing and extra row counts."""
+    conn = get_db()
+    missing = conn.execute(
+        f'SELECT COUNT(*) FROM ({SQL_PRODUCT_VISIBILITY_FROM_MAPPINGS} EXCEPT SELECT region_id, product_id FROM product_visibility)'
+    ).fetchone()[0]
+    extra = conn.execute(
+        f'SELECT COUNT(*) FROM (SELECT region_id, product_id FROM product_visibility EXCEPT {SQL_PRODUCT_VISIBILITY_FROM_MAPPINGS})'
+    ).fetchone()[0]
+    conn.close()
+    return {'missing': missing, 'extra': extra}
+
+
+@app.cli.command('product-visibility')
+@click.option('--rebuild', is_flag=True, help='Recompute the table from product_regions')
+def product_visibility_command(rebuild):
+    """Verify (or rebuild) the materialized region visibility of products."""
+    init_db()
+    if rebuild:
+        conn = get_db()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM product_visibility')
+        conn.execute(f'INSERT INTO product_visibility (region_id, product_id) {SQL_PRODUCT_VISIBILITY_FROM_MAPPINGS}')
+        conn.commit(); conn.close()
+        bump_cache_version('catalog')
+        print('[REGIONS] Rebuilt product_visibility')
+    result = verify_product_visibility()
+    if result['missing'] or result['extra']:
+        print(f"[REGIONS] product_visibility out of step: {result['missing']} missing, {result['extra']} extra row(s)")
+    else:
+        print('[REGIONS] product_visibility is consistent')
+
+# Category strip on the homepage: (category, label), in display order
+HOMEPAGE_CATEGORIES = [
+    ('Products', '🌾 Organic Products'),
+    ('gutcare', '🌿 Gut Care'),
+    ('seasonal', '🌱 Seasonal Products'),
+    ('gutfeast', '🍽️ Gut Feast'),
+    ('corporate', '🏢 Corporate'),
+    ('gifts', '🎁 Gifts'),
+]
+HOMEPAGE_CATEGORY_LIMIT = 8
+HOMEPAGE_CAROUSELS = ('gutcare', 'gutfeast')
+HOMEPAGE_CAROUSEL_LIMIT = 12
+
+
+def _load_homepage_sections():
+    # The strip matches category exactly, the carousels match the normalised
+    # category_key the same way the category pages do
+    arms = [('category', category, HOMEPAGE_CATEGORY_LIMIT) for category, _ in HOMEPAGE_CATEGORIES]
+    arms += [('category_key', key, HOMEPAGE_CAROUSEL_LIMIT) for key in HOMEPAGE_CAROUSELS]
+    conn = get_db()
+    # Newest products of every section in one statement. Each arm reads at most
+    # limit entries from idx_products_category / idx_products_category_key; a
+    # ROW_NUMBER() window would number every product of the category first.
+    rows = conn.execute(
+        ' UNION ALL '.join(f"SELECT * FROM (SELECT ? AS section, ? AS section_key, id, name, price, image_path "
+                           f"FROM products WHERE {column} = ? ORDER BY id DESC LIMIT ?)" for column, _, _ in arms),
+        [param for column, value, limit in arms for param in (column, value, value, limit)]
+    ).fetchall()
+    has_homepage = conn.execute(
+        'SELECT 1 FROM products WHERE is_homepage = 1 AND category = ? LIMIT 1', ('Products',)
+    ).fetchone() is not None
+    conn.close()
+    sections = {arm[:2]: [] for arm in arms}
+    for row in rows:
+        sections[row['section'], row['section_key']].append(row)
+    return {
+        'categories': {category: {'label': label, 'products': sections['category', category]}
+                       for category, label in HOMEPAGE_CATEGORIES if sections['category', category]},
+        'carousels': {key: sections['category_key', key] for key in HOMEPAGE_CAROUSELS},
+        'has_homepage': has_homepage,
+    }
+
+
+def homepage_sections():
+    """Category strip, carousels and the homepage-products flag, rebuilt when the catalog changes."""
+    return site_cache.get('homepage_sections', ('catalog',), _load_homepage_sections)
+
 ########################
 # Public routes
 ########################
 
 @app.route('/')
+@conditional_get('page')
+@cached_page
 def index():
-    conn = get_db()
     region_id = session.get('region_id')
     product_status = session.get('product_status')
     is_homepage = False
@@ -763,103 +2508,29 @@ def index():
     if page < 1:
         page = 1
     
-    PRODUCTS_PER_PAGE = 12
-    
+    sections = homepage_sections()
+    # Special categories (gutcare, gifts, ...) are excluded from the main listing
+    where, params = catalog_filters(region_id, product_status)
     if region_id == 'all':
-        # "All Regions" selected: show all products EXCEPT special categories
-        all_products = conn.execute('SELECT * FROM products WHERE category = "Products" ORDER BY id DESC').fetchall()
         page_title = 'All Products'
-    elif region_id:
-        # Show products available in selected region OR globally available (no mappings) - EXCEPT special categories
-        all_products = conn.execute('''
-            SELECT p.* FROM products p
-            WHERE p.category = "Products"
-              AND (NOT EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id)
-               OR EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id AND pr.region_id = ?))
-            ORDER BY p.id DESC
-        ''', (region_id,)).fetchall()
-    else:
-        # No region selected: show homepage products if sorting is 'new', otherwise show all Products
-        if sort == 'new':
-            homepage_products = conn.execute('SELECT p.* FROM products p WHERE p.is_homepage = 1 AND p.category = "Products" ORDER BY p.id DESC').fetchall()
-            if homepage_products:
-                all_products = homepage_products
-                is_homepage = True
-                page_title = 'New Products'
-            else:
-                # Fallback: show Products category items only
-                all_products = conn.execute('SELECT * FROM products WHERE category = "Products" ORDER BY id DESC').fetchall()
-        else:
-            # When sorting by price or name, show ALL products
-            all_products = conn.execute('SELECT * FROM products WHERE category = "Products" ORDER BY id DESC').fetchall()
-            page_title = 'Products'
-    
-    # Filter by product status if selected (but not if 'all' is selected)
-    if product_status and product_status != 'all':
-        all_products = [p for p in all_products if p['product_status'] == product_status]
-    # Sorting like marketplace UX
-    if sort == 'price_low':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0))
-    elif sort == 'price_high':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0), reverse=True)
-    elif sort == 'name_az':
-        all_products = sorted(all_products, key=lambda p: (p['name'] or '').lower())
-    # else 'new' keeps default ordering
-
-    conn.close()
-    
-    # Pagination logic
-    total_products = len(all_products)
-    total_pages = (total_products + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
-    
-    if page > total_pages and total_pages > 0:
-        page = total_pages
+    elif not region_id and sort == 'new':
+        # No region selected: show homepage products when there are any, otherwise all Products
+        if sections['has_homepage']:
+            where.append('p.is_homepage = 1')
+            is_homepage = True
+            page_title = 'New Products'
     
-    start_idx = (page - 1) * PRODUCTS_PER_PAGE
-    end_idx = start_idx + PRODUCTS_PER_PAGE
-    products = all_products[start_idx:end_idx]
+    listing = fetch_product_listing(where, params, sort=sort, page=page)
+    page = listing['page']
+    products = listing['products']
+    total_products = listing['total_products']
+    total_pages = listing['total_pages']
+    new_product_ids = listing['new_product_ids']
     # Bulk review stats for visible products (for star display on cards)
     review_stats_map = compute_review_stats_bulk([p['id'] for p in products])
     
-    # Mark first 4 products as "new"
-    new_product_ids = {p['id'] for p in all_products[:4]}
-    
-    # Get all products grouped by category for quick reference section
-    conn = get_db()
-    all_categories_products = {}
-    categories_info = [
-        ('Products', '🌾 Organic Products'),
-        ('gutcare', '🌿 Gut Care'),
-            ('seasonal', '🌱 Seasonal Products'),
-        ('gutfeast', '🍽️ Gut Feast'),
-        ('corporate', '🏢 Corporate'),
-        ('gifts', '🎁 Gifts')
-    ]
-    for category_key, category_label in categories_info:
-        products_in_cat = conn.execute(
-            'SELECT id, name, price, image_path FROM products WHERE category = ? ORDER BY id DESC LIMIT 8',
-            (category_key,)
-        ).fetchall()
-        if products_in_cat:
-            all_categories_products[category_key] = {
-                'label': category_label,
-                'products': products_in_cat
-            }
-    
-    # Fetch Gut Care products for carousel (only when viewing newest products on homepage)
-    gutcare_carousel_products = []
-    gutfeast_carousel_products = []
-    if is_homepage and sort == 'new':
-        gutcare_carousel_products = conn.execute(
-            'SELECT id, name, price, image_path FROM products WHERE LOWER(category) = ? ORDER BY id DESC LIMIT 12',
-            ('gutcare',)
-        ).fetchall()
-        gutfeast_carousel_products = conn.execute(
-            'SELECT id, name, price, image_path FROM products WHERE LOWER(category) = ? ORDER BY id DESC LIMIT 12',
-            ('gutfeast',)
-        ).fetchall()
-    
-    conn.close()
+    # Carousels only when viewing newest products on homepage
+    show_carousels = is_homepage and sort == 'new'
     
     return render_template('index.html', 
                          products=products, 
@@ -871,14 +2542,15 @@ def index():
                          total_products=total_products,
                          review_stats_map=review_stats_map,
                          sort=sort,
-                         all_categories_products=all_categories_products,
-                         gutcare_carousel_products=gutcare_carousel_products,
-                         gutfeast_carousel_products=gutfeast_carousel_products)
+                         all_categories_products=sections['categories'],
+                         gutcare_carousel_products=sections['carousels']['gutcare'] if show_carousels else [],
+                         gutfeast_carousel_products=sections['carousels']['gutfeast'] if show_carousels else [])
 
 @app.route('/category/<category>')
+@conditional_get('page')
+@cached_page
 def category_view(category):
     """View products by category: gutcare, corporate, gifts"""
-    conn = get_db()
     category_lower = category.lower()
     
     # Validate category
@@ -891,33 +2563,11 @@ def category_view(category):
     if page < 1:
         page = 1
     
-    PRODUCTS_PER_PAGE = 12
-    
-    # Get products for this category
-    all_products = conn.execute(
-        'SELECT * FROM products WHERE LOWER(category) = ? ORDER BY id DESC',
-        (category_lower,)
-    ).fetchall()
-    
-    # Apply sorting
-    if sort == 'price_low':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0))
-    elif sort == 'price_high':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0), reverse=True)
-    elif sort == 'name_az':
-        all_products = sorted(all_products, key=lambda p: (p['name'] or '').lower())
-    
-    conn.close()
-    
-    # Pagination
-    total_products = len(all_products)
-    total_pages = (total_products + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
-    start_idx = (page - 1) * PRODUCTS_PER_PAGE
-    end_idx = start_idx + PRODUCTS_PER_PAGE
-    products = all_products[start_idx:end_idx]
-    
-    # Mark first 4 as "new"
-    new_product_ids = {p['id'] for p in all_products[:4]}
+    listing = fetch_product_listing(['p.category_key = ?'], [category_lower], sort=sort, page=page, clamp_page=False)
+    products = listing['products']
+    total_products = listing['total_products']
+    total_pages = listing['total_pages']
+    new_product_ids = listing['new_product_ids']
     
     # Category display names
     category_titles = {
@@ -947,6 +2597,127 @@ def customer_shipping():
 def customer_returns():
     return render_template('customer_returns.html')
 
+# ==========================
+# COMMUNITY COUNTERS
+# ==========================
+
+# likes_count/comments_count are adjusted by +-1 in the same short write
+# transaction as the like/comment row, so a click never recounts a post.
+# reconcile_community_counters() recounts in id ranges and only rewrites
+# rows that drifted (e.g. after manual deletes or a restore).
+COMMUNITY_LIKE_TARGETS = {
+    'post': ('post_id', 'community_posts'),
+    'comment': ('comment_id', 'community_comments'),
+}
+COMMUNITY_COUNTERS = [
+    ('community_posts', 'likes_count', 'SELECT COUNT(*) FROM community_likes l WHERE l.post_id = t.id'),
+    ('community_posts', 'comments_count', 'SELECT COUNT(*) FROM community_comments c WHERE c.post_id = t.id'),
+    ('community_comments', 'likes_count', 'SELECT COUNT(*) FROM community_likes l WHERE l.comment_id = t.id'),
+]
+COMMUNITY_RECONCILE_BATCH = 1000
+
+
+def toggle_community_like(target, target_id, user_id):
+    """Like or unlike a post/comment ('post' or 'comment') for user_id.
+
+    Returns (liked, likes_count), or None when the post/comment does not exist.
+    """
+    column, table = COMMUNITY_LIKE_TARGETS[target]
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        removed = conn.execute(
+            f'DELETE FROM community_likes WHERE {column} = ? AND user_id = ? RETURNING id',
+            (target_id, user_id)
+        ).fetchall()
+        delta = -1 if removed else 0
+        if not removed:
+            added = conn.execute(f'''
+                INSERT INTO community_likes ({column}, user_id, created_at)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM {table} WHERE id = ?)
+                ON CONFLICT({column}, user_id) DO NOTHING
+                RETURNING id
+            ''', (target_id, user_id, datetime.now().isoformat(), target_id)).fetchall()
+            delta = 1 if added else 0
+        row = conn.execute(
+            f'UPDATE {table} SET likes_count = MAX(COALESCE(likes_count, 0) + ?, 0) WHERE id = ? RETURNING likes_count',
+            (delta, target_id)
+        ).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return not removed, row['likes_count']
+
+
+def reconcile_community_counters(batch_size=COMMUNITY_RECONCILE_BATCH) -> dict:
+    """Recount the community counters batch_size ids per transaction; returns
+    the number of corrected rows per 'table.column'."""
+    fixed = {}
+    conn = get_db()
+    try:
+        for table, column, count_sql in COMMUNITY_COUNTERS:
+            fixed[f'{table}.{column}'] = 0
+            max_id = conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+            for low in range(0, max_id, batch_size):
+                conn.execute('BEGIN IMMEDIATE')
+                cur = conn.execute(
+                    f'UPDATE {table} AS t SET {column} = ({count_sql}) '
+                    f'WHERE t.id > ? AND t.id <= ? AND t.{column} IS NOT ({count_sql})',
+                    (low, low + batch_size)
+                )
+                conn.commit()
+                fixed[f'{table}.{column}'] += cur.rowcount
+    finally:
+        conn.close()
+    return fixed
+
+
+def run_community_reconcile_job(payload):
+    """Image worker handler for a scheduled counter reconciliation."""
+    return reconcile_community_counters()
+
+
+def schedule_community_reconcile(job=None, result=None):
+    """Queue the next reconciliation COMMUNITY_RECONCILE_INTERVAL_HOURS from now, unless one is pending."""
+    if COMMUNITY_RECONCILE_INTERVAL_HOURS <= 0:
+        return None
+    if result and any(result.values()):
+        print(f'[COMMUNITY] Corrected drifted counters: {result}')
+    conn = get_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        pending = conn.execute(
+            "SELECT 1 FROM image_jobs WHERE kind='community_counters' AND status IN ('queued', 'processing') AND id != ?",
+            (job['id'] if job else 0,)
+        ).fetchone()
+        job_id = None
+        if not pending:
+            job_id = image_jobs.enqueue('community_counters', {}, conn=conn,
+                                        delay=COMMUNITY_RECONCILE_INTERVAL_HOURS * 3600)
+        conn.commit()
+        return job_id
+    finally:
+        conn.close()
+
+
+image_worker.handlers['community_counters'] = (run_community_reconcile_job, schedule_community_reconcile)
+
+
+@app.cli.command('reconcile-community-counters')
+@click.option('--batch-size', type=int, default=COMMUNITY_RECONCILE_BATCH, help='Ids recounted per transaction')
+def reconcile_community_counters_command(batch_size):
+    """Recount community like/comment counters and fix any that drifted."""
+    init_db()
+    fixed = reconcile_community_counters(batch_size=batch_size)
+    for name, count in fixed.items():
+        print(f'[COMMUNITY] {name}: {count} row(s) corrected')
+
+
 # ==========================
 # COMMUNITY ROUTES
 # ==========================
@@ -1121,25 +2892,22 @@ def add_community_comment(post_id):
     user_id = session.get('user_id')
     
     try:
-        # Insert comment
+        conn.execute('BEGIN IMMEDIATE')
         conn.execute('''
             INSERT INTO community_comments (post_id, user_id, body, created_at, updated_at)
             VALUES (?, ?, ?, ?, ?)
         ''', (post_id, user_id, body, datetime.now().isoformat(), datetime.now().isoformat()))
-        
-        # Update post comment count
-        conn.execute('''
-            UPDATE community_posts 
-            SET comments_count = (SELECT COUNT(*) FROM community_comments WHERE post_id = ?)
-            WHERE id = ?
-        ''', (post_id, post_id))
-        
+        conn.execute(
+            'UPDATE community_posts SET comments_count = COALESCE(comments_count, 0) + 1 WHERE id = ?',
+            (post_id,)
+        )
         conn.commit()
         conn.close()
         
         flash('Comment added successfully!', 'success')
         return redirect(url_for('community_post', post_id=post_id))
     except Exception as e:
+        conn.rollback()
         conn.close()
         flash(f'Error adding comment: {str(e)}', 'error')
         return redirect(url_for('community_post', post_id=post_id))
@@ -1150,49 +2918,14 @@ def like_community_post(post_id):
     if not session.get('user_logged_in') and not session.get('admin_logged_in'):
         return {'success': False, 'message': 'Please log in'}, 401
     
-    user_id = session.get('user_id')
-    conn = get_db()
-    
-    # Check if already liked
-    liked = conn.execute(
-        'SELECT id FROM community_likes WHERE post_id = ? AND user_id = ?',
-        (post_id, user_id)
-    ).fetchone()
-    
     try:
-        if liked:
-            # Unlike
-            conn.execute('DELETE FROM community_likes WHERE post_id = ? AND user_id = ?', 
-                        (post_id, user_id))
-            liked_count_change = -1
-        else:
-            # Like
-            conn.execute('''
-                INSERT INTO community_likes (post_id, user_id, created_at)
-                VALUES (?, ?, ?)
-            ''', (post_id, user_id, datetime.now().isoformat()))
-            liked_count_change = 1
-        
-        # Update post likes count
-        conn.execute('''
-            UPDATE community_posts 
-            SET likes_count = (SELECT COUNT(*) FROM community_likes WHERE post_id = ?)
-            WHERE id = ?
-        ''', (post_id, post_id))
-        
-        conn.commit()
-        
-        # Get updated count
-        new_count = conn.execute(
-            'SELECT likes_count FROM community_posts WHERE id = ?',
-            (post_id,)
-        ).fetchone()['likes_count']
-        
-        conn.close()
-        return {'success': True, 'liked': not liked, 'likes_count': new_count}
+        toggled = toggle_community_like('post', post_id, session.get('user_id'))
     except Exception as e:
-        conn.close()
         return {'success': False, 'message': str(e)}, 500
+    if toggled is None:
+        return {'success': False, 'message': 'Post not found'}, 404
+    liked, likes_count = toggled
+    return {'success': True, 'liked': liked, 'likes_count': likes_count}
 
 @app.route('/community/comment/<int:comment_id>/like', methods=['POST'])
 def like_community_comment(comment_id):
@@ -1200,47 +2933,14 @@ def like_community_comment(comment_id):
     if not session.get('user_logged_in') and not session.get('admin_logged_in'):
         return {'success': False, 'message': 'Please log in'}, 401
     
-    user_id = session.get('user_id')
-    conn = get_db()
-    
-    # Check if already liked
-    liked = conn.execute(
-        'SELECT id FROM community_likes WHERE comment_id = ? AND user_id = ?',
-        (comment_id, user_id)
-    ).fetchone()
-    
     try:
-        if liked:
-            # Unlike
-            conn.execute('DELETE FROM community_likes WHERE comment_id = ? AND user_id = ?',
-                        (comment_id, user_id))
-        else:
-            # Like
-            conn.execute('''
-                INSERT INTO community_likes (comment_id, user_id, created_at)
-                VALUES (?, ?, ?)
-            ''', (comment_id, user_id, datetime.now().isoformat()))
-        
-        # Update comment likes count
-        conn.execute('''
-            UPDATE community_comments
-            SET likes_count = (SELECT COUNT(*) FROM community_likes WHERE comment_id = ?)
-            WHERE id = ?
-        ''', (comment_id, comment_id))
-        
-        conn.commit()
-        
-        # Get updated count
-        new_count = conn.execute(
-            'SELECT likes_count FROM community_comments WHERE id = ?',
-            (comment_id,)
-        ).fetchone()['likes_count']
-        
-        conn.close()
-        return {'success': True, 'liked': not liked, 'likes_count': new_count}
+        toggled = toggle_community_like('comment', comment_id, session.get('user_id'))
     except Exception as e:
-        conn.close()
         return {'success': False, 'message': str(e)}, 500
+    if toggled is None:
+        return {'success': False, 'message': 'Comment not found'}, 404
+    liked, likes_count = toggled
+    return {'success': True, 'liked': liked, 'likes_count': likes_count}
 
 @app.route('/customer-care/contact', methods=['GET', 'POST'])
 def customer_contact():
@@ -1270,72 +2970,37 @@ def customer_contact():
 def search():
     q = (request.args.get('q') or '').strip()
     page = request.args.get('page', 1, type=int)
-    sort = request.args.get('sort', 'new')
+    sort = request.args.get('sort', 'relevance')
     if page < 1:
         page = 1
     
-    conn = get_db()
     region_id = session.get('region_id')
     product_status = session.get('product_status')
     
     # If search is empty, show message and redirect to home
     if not q:
         flash('Please enter a search term to search for products', 'info')
-        conn.close()
         return redirect(url_for('index'))
     
-    PRODUCTS_PER_PAGE = 12
-    
     # User searched for products with a non-empty query - EXCLUDE special categories
-    like = f"%{q}%"
-    if region_id == 'all':
-        # "All Regions" selected + Search term: Show all matching products from Products category only
-        all_products = conn.execute('SELECT * FROM products WHERE (name LIKE ? OR description LIKE ?) AND category = "Products" ORDER BY id DESC', (like, like)).fetchall()
-    elif region_id:
-        # Specific region selected + Search term: Show matching products from Products category only
-        all_products = conn.execute('''
-            SELECT p.* FROM products p
-            WHERE p.category = "Products"
-              AND (p.name LIKE ? OR p.description LIKE ?)
-              AND (
-                   NOT EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id)
-                OR EXISTS (SELECT 1 FROM product_regions pr WHERE pr.product_id = p.id AND pr.region_id = ?)
-              )
-            ORDER BY p.id DESC
-        ''', (like, like, region_id)).fetchall()
-    else:
-        # No region selected + Search term: Show all matching products from Products category only
-        all_products = conn.execute('SELECT * FROM products WHERE (name LIKE ? OR description LIKE ?) AND category = "Products" ORDER BY id DESC', (like, like)).fetchall()
-    
-    # Filter by product status if selected (but not if 'all' is selected)
-    if product_status and product_status != 'all':
-        all_products = [p for p in all_products if p['product_status'] == product_status]
-    
-    # Sorting for search results
-    if sort == 'price_low':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0))
-    elif sort == 'price_high':
-        all_products = sorted(all_products, key=lambda p: (p['price'] or 0), reverse=True)
-    elif sort == 'name_az':
-        all_products = sorted(all_products, key=lambda p: (p['name'] or '').lower())
-    
-    conn.close()
-    
-    # Pagination logic
-    total_products = len(all_products)
-    total_pages = (total_products + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
-    
-    if page > total_pages and total_pages > 0:
-        page = total_pages
+    where, params = catalog_filters(region_id, product_status)
+    fts_from = search_filters(q, where, params)
+    # Ranked, highlighted results come from the FTS index; the LIKE fallback keeps newest first
+    columns = SQL_SEARCH_SNIPPET if fts_from else ''
+    order_by = SQL_SEARCH_RELEVANCE if (fts_from and sort not in LISTING_SORTS) else None
     
-    start_idx = (page - 1) * PRODUCTS_PER_PAGE
-    end_idx = start_idx + PRODUCTS_PER_PAGE
-    products = all_products[start_idx:end_idx]
+    listing = fetch_product_listing(where, params, sort=sort, page=page, from_sql=fts_from or 'products p',
+                                    columns=columns, order_by=order_by)
+    page = listing['page']
+    products = listing['products']
+    total_products = listing['total_products']
+    total_pages = listing['total_pages']
+    search_snippets = {p['id']: highlight_snippet(p['search_snippet']) for p in products} if fts_from else {}
     
     # Bulk review stats for visible products (for star display on cards)
     review_stats_map = compute_review_stats_bulk([p['id'] for p in products])
     # Mark first 4 from ALL results as "new"
-    new_product_ids = {p['id'] for p in all_products[:4]}
+    new_product_ids = listing['new_product_ids']
     
     return render_template('index.html', 
                          products=products, 
@@ -1343,6 +3008,7 @@ def search():
                          title=f"Search: {q}", 
                          is_search_result=True,
                          search_query=q,
+                         search_snippets=search_snippets,
                          current_page=page,
                          total_pages=total_pages,
                          total_products=total_products,
@@ -1354,39 +3020,111 @@ def search():
 ########################
 
 @app.get('/robots.txt')
+@conditional_get('crawler', stamp_names=None, per_session=False)
 def robots_txt():
     content = "User-agent: *\nAllow: /\n"
     return (content, 200, {'Content-Type': 'text/plain; charset=utf-8'})
 
+# The sitemap protocol caps a file at 50,000 URLs; larger catalogs are served
+# as a sitemap index pointing at numbered child sitemaps.
+SITEMAP_MAX_URLS = int(os.environ.get('SITEMAP_MAX_URLS', '50000'))
+SITEMAP_GZIP = os.environ.get('SITEMAP_GZIP', '0').lower() in ('1', 'true', 'yes')
+SITEMAP_STATIC_PATHS = [
+    '/',
+    '/cart',
+    '/checkout',
+    '/user/login',
+    '/user/register',
+    '/admin/login',
+    '/customer-care/shipping',
+    '/customer-care/returns',
+    '/customer-care/contact',
+]
+SITEMAP_XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+SITEMAP_CHUNK_SIZE = 64 * 1024
+
+
+def sitemap_base_url():
+    return SITE_BASE_URL or request.url_root.rstrip('/')
+
+
+def sitemap_url_count():
+    conn = get_db()
+    products = conn.execute('SELECT COUNT(*) AS c FROM products').fetchone()['c']
+    conn.close()
+    return len(SITEMAP_STATIC_PATHS) + products
+
+
+def iter_sitemap_entries(base, offset=0, limit=None):
+    """Yield <url> elements for URLs offset..offset+limit of the sitemap.
+
+    Static pages come first, then products in id order, so existing URLs keep
+    their child sitemap as products are added. Products are read from the
+    cursor row by row rather than loaded into a list.
+    """
+    static_paths = SITEMAP_STATIC_PATHS[offset:offset + limit if limit is not None else None]
+    for path in static_paths:
+        yield f'<url><loc>{escape(base + path)}</loc></url>\n'
+    product_offset = max(0, offset - len(SITEMAP_STATIC_PATHS))
+    product_limit = -1 if limit is None else limit - len(static_paths)
+    if product_limit == 0:
+        return
+    conn = get_db()
+    cursor = conn.execute('SELECT id, updated_at FROM products ORDER BY id LIMIT ? OFFSET ?', (product_limit, product_offset))
+    for row in cursor:
+        lastmod = f'<lastmod>{row["updated_at"][:10]}</lastmod>' if row['updated_at'] else ''
+        yield f'<url><loc>{escape(base)}/product/{row["id"]}</loc>{lastmod}</url>\n'
+    conn.close()
+
+
+def stream_xml(parts, compress=False):
+    """Buffer small XML fragments into ~64KB chunks, gzip-compressing if asked."""
+    return stream_chunks(parts, SITEMAP_CHUNK_SIZE, compress)
+
+
+def sitemap_response(parts, compress=False):
+    mimetype = 'application/gzip' if compress else 'application/xml'
+    return app.response_class(stream_with_context(stream_xml(parts, compress)), mimetype=mimetype)
+
+
+def _urlset(base, offset=0, limit=None):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<urlset xmlns="{SITEMAP_XMLNS}">\n'
+    yield from iter_sitemap_entries(base, offset, limit)
+    yield '</urlset>\n'
+
+
+def _sitemap_index(base, pages):
+    suffix = '.xml.gz' if SITEMAP_GZIP else '.xml'
+    lastmod = stamps_last_modified(('catalog',))
+    lastmod = f'<lastmod>{lastmod.strftime("%Y-%m-%d")}</lastmod>' if lastmod else ''
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<sitemapindex xmlns="{SITEMAP_XMLNS}">\n'
+    for page in range(1, pages + 1):
+        yield f'<sitemap><loc>{escape(base)}/sitemap-{page}{suffix}</loc>{lastmod}</sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
 @app.get('/sitemap.xml')
+@conditional_get('crawler', stamp_names=('catalog',), per_session=False)
 def sitemap_xml():
-    base = SITE_BASE_URL or request.url_root.rstrip('/')
-    urls = [
-        f"{base}/",
-        f"{base}/cart",
-        f"{base}/checkout",
-        f"{base}/user/login",
-        f"{base}/user/register",
-        f"{base}/admin/login",
-        f"{base}/customer-care/shipping",
-        f"{base}/customer-care/returns",
-        f"{base}/customer-care/contact",
-    ]
-    conn = get_db()
-    products = conn.execute('SELECT id FROM products ORDER BY id DESC').fetchall()
-    conn.close()
-    for p in products:
-        urls.append(f"{base}/product/{p['id']}")
-    xml = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
-    ]
-    for u in urls:
-        xml.append('<url>')
-        xml.append(f'<loc>{u}</loc>')
-        xml.append('</url>')
-    xml.append('</urlset>')
-    return ("\n".join(xml), 200, {'Content-Type': 'application/xml; charset=utf-8'})
+    base = sitemap_base_url()
+    total = sitemap_url_count()
+    if total <= SITEMAP_MAX_URLS:
+        return sitemap_response(_urlset(base))
+    pages = (total + SITEMAP_MAX_URLS - 1) // SITEMAP_MAX_URLS
+    return sitemap_response(_sitemap_index(base, pages))
+
+
+@app.get('/sitemap-<int:page>.xml')
+@app.get('/sitemap-<int:page>.xml.gz')
+@conditional_get('crawler', stamp_names=('catalog',), per_session=False)
+def sitemap_page(page):
+    offset = (page - 1) * SITEMAP_MAX_URLS
+    if page < 1 or offset >= sitemap_url_count():
+        abort(404)
+    compress = request.path.endswith('.gz')
+    return sitemap_response(_urlset(sitemap_base_url(), offset, SITEMAP_MAX_URLS), compress)
 
 @app.post('/set_region')
 def set_region():
@@ -1438,6 +3176,8 @@ def reset_filters():
 
 
 @app.route('/product/<int:pid>')
+@conditional_get('page')
+@cached_page
 def product_detail(pid):
     conn = get_db()
     product = conn.execute(SQL_SELECT_PRODUCT_BY_ID, (pid,)).fetchone()
@@ -1569,6 +3309,7 @@ def submit_review(pid):
             (pid, user_id, rating, title, body, verified, now, now)
         )
         conn.commit()
+        bump_cache_version('catalog')
         flash('Thanks for your review!', 'success')
     except Exception as e:
         flash(f'Failed to submit review: {str(e)}', 'error')
@@ -1587,33 +3328,317 @@ def mark_review_helpful(rid):
     user_id = session.get('user_id')
     conn = get_db()
     try:
-        # Find review and product
-        review = conn.execute('SELECT id, product_id FROM product_reviews WHERE id=?', (rid,)).fetchone()
-        if not review:
-            conn.close()
-            flash('Review not found', 'error')
-            return redirect(url_for('index'))
-
-        # Prevent duplicate votes
-        existing = conn.execute('SELECT id FROM review_votes WHERE review_id=? AND user_id=?', (rid, user_id)).fetchone()
-        if existing:
-            flash('You already marked this review as helpful.', 'info')
-            conn.close()
-            return redirect(url_for('product_detail', pid=review['product_id']))
-
-        # Insert vote and increment counter
-        now = datetime.now().isoformat()
-        conn.execute('INSERT INTO review_votes (review_id, user_id, vote, created_at) VALUES (?, ?, 1, ?)', (rid, user_id, now))
-        conn.execute('UPDATE product_reviews SET helpful_count = helpful_count + 1 WHERE id=?', (rid,))
+        # Find review and product
+        review = conn.execute('SELECT id, product_id FROM product_reviews WHERE id=?', (rid,)).fetchone()
+        if not review:
+            conn.close()
+            flash('Review not found', 'error')
+            return redirect(url_for('index'))
+
+        # Prevent duplicate votes
+        existing = conn.execute('SELECT id FROM review_votes WHERE review_id=? AND user_id=?', (rid, user_id)).fetchone()
+        if existing:
+            flash('You already marked this review as helpful.', 'info')
+            conn.close()
+            return redirect(url_for('product_detail', pid=review['product_id']))
+
+        # Insert vote and increment counter
+        now = datetime.now().isoformat()
+        conn.execute('INSERT INTO review_votes (review_id, user_id, vote, created_at) VALUES (?, ?, 1, ?)', (rid, user_id, now))
+        conn.execute('UPDATE product_reviews SET helpful_count = helpful_count + 1 WHERE id=?', (rid,))
+        conn.commit()
+        bump_cache_version('catalog')
+        flash('Marked helpful. Thank you!', 'success')
+        return redirect(url_for('product_detail', pid=review['product_id']))
+    except Exception as e:
+        conn.rollback()
+        flash(f'Failed to vote: {str(e)}', 'error')
+        return redirect(request.referrer or url_for('index'))
+    finally:
+        conn.close()
+
+
+########################
+# Checkout
+########################
+
+# Unpaid orders hold their stock this long; release_stale_reservations() then
+# puts it back and marks the order expired.
+ORDER_RESERVATION_MINUTES = float(os.environ.get('ORDER_RESERVATION_MINUTES', '30'))
+
+# Payment statuses whose orders do not hold stock
+ORDER_RELEASED_STATUSES = ('failed', 'expired')
+
+# Stock held by (or taken back for) a set of orders, summed per product
+SQL_ORDER_STOCK_DELTA = '''UPDATE products SET stock = stock {op} (
+        SELECT SUM(oi.quantity) FROM order_items oi WHERE oi.order_id IN ({marks}) AND oi.product_id = products.id)
+    WHERE id IN (SELECT product_id FROM order_items WHERE order_id IN ({marks}))'''
+
+
+class CheckoutError(Exception):
+    """The cart cannot be ordered as it is; the message is shown to the customer."""
+
+
+def cart_quantities(cart) -> dict:
+    """{product_id: quantity} for a session cart, merging duplicate lines."""
+    quantities = {}
+    for item in cart or []:
+        quantities[int(item['id'])] = quantities.get(int(item['id']), 0) + max(1, int(item['quantity']))
+    return quantities
+
+
+def place_order(cart, customer, gateway_state=None):
+    """Create a pending order for cart, reserving its stock atomically.
+
+    Everything happens in one BEGIN IMMEDIATE transaction: the cart's products
+    are loaded with a single IN query, prices come from the database (never
+    the session), each product's stock is decremented only if enough is left,
+    and the order and its items are inserted. Raises CheckoutError (nothing
+    written) if a product is gone or short. gateway_state is stored on the
+    order ('creating' when a payment gateway order will be created next).
+    Returns dict with id, total, estimated_delivery_date and prices
+    ({product_id: current unit price}).
+    """
+    quantities = cart_quantities(cart)
+    if not quantities:
+        raise CheckoutError('Your cart is empty')
+    marks = ','.join('?' * len(quantities))
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        products = {r['id']: r for r in conn.execute(
+            f'SELECT id, name, price, stock, estimated_delivery_days, estimated_delivery_date '
+            f'FROM products WHERE id IN ({marks})', list(quantities)
+        ).fetchall()}
+        if len(products) != len(quantities):
+            raise CheckoutError('Some items in your cart are no longer available; please review your cart')
+        short = [p['name'] for pid, p in products.items() if (p['stock'] or 0) < quantities[pid]]
+        if short:
+            raise CheckoutError(f"Not enough stock for: {', '.join(short)}")
+        reserved = conn.executemany(
+            'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+            [(qty, pid, qty) for pid, qty in quantities.items()]
+        ).rowcount
+        if reserved != len(quantities):
+            raise CheckoutError('Stock changed while placing your order; please try again')
+
+        prices = {pid: float(p['price'] or 0) for pid, p in products.items()}
+        total = round(sum(prices[pid] * qty for pid, qty in quantities.items()), 2)
+        est_date = max(calculate_estimated_date(p) for p in products.values())
+        order_id = conn.execute(
+            'INSERT INTO orders (customer_name, email, phone, address, city, pincode, total_amount, payment_status, '
+            'created_at, estimated_delivery_date, stock_reserved, gateway_state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)',
+            (customer.get('name'), customer.get('email'), customer.get('phone'), customer.get('address'),
+             customer.get('city'), customer.get('pincode'), total, 'pending', datetime.now().isoformat(), est_date,
+             gateway_state)
+        ).lastrowid
+        conn.executemany(
+            'INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)',
+            [(order_id, pid, qty, prices[pid]) for pid, qty in quantities.items()]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    bump_cache_version('catalog')
+    return {'id': order_id, 'total': total, 'estimated_delivery_date': est_date, 'prices': prices}
+
+
+def release_order_stock(conn, order_ids):
+    """Give the stock of order_ids back (inside the caller's transaction)."""
+    marks = ','.join('?' * len(order_ids))
+    conn.execute(SQL_ORDER_STOCK_DELTA.format(op='+', marks=marks), [*order_ids, *order_ids])
+    conn.execute(f'UPDATE orders SET stock_reserved = 0 WHERE id IN ({marks})', order_ids)
+
+
+def reserve_order_stock(conn, order_ids):
+    """Take the stock of order_ids again (inside the caller's transaction), even
+    if that oversells. Returns the names of products left with negative stock."""
+    marks = ','.join('?' * len(order_ids))
+    conn.execute(SQL_ORDER_STOCK_DELTA.format(op='-', marks=marks), [*order_ids, *order_ids])
+    conn.execute(f'UPDATE orders SET stock_reserved = 1 WHERE id IN ({marks})', order_ids)
+    return [r['name'] for r in conn.execute(
+        f'SELECT name FROM products WHERE stock < 0 AND id IN (SELECT product_id FROM order_items WHERE order_id IN ({marks}))',
+        order_ids
+    ).fetchall()]
+
+
+def set_order_status(order_id=None, status='paid', razorpay_order_id=None, estimated_delivery_date=None):
+    """Change an order's payment status and move its stock with it: failed or
+    expired orders release their reservation, an order brought back to
+    pending/paid takes the stock again. Orders placed before stock tracking
+    (stock_reserved NULL) only change status.
+    Returns the names of oversold products (empty when none).
+    """
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if razorpay_order_id is not None:
+            order = conn.execute('SELECT id, stock_reserved FROM orders WHERE razorpay_order_id=?', (razorpay_order_id,)).fetchone()
+        else:
+            order = conn.execute('SELECT id, stock_reserved FROM orders WHERE id=?', (order_id,)).fetchone()
+        oversold = []
+        if order is not None:
+            if status in ORDER_RELEASED_STATUSES and order['stock_reserved'] == 1:
+                release_order_stock(conn, [order['id']])
+            elif status not in ORDER_RELEASED_STATUSES and order['stock_reserved'] == 0:
+                oversold = reserve_order_stock(conn, [order['id']])
+            conn.execute('UPDATE orders SET payment_status=? WHERE id=?', (status, order['id']))
+            if estimated_delivery_date is not None:
+                conn.execute('UPDATE orders SET estimated_delivery_date=? WHERE id=?', (estimated_delivery_date, order['id']))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if order is not None and order['stock_reserved'] is not None:
+        bump_cache_version('catalog')
+    if oversold:
+        print(f"[CHECKOUT] Order #{order['id']} oversold: {', '.join(oversold)}")
+    return oversold
+
+
+def release_stale_reservations(max_age_minutes=ORDER_RESERVATION_MINUTES) -> int:
+    """Expire pending orders older than max_age_minutes and release their stock.
+    Returns the number of orders expired."""
+    cutoff = (datetime.now() - timedelta(minutes=max_age_minutes)).isoformat()
+    sql_stale = "SELECT id FROM orders WHERE stock_reserved = 1 AND payment_status = 'pending' AND created_at < ?"
+    conn = get_db()
+    # Cheap check (partial index) before taking the write lock
+    if conn.execute(sql_stale + ' LIMIT 1', (cutoff,)).fetchone() is None:
+        conn.close()
+        return 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        order_ids = [r['id'] for r in conn.execute(sql_stale, (cutoff,)).fetchall()]
+        if order_ids:
+            release_order_stock(conn, order_ids)
+            conn.execute(f"UPDATE orders SET payment_status = 'expired' WHERE id IN ({','.join('?' * len(order_ids))})",
+                         order_ids)
         conn.commit()
-        flash('Marked helpful. Thank you!', 'success')
-        return redirect(url_for('product_detail', pid=review['product_id']))
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        flash(f'Failed to vote: {str(e)}', 'error')
-        return redirect(request.referrer or url_for('index'))
+        raise
     finally:
         conn.close()
+    if order_ids:
+        bump_cache_version('catalog')
+    return len(order_ids)
+
+
+@app.cli.command('release-stale-reservations')
+@click.option('--minutes', type=float, default=ORDER_RESERVATION_MINUTES, help='Age of unpaid orders to expire')
+def release_stale_reservations_command(minutes):
+    """Expire unpaid orders and return their reserved stock."""
+    init_db()
+    print(f'[CHECKOUT] Expired {release_stale_reservations(minutes)} unpaid order(s) older than {minutes:g} minutes')
+
+
+# Network errors and 5xx answers are retried; a rejected request is not
+RAZORPAY_TRANSIENT_ERRORS = tuple(
+    ([razorpay.errors.ServerError, razorpay.errors.GatewayError] if razorpay else [])
+    + ([requests.ConnectionError, requests.Timeout, requests.JSONDecodeError] if requests else [])
+) or (OSError,)
+razorpay_breaker = CircuitBreaker('razorpay', RAZORPAY_BREAKER_FAILURES, RAZORPAY_BREAKER_RESET,
+                                  counted=RAZORPAY_TRANSIENT_ERRORS)
+
+
+def _razorpay_timeout(deadline_at=None):
+    """Per-call timeout: RAZORPAY_TIMEOUT, cut to what is left of a request budget."""
+    if deadline_at is None:
+        return RAZORPAY_TIMEOUT
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0.1:
+        raise (requests.Timeout if requests else TimeoutError)('payment gateway time budget spent')
+    return min(RAZORPAY_TIMEOUT, remaining)
+
+
+def _razorpay_order(order, attempt, lookup_first=False, deadline_at=None):
+    receipt = f"order_rcpt_{order['id']}"
+    if lookup_first or attempt > 1:
+        # An earlier call may have created it before its response was lost
+        found = client.order.all({'receipt': receipt}, timeout=_razorpay_timeout(deadline_at)).get('items') or []
+        if found:
+            return found[0]
+    return client.order.create({
+        'amount': int(round(order['total_amount'] * 100)),
+        'currency': 'INR',
+        'receipt': receipt,
+        'notes': {'local_order_id': str(order['id'])}
+    }, timeout=_razorpay_timeout(deadline_at))
+
+
+def create_gateway_order(order_id, lookup_first=False, budget=None):
+    """Create the Razorpay order for a committed local order and store its id.
+
+    Runs with no database transaction open: the HTTP call (timeout, retries,
+    circuit breaker) happens between two short writes. With budget (seconds,
+    for customer requests) it makes at most RAZORPAY_REQUEST_RETRIES tries
+    and gives up once the budget is spent. On failure the order is left with
+    gateway_state='failed' for reconcile_gateway_orders().
+    Returns the Razorpay order id, or None.
+    """
+    conn = get_db()
+    order = conn.execute('SELECT id, total_amount, razorpay_order_id FROM orders WHERE id=?', (order_id,)).fetchone()
+    conn.close()
+    if order is None or client is None:
+        return None
+    if order['razorpay_order_id']:
+        return order['razorpay_order_id']
+    deadline_at = time.monotonic() + budget if budget else None
+    try:
+        rz_order = razorpay_breaker.call(
+            retry_call, lambda attempt: _razorpay_order(order, attempt, lookup_first, deadline_at),
+            attempts=RAZORPAY_REQUEST_RETRIES if budget else RAZORPAY_RETRIES,
+            retry_on=RAZORPAY_TRANSIENT_ERRORS, deadline=budget,
+        )
+    except Exception as e:
+        conn = get_db()
+        conn.execute("UPDATE orders SET gateway_state='failed', gateway_error=? WHERE id=?",
+                     (f'{type(e).__name__}: {e}'[:500], order_id))
+        conn.commit(); conn.close()
+        print(f'[PAYMENT] Razorpay order for #{order_id} failed: {type(e).__name__}: {e}')
+        return None
+    conn = get_db()
+    conn.execute("UPDATE orders SET razorpay_order_id=?, gateway_state='created', gateway_error=NULL WHERE id=?",
+                 (rz_order['id'], order_id))
+    conn.commit(); conn.close()
+    return rz_order['id']
+
+
+def reconcile_gateway_orders(min_age_seconds=60, limit=100):
+    """Retry gateway order creation for pending orders that failed or were
+    interrupted mid-call, looking each one up by receipt first so an order
+    Razorpay already has is attached rather than duplicated.
+    Returns dict with created and failed counts.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=min_age_seconds)).isoformat()
+    conn = get_db()
+    order_ids = [r['id'] for r in conn.execute(
+        "SELECT id FROM orders WHERE gateway_state IN ('creating', 'failed') AND payment_status = 'pending' "
+        "AND created_at < ? ORDER BY id LIMIT ?", (cutoff, limit)
+    ).fetchall()]
+    conn.close()
+    result = {'created': 0, 'failed': 0}
+    for order_id in order_ids:
+        result['created' if create_gateway_order(order_id, lookup_first=True) else 'failed'] += 1
+    return result
+
+
+@app.cli.command('reconcile-payments')
+@click.option('--min-age', type=float, default=60, help='Skip orders younger than N seconds (calls in flight)')
+def reconcile_payments_command(min_age):
+    """Create missing Razorpay orders for pending orders."""
+    init_db()
+    if client is None:
+        print('[PAYMENT] Razorpay is not configured')
+        return
+    result = reconcile_gateway_orders(min_age)
+    print(f"[PAYMENT] Reconciled {result['created']} order(s), {result['failed']} still failing "
+          f"(breaker {razorpay_breaker.state})")
 
 
 @app.route('/checkout', methods=['GET', 'POST'])
@@ -1623,42 +3648,28 @@ def checkout():
         flash('Your cart is empty', 'error')
         return redirect(url_for('index'))
     if request.method == 'POST':
-        name = request.form.get('name')
-        email = request.form.get('email')
-        phone = request.form.get('phone')
-        address = request.form.get('address')
-        city = request.form.get('city')
-        pincode = request.form.get('pincode')
-        total = cart_total(cart)
-
-        conn = get_db()
-        est_dates = []
-        for item in cart:
-            pr = conn.execute(SQL_SELECT_PRODUCT_BY_ID, (item['id'],)).fetchone()
-            est_dates.append(calculate_estimated_date(pr))
-        est_date = max(est_dates) if est_dates else (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
-
-        cur = conn.cursor()
-        cur.execute('INSERT INTO orders (customer_name, email, phone, address, city, pincode, total_amount, payment_status, created_at, estimated_delivery_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                    (name, email, phone, address, city, pincode, total, 'pending', datetime.now().isoformat(), est_date))
-        order_id = cur.lastrowid
-        for item in cart:
-            cur.execute('INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)',
-                        (order_id, item['id'], item['quantity'], item['price']))
-
-        # Create Razorpay order if configured
-        rz_order_id = None
-        if client:
-            rz_order = client.order.create({
-                'amount': int(total * 100),
-                'currency': 'INR',
-                'receipt': f'order_rcpt_{order_id}',
-                'notes': {'local_order_id': str(order_id)}
-            })
-            rz_order_id = rz_order.get('id')
-            cur.execute('UPDATE orders SET razorpay_order_id=? WHERE id=?', (rz_order_id, order_id))
-
-        conn.commit(); conn.close()
+        customer = {k: request.form.get(k) for k in ('name', 'email', 'phone', 'address', 'city', 'pincode')}
+        release_stale_reservations()
+        try:
+            order = place_order(cart, customer, gateway_state='creating' if client else None)
+        except CheckoutError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('cart'))
+        except sqlite3.OperationalError:
+            flash('Checkout is busy right now, please try again', 'error')
+            return redirect(url_for('cart'))
+        order_id = order['id']
+
+        # Keep the cart in line with the prices actually charged
+        if any(abs(float(item['price']) - order['prices'][int(item['id'])]) > 0.005 for item in cart):
+            for item in cart:
+                item['price'] = order['prices'][int(item['id'])]
+            session['cart'] = cart
+            flash('Some prices changed since you added them to your cart; your order uses the current prices', 'info')
+
+        # Create Razorpay order if configured (after the local commit)
+        if client and not create_gateway_order(order_id, budget=RAZORPAY_REQUEST_BUDGET):
+            flash('The payment gateway is not responding. Your order is saved; please retry the payment shortly.', 'error')
 
         session['current_order_id'] = order_id
         return redirect(url_for('pay'))
@@ -1695,6 +3706,12 @@ def pay():
     if not client or not RAZORPAY_KEY_ID:
         flash('Payment gateway not configured. Using mock screen.', 'error')
         return render_template('pay_mock.html', order=order)
+    if order and not order['razorpay_order_id'] and order['payment_status'] == 'pending':
+        # Gateway order creation failed at checkout; try again now
+        if create_gateway_order(order['id'], lookup_first=True, budget=RAZORPAY_REQUEST_BUDGET):
+            conn = get_db()
+            order = conn.execute('SELECT * FROM orders WHERE id=?', (order_id,)).fetchone()
+            conn.close()
     return render_template('pay.html', order=order, env_key_id=RAZORPAY_KEY_ID)
 
 
@@ -1710,9 +3727,7 @@ def razorpay_callback():
     body = f"{order_id}|{payment_id}"
     expected = hmac.new(RAZORPAY_KEY_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
     if hmac.compare_digest(expected, signature):
-        conn = get_db()
-        conn.execute("UPDATE orders SET payment_status='paid' WHERE razorpay_order_id=?", (order_id,))
-        conn.commit(); conn.close()
+        set_order_status(status='paid', razorpay_order_id=order_id)
         session.pop('cart', None)
         session.pop('current_order_id', None)
         return {'status':'ok'}
@@ -1731,26 +3746,220 @@ def order_success(order_id):
 # Newsletter subscription
 ########################
 
-def subscribe_brevo(email: str) -> bool:
-    """Subscribe an email to Brevo list if configured. Returns True on API success or if not configured."""
-    if not BREVO_API_KEY or not BREVO_LIST_ID or not requests:
-        return True
+# /subscribe only writes locally: the subscriber row and a newsletter_outbox
+# row in one transaction. The newsletter sender pushes pending contacts to
+# Brevo in batches through its bulk import endpoint, on one pooled HTTP
+# session, backing off on errors and on 429 until the rate-limit window resets.
+
+class BrevoError(Exception):
+    """Brevo answered with a server or authentication error (retried)."""
+
+
+class BrevoRejected(Exception):
+    """Brevo refused the request itself, e.g. an invalid address (not retried)."""
+
+
+class BrevoRateLimited(Exception):
+    """Brevo answered 429; retry_after is the seconds until the window resets."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'rate limited for {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+BREVO_TRANSIENT_ERRORS = (BrevoError,) + ((requests.ConnectionError, requests.Timeout) if requests else ())
+brevo_breaker = CircuitBreaker('brevo', BREVO_BREAKER_FAILURES, BREVO_BREAKER_RESET, counted=BREVO_TRANSIENT_ERRORS)
+_brevo_session = None
+_newsletter_wakeup = threading.Event()
+_newsletter_thread = None
+
+
+def brevo_session():
+    """Process-wide keep-alive session for Brevo calls (created on first use)."""
+    global _brevo_session
+    if _brevo_session is None:
+        session_ = requests.Session()
+        session_.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        session_.headers.update({'accept': 'application/json', 'api-key': BREVO_API_KEY})
+        _brevo_session = session_
+    return _brevo_session
+
+
+def brevo_configured() -> bool:
+    return bool(BREVO_API_KEY and BREVO_LIST_ID and requests)
+
+
+def brevo_import_contacts(emails):
+    """Add emails to the Brevo list with one bulk import call; returns the processId."""
+    resp = brevo_session().post(f'{BREVO_API_BASE}/contacts/import', json={
+        'listIds': [int(BREVO_LIST_ID)],
+        'jsonBody': [{'email': email} for email in emails],
+        'updateExistingContacts': True,
+        'emptyContactsAttributes': False,
+    }, timeout=BREVO_TIMEOUT)
+    if resp.status_code == 429:
+        reset = resp.headers.get('x-sib-ratelimit-reset') or resp.headers.get('Retry-After') or '60'
+        raise BrevoRateLimited(float(reset))
+    if resp.status_code >= 500 or resp.status_code in (401, 403):
+        # An outage or a bad API key: no contact is at fault
+        raise BrevoError(f'HTTP {resp.status_code}: {resp.text[:200].strip()}')
+    if resp.status_code >= 400:
+        raise BrevoRejected(f'HTTP {resp.status_code}: {resp.text[:200].strip()}')
+    return (resp.json() or {}).get('processId')
+
+
+def brevo_import_rows(rows):
+    """Import outbox rows; when Brevo rejects a batch, its halves are sent
+    separately so only the offending contacts are refused. Other errors
+    propagate; halves already imported are then sent again on the retry
+    (the import updates existing contacts).
+    Returns ([(rows, process_id), ...], [(row, error), ...]).
+    """
     try:
-        url = 'https://api.brevo.com/v3/contacts'
-        headers = {
-            'accept': 'application/json',
-            'content-type': 'application/json',
-            'api-key': BREVO_API_KEY,
-        }
-        payload = {
-            'email': email,
-            'listIds': [int(BREVO_LIST_ID)],
-            'updateEnabled': True,
-        }
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
-        return resp.status_code in (200, 201)
-    except Exception:
-        return False
+        process_id = brevo_breaker.call(
+            retry_call, lambda attempt: brevo_import_contacts([r['email'] for r in rows]),
+            attempts=BREVO_RETRIES, retry_on=BREVO_TRANSIENT_ERRORS,
+        )
+        return [(rows, process_id)], []
+    except BrevoRejected as e:
+        if len(rows) == 1:
+            return [], [(rows[0], str(e)[:500])]
+    half = len(rows) // 2
+    imported, rejected = brevo_import_rows(rows[:half])
+    more_imported, more_rejected = brevo_import_rows(rows[half:])
+    return imported + more_imported, rejected + more_rejected
+
+
+def sync_newsletter_outbox(batch_size=NEWSLETTER_BATCH_SIZE, max_batches=None):
+    """Send due outbox contacts to Brevo, batch_size per call, until none are
+    due, Brevo rate-limits us or max_batches is reached.
+    Returns dict with sent, failed, retried and batches.
+    """
+    result = {'sent': 0, 'failed': 0, 'retried': 0, 'batches': 0}
+    if not brevo_configured():
+        return result
+    while max_batches is None or result['batches'] < max_batches:
+        now = time.time()
+        conn = get_db()
+        # Due rows, plus rows a sender claimed and never finished (it died mid-batch)
+        rows = conn.execute(
+            "UPDATE newsletter_outbox SET status='sending', attempts=attempts+1, claimed_at=? "
+            "WHERE id IN (SELECT id FROM newsletter_outbox WHERE status='pending' AND available_at <= ? "
+            "UNION ALL SELECT id FROM newsletter_outbox WHERE status='sending' AND claimed_at <= ? "
+            'ORDER BY id LIMIT ?) RETURNING id, email, attempts',
+            (now, now, now - NEWSLETTER_CLAIM_TIMEOUT, batch_size)
+        ).fetchall()
+        conn.commit(); conn.close()
+        if not rows:
+            break
+        ids = [r['id'] for r in rows]
+        placeholders = ','.join('?' * len(ids))
+        result['batches'] += 1
+        try:
+            imported, rejected = brevo_import_rows(rows)
+        except (BrevoRateLimited, CircuitOpenError) as e:
+            # Not a failed attempt: put the batch back until the window resets
+            retry_after = e.retry_after if isinstance(e, BrevoRateLimited) else brevo_breaker.reset_timeout
+            conn = get_db()
+            conn.execute(f"UPDATE newsletter_outbox SET status='pending', attempts=attempts-1, available_at=?, "
+                         f'error=? WHERE id IN ({placeholders})', [time.time() + retry_after, str(e), *ids])
+            conn.commit(); conn.close()
+            print(f'[NEWSLETTER] Brevo {e}')
+            break
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'[:500]
+            delay = NEWSLETTER_RETRY_DELAY * (2 ** (rows[0]['attempts'] - 1))
+            conn = get_db()
+            failed = conn.execute(
+                f"UPDATE newsletter_outbox SET status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                f"available_at=?, error=? WHERE id IN ({placeholders}) RETURNING status",
+                [NEWSLETTER_MAX_ATTEMPTS, time.time() + delay, error, *ids]
+            ).fetchall()
+            conn.commit(); conn.close()
+            gave_up = sum(1 for r in failed if r['status'] == 'failed')
+            result['failed'] += gave_up
+            result['retried'] += len(failed) - gave_up
+            print(f'[NEWSLETTER] Batch of {len(ids)} failed: {error}')
+            break
+        conn = get_db()
+        for sent_rows, process_id in imported:
+            sent_ids = [r['id'] for r in sent_rows]
+            conn.execute(f"UPDATE newsletter_outbox SET status='sent', sent_at=?, error=NULL, brevo_process_id=? "
+                         f"WHERE id IN ({','.join('?' * len(sent_ids))})", [datetime.now().isoformat(), process_id, *sent_ids])
+            result['sent'] += len(sent_ids)
+        # A rejected contact (e.g. an address Brevo refuses) will not succeed on retry
+        conn.executemany("UPDATE newsletter_outbox SET status='failed', error=? WHERE id=?",
+                         [(error, row['id']) for row, error in rejected])
+        conn.commit(); conn.close()
+        result['failed'] += len(rejected)
+        if rejected:
+            print(f'[NEWSLETTER] Brevo rejected {len(rejected)} contact(s): {rejected[0][1]}')
+    return result
+
+
+def run_newsletter_sender(stop=None):
+    """Sync loop: wakes on new subscriptions (after NEWSLETTER_BATCH_WINDOW, to
+    gather a batch) or every NEWSLETTER_SYNC_INTERVAL seconds."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        if _newsletter_wakeup.wait(NEWSLETTER_SYNC_INTERVAL):
+            stop.wait(NEWSLETTER_BATCH_WINDOW)
+        _newsletter_wakeup.clear()
+        try:
+            sync_newsletter_outbox()
+        except Exception as e:
+            print(f'[NEWSLETTER] {type(e).__name__}: {e}')
+
+
+def start_newsletter_sender():
+    """Run the sender in a daemon thread of this process (once)."""
+    global _newsletter_thread
+    if brevo_configured() and (_newsletter_thread is None or not _newsletter_thread.is_alive()):
+        _newsletter_thread = threading.Thread(target=run_newsletter_sender, name='newsletter-sender', daemon=True)
+        _newsletter_thread.start()
+    return _newsletter_thread
+
+
+def newsletter_outbox_counts() -> dict:
+    conn = get_db()
+    rows = conn.execute('SELECT status, COUNT(*) AS c FROM newsletter_outbox GROUP BY status').fetchall()
+    conn.close()
+    counts = {status: 0 for status in ('pending', 'sending', 'sent', 'failed')}
+    counts.update({r['status']: r['c'] for r in rows})
+    return counts
+
+
+@app.cli.command('sync-newsletter')
+@click.option('--all', 'resync_all', is_flag=True, help='Queue every subscriber again first')
+@click.option('--retry-failed', is_flag=True, help='Give failed contacts a fresh attempt budget')
+@click.option('--loop', is_flag=True, help='Keep syncing until Ctrl+C')
+def sync_newsletter_command(resync_all, retry_failed, loop):
+    """Push pending newsletter subscribers to Brevo."""
+    init_db()
+    if not brevo_configured():
+        print('[NEWSLETTER] BREVO_API_KEY / BREVO_LIST_ID not set')
+        return
+    conn = get_db()
+    if resync_all:
+        conn.execute(
+            'INSERT INTO newsletter_outbox (subscriber_id, email, created_at, available_at) '
+            'SELECT id, email, ?, 0 FROM newsletter_subscribers WHERE true '
+            "ON CONFLICT(subscriber_id) DO UPDATE SET status='pending', attempts=0, available_at=0, error=NULL",
+            (datetime.now().isoformat(),)
+        )
+    if retry_failed:
+        conn.execute("UPDATE newsletter_outbox SET status='pending', attempts=0, available_at=0 WHERE status='failed'")
+    conn.commit(); conn.close()
+    if loop:
+        print('[NEWSLETTER] Syncing to Brevo; Ctrl+C to stop')
+        try:
+            run_newsletter_sender()
+        except KeyboardInterrupt:
+            pass
+        return
+    result = sync_newsletter_outbox()
+    print(f"[NEWSLETTER] Sent {result['sent']} in {result['batches']} batch(es), {result['retried']} to retry, "
+          f"{result['failed']} failed: {newsletter_outbox_counts()}")
 
 
 @app.post('/subscribe')
@@ -1763,20 +3972,106 @@ def subscribe():
         conn = get_db()
         cur = conn.cursor()
         cur.execute('INSERT OR IGNORE INTO newsletter_subscribers (email, created_at) VALUES (?, ?)', (email, datetime.now().isoformat()))
+        if cur.rowcount and brevo_configured():
+            cur.execute('INSERT INTO newsletter_outbox (subscriber_id, email, created_at, available_at) VALUES (?, ?, ?, 0)',
+                        (cur.lastrowid, email, datetime.now().isoformat()))
         conn.commit(); conn.close()
     except Exception:
         flash('Unable to save your subscription right now.', 'error')
         return redirect(request.referrer or url_for('index'))
-    if subscribe_brevo(email):
-        flash('Subscribed! Check your inbox for updates.', 'success')
-    else:
-        flash('Subscribed locally. We will add you to our mailing list shortly.', 'success')
+    if NEWSLETTER_SYNC == 'thread':
+        start_newsletter_sender()
+        _newsletter_wakeup.set()
+    flash('Subscribed! Check your inbox for updates.', 'success')
     return redirect(request.referrer or url_for('index'))
 
 ########################
 # Webhooks (recommended)
 ########################
 
+# Verified webhooks are stored in the webhook_events inbox (one INSERT, keyed
+# by Razorpay's event id) and acknowledged at once; a JobWorker drains the
+# inbox in batches with retry/backoff. Duplicate deliveries hit the unique
+# event_id and are dropped, and processing is idempotent per order, so
+# payment.captured and order.paid for the same order do the work once.
+webhook_events = JobQueue(lambda: get_db(), table='webhook_events', max_attempts=WEBHOOK_MAX_ATTEMPTS,
+                          retry_delay=WEBHOOK_RETRY_DELAY)
+
+
+def webhook_order_id(payload):
+    """Razorpay order id an event refers to (order.* or payment.* events), or None."""
+    entities = payload.get('payload') or {}
+    order = (entities.get('order') or {}).get('entity') or {}
+    payment = (entities.get('payment') or {}).get('entity') or {}
+    return order.get('id') or payment.get('order_id')
+
+
+def store_webhook_event(event_id, payload, raw=None, conn=None):
+    """Add an event to the inbox; returns False if event_id was already received."""
+    own_conn = conn is None
+    conn = conn or get_db()
+    cur = conn.execute(
+        'INSERT OR IGNORE INTO webhook_events (event_id, kind, payload, status, max_attempts, created_at, available_at) '
+        "VALUES (?, 'razorpay', ?, 'queued', ?, ?, ?)",
+        (event_id, raw or json.dumps(payload), webhook_events.max_attempts,
+         datetime.now().isoformat(), time.time())
+    )
+    if own_conn:
+        conn.commit()
+        conn.close()
+    return cur.rowcount == 1
+
+
+def process_webhook_event(payload):
+    """Apply one inbox event (runs in the webhook worker thread). Events we do
+    not act on are still recorded and marked done."""
+    event = payload.get('event')
+    if event not in WEBHOOK_PAID_EVENTS:
+        return {'action': 'ignored'}
+    rz_order_id = webhook_order_id(payload)
+    if not rz_order_id:
+        raise ValueError(f'{event} without an order id')
+    conn = get_db()
+    order = conn.execute('SELECT id, payment_status FROM orders WHERE razorpay_order_id=?', (rz_order_id,)).fetchone()
+    conn.close()
+    if order is None:
+        # The follow-up UPDATE of razorpay_order_id may not have landed yet: retry later
+        raise LookupError(f'No order with razorpay_order_id {rz_order_id}')
+    if order['payment_status'] == 'paid':
+        return {'action': 'already-paid', 'order_id': order['id']}
+    set_order_status(order['id'], status='paid')
+    return {'action': 'paid', 'order_id': order['id']}
+
+
+webhook_worker = JobWorker(
+    webhook_events,
+    {'razorpay': (process_webhook_event, None)},
+    processes=0,
+    batch_size=WEBHOOK_BATCH_SIZE,
+)
+
+
+def webhook_stats():
+    """Inbox counts, queue lag and recent failure rate for diagnostics."""
+    hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
+    conn = get_db()
+    oldest = conn.execute("SELECT MIN(created_at) FROM webhook_events WHERE status IN ('queued', 'processing')").fetchone()[0]
+    recent = conn.execute(
+        "SELECT SUM(status = 'done') AS done, SUM(status = 'failed') AS failed, SUM(attempts > 1) AS retried, "
+        'AVG(duration_ms) AS avg_ms FROM webhook_events WHERE created_at >= ?', (hour_ago,)
+    ).fetchone()
+    conn.close()
+    finished = (recent['done'] or 0) + (recent['failed'] or 0)
+    return {
+        **webhook_events.counts(),
+        'lag_seconds': round((datetime.now() - datetime.fromisoformat(oldest)).total_seconds(), 1) if oldest else 0.0,
+        'last_hour_failure_rate': round((recent['failed'] or 0) / finished, 4) if finished else 0.0,
+        'last_hour_retried': recent['retried'] or 0,
+        'last_hour_avg_ms': round(recent['avg_ms'] or 0.0, 1),
+        'worker': webhook_worker.stats(),
+    }
+
+
 @app.route('/razorpay/webhook', methods=['POST'])
 def razorpay_webhook():
     raw = request.get_data()
@@ -1787,18 +4082,81 @@ def razorpay_webhook():
     expected = hmac.new(secret.encode(), raw, hashlib.sha256).hexdigest()
     if not hmac.compare_digest(expected, provided):
         return 'signature-mismatch', 400
-    payload = request.get_json(force=True)
-    event = payload.get('event')
-    if event in ('payment.captured','order.paid'):
-        try:
-            rz_order_id = payload['payload']['order']['entity']['id']
-            conn = get_db()
-            conn.execute("UPDATE orders SET payment_status='paid' WHERE razorpay_order_id=?", (rz_order_id,))
-            conn.commit(); conn.close()
-        except Exception:
-            pass
+    payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict):
+        return 'invalid-payload', 400
+    # Redeliveries carry the same event id; fall back to the body hash without one
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(raw).hexdigest()
+    store_webhook_event(event_id, payload, raw.decode('utf-8'))
+    if WEBHOOK_WORKER == 'thread':
+        webhook_worker.start_background()
     return 'ok', 200
 
+
+def drain_webhook_events() -> int:
+    """Process queued inbox events inline until none are due; returns the count."""
+    handled = 0
+    while True:
+        batch = webhook_worker.run_once()
+        if not batch:
+            return handled
+        handled += batch
+
+
+@app.cli.command('run-webhook-worker')
+@click.option('--once', is_flag=True, help='Drain the inbox once and exit')
+def run_webhook_worker_command(once):
+    """Process queued Razorpay webhook events."""
+    init_db()
+    if once:
+        handled = drain_webhook_events()
+        print(f'[WEBHOOK] Processed {handled} event(s): {webhook_stats()}')
+        return
+    print('[WEBHOOK] Draining webhook_events; Ctrl+C to stop')
+    try:
+        webhook_worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.cli.command('replay-webhooks')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--requeue', is_flag=True, help='Process events already in the inbox again')
+def replay_webhooks_command(path, requeue):
+    """Replay a captured event log (NDJSON: the webhook_events export, or one
+    {"event_id": ..., "payload": {...}} per line) through the inbox.
+
+    Events are applied in (created_at, event_id) order of the Razorpay payload,
+    so the same log always gives the same result.
+    """
+    init_db()
+    events = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            payload = record['payload']
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            event_id = record.get('event_id') or hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+            events.append((payload.get('created_at') or 0, event_id, payload))
+    events.sort(key=lambda e: (e[0], e[1]))
+    conn = get_db()
+    added = sum(store_webhook_event(event_id, payload, conn=conn) for _, event_id, payload in events)
+    if requeue:
+        event_ids = [event_id for _, event_id, _ in events]
+        for i in range(0, len(event_ids), 500):
+            chunk = event_ids[i:i + 500]
+            conn.execute(
+                f"UPDATE webhook_events SET status='queued', attempts=0, error=NULL, available_at=? "
+                f"WHERE event_id IN ({','.join('?' * len(chunk))})", [time.time(), *chunk]
+            )
+    conn.commit()
+    conn.close()
+    handled = drain_webhook_events()
+    print(f'[WEBHOOK] {len(events)} event(s) in log, {added} new, {handled} processed: {webhook_events.counts()}')
+
 ########################
 # User Authentication Routes
 ########################
@@ -1864,6 +4222,7 @@ def user_login():
         conn.close()
         
         if user and check_password_hash(user['password_hash'], password):
+            regenerate_session()
             session.permanent = True
             session['user_logged_in'] = True
             session['user_id'] = user['id']
@@ -1880,6 +4239,7 @@ def user_login():
 
 @app.route('/user/logout')
 def user_logout():
+    regenerate_session()
     session.pop('user_logged_in', None)
     session.pop('user_id', None)
     session.pop('user_email', None)
@@ -1957,6 +4317,13 @@ def admin_diagnose():
         cur.execute('SELECT id, username FROM admin_users')
         admin_users = [dict(row) for row in cur.fetchall()]
     
+    db_settings = {
+        'profile': DB_PROFILE,
+        'expected': DB_PROFILES[DB_PROFILE],
+        'active': read_db_pragmas(conn),
+        'mismatches': check_db_profile(conn),
+        'foreign_keys': bool(conn.execute('PRAGMA foreign_keys').fetchone()[0]),
+    }
     conn.close()
     
     env_password = os.environ.get('ADMIN_DEFAULT_PASSWORD', 'NOT SET')
@@ -1967,7 +4334,17 @@ def admin_diagnose():
         'admin_default_password_set': env_password != 'NOT SET',
         'env_password_value': env_password,
         'db_path': DB_PATH,
-        'db_exists': os.path.exists(DB_PATH)
+        'db_exists': os.path.exists(DB_PATH),
+        'db_pool': db_pool.stats(),
+        'db_settings': db_settings,
+        'site_cache': site_cache.stats(),
+        'page_cache': page_cache.stats(),
+        'image_jobs': {**image_jobs.counts(), 'worker': image_worker.stats()},
+        'razorpay': {'configured': client is not None, 'breaker': razorpay_breaker.stats()},
+        'webhook_events': webhook_stats(),
+        'sessions': {'backend': SESSION_BACKEND, **server_sessions.stats()},
+        'newsletter_outbox': {**newsletter_outbox_counts(), 'brevo_configured': brevo_configured(),
+                              'breaker': brevo_breaker.stats()},
     }
 
 
@@ -2001,6 +4378,7 @@ def admin_login():
         try:
             if check_password_hash(admin['password_hash'], password):
                 print(f"[DEBUG LOGIN] ✅ Password verification successful for '{username}'")
+                regenerate_session()
                 session.permanent = True
                 session['admin_logged_in'] = True
                 session['admin_username'] = username
@@ -2021,6 +4399,7 @@ def admin_login():
 
 @app.route('/admin/logout')
 def admin_logout():
+    regenerate_session()
     session.pop('admin_logged_in', None)
     session.pop('admin_username', None)  # Clear username from session
     flash('Logged out', 'success')
@@ -2042,73 +4421,129 @@ def admin_dashboard():
     return render_template('admin_dashboard.html', stats=stats)
 
 
+ADMIN_PRODUCTS_PER_PAGE = 50
+ADMIN_PRODUCT_CATEGORIES = ['Products', 'Gut Care', 'Seasonal', 'Gut Feast', 'Corporate', 'Gifts']
+
+# Sort options of the admin product list: key -> (label, ORDER BY)
+ADMIN_PRODUCT_SORTS = {
+    'new': ('Newest first', 'p.id DESC'),
+    'old': ('Oldest first', 'p.id ASC'),
+    'name': ('Name A-Z', 'py_lower(p.name) ASC, p.id DESC'),
+    'price_low': ('Price: low to high', 'COALESCE(p.price, 0) ASC, p.id DESC'),
+    'price_high': ('Price: high to low', 'COALESCE(p.price, 0) DESC, p.id DESC'),
+    'stock_low': ('Stock: low to high', 'COALESCE(p.stock, 0) ASC, p.id DESC'),
+    'status': ('Status', 'p.product_status ASC, p.id DESC'),
+}
+
+
+def admin_product_filters(search_query='', region_id='', category=''):
+    """WHERE conditions and params for the admin product list filters."""
+    where, params = [], []
+    if region_id:
+        # Mapped to the region, or available everywhere (no mappings)
+        where.append(SQL_PRODUCT_IN_REGION)
+        params.append(region_id)
+    if category:
+        # Case-insensitive to support legacy capitalized values
+        where.append('LOWER(p.category) = LOWER(?)')
+        params.append(category)
+    if search_query:
+        search_filters(search_query, where, params, ranked=False)
+    return where, params
+
+
+def count_admin_products(where, params, cache_key=None):
+    """COUNT(*) of the filtered list. With cache_key the count is kept until the
+    catalog or regions change (only used for the finite, non-search filters)."""
+    where_sql = ' AND '.join(where) if where else '1'
+
+    def load():
+        conn = get_db()
+        total = conn.execute(f'SELECT COUNT(*) FROM products p WHERE {where_sql}', params).fetchone()[0]
+        conn.close()
+        return total
+
+    if cache_key is None:
+        return load()
+    return site_cache.get(cache_key, ('catalog', 'regions'), load)
+
+
+def fetch_product_regions(product_ids):
+    """Regions mapped to each of product_ids, in one query: {product_id: [rows]}."""
+    if not product_ids:
+        return {}
+    conn = get_db()
+    rows = conn.execute(
+        f'''SELECT pr.product_id, r.id, r.name FROM product_regions pr JOIN regions r ON r.id = pr.region_id
+            WHERE pr.product_id IN ({','.join('?' * len(product_ids))}) ORDER BY r.name''',
+        list(product_ids)
+    ).fetchall()
+    conn.close()
+    regions = {}
+    for row in rows:
+        regions.setdefault(row['product_id'], []).append(row)
+    return regions
+
+
+def admin_product_listing(search_query='', region_id='', category='', sort='new', page=1,
+                          per_page=ADMIN_PRODUCTS_PER_PAGE):
+    """One page of the admin product list with each product's regions.
+    Returns dict with products ([{'product', 'regions'}]), total_products,
+    total_pages and page (clamped to the last page).
+    """
+    where, params = admin_product_filters(search_query, region_id, category)
+    cache_key = None if search_query else f'admin_products_count:{region_id}:{category.lower()}'
+    total = count_admin_products(where, params, cache_key)
+    total_pages = (total + per_page - 1) // per_page
+    page = max(1, min(page, total_pages or 1))
+    where_sql = ' AND '.join(where) if where else '1'
+    order_sql = ADMIN_PRODUCT_SORTS.get(sort, ADMIN_PRODUCT_SORTS['new'])[1]
+    conn = get_db()
+    products = conn.execute(
+        f'SELECT p.* FROM products p WHERE {where_sql} ORDER BY {order_sql} LIMIT ? OFFSET ?',
+        [*params, per_page, (page - 1) * per_page]
+    ).fetchall()
+    conn.close()
+    regions = fetch_product_regions([p['id'] for p in products])
+    return {
+        'products': [{'product': p, 'regions': regions.get(p['id'], [])} for p in products],
+        'total_products': total,
+        'total_pages': total_pages,
+        'page': page,
+    }
+
+
 @app.route('/admin/products')
 def admin_products():
     if not is_admin():
         return redirect(url_for('admin_login'))
-    
-    conn = get_db()
-    conn.row_factory = sqlite3.Row
-    
-    # Get all regions for filter dropdown
-    regions = conn.execute('SELECT id, name FROM regions ORDER BY name').fetchall()
-    
+
+    regions, _ = site_cache.get('regions', ('regions',), _load_regions)
+
     # Get filter parameters from request
     search_query = request.args.get('search', '').strip()
     selected_region = request.args.get('region', '')
     selected_category = request.args.get('category', '')
-    
-    # Build query based on filters
-    query = 'SELECT DISTINCT p.* FROM products p'
-    params = []
-    where_clauses = []
-    
-    # Add region filter if selected
-    if selected_region:
-        query += ' LEFT JOIN product_regions pr ON p.id = pr.product_id'
-        where_clauses.append('(pr.region_id = ? OR pr.region_id IS NULL)')
-        params.append(selected_region)
-    
-    # Add category filter if selected (case-insensitive to support legacy capitalized values)
-    if selected_category:
-        where_clauses.append('LOWER(p.category) = LOWER(?)')
-        params.append(selected_category)
-    
-    # Add search filter if provided
-    if search_query:
-        where_clauses.append('(p.name LIKE ? OR p.description LIKE ?)')
-        params.append(f'%{search_query}%')
-        params.append(f'%{search_query}%')
-    
-    # Combine where clauses
-    if where_clauses:
-        query += ' WHERE ' + ' AND '.join(where_clauses)
-    
-    query += ' ORDER BY p.id DESC'
-    
-    products = conn.execute(query, params).fetchall()
-    
-    # For each product, get its regions
-    products_with_regions = []
-    for product in products:
-        product_regions = conn.execute(
-            'SELECT r.id, r.name FROM regions r JOIN product_regions pr ON r.id = pr.region_id WHERE pr.product_id = ? ORDER BY r.name',
-            [product['id']]
-        ).fetchall()
-        products_with_regions.append({
-            'product': product,
-            'regions': product_regions
-        })
-    
-    conn.close()
-    
-    # Available categories (support both legacy capitalized and new lowercase values via LOWER() filter below)
-    categories = ['Products', 'Gut Care', 'Seasonal', 'Gut Feast', 'Corporate', 'Gifts']
-    
-    return render_template('admin_products.html', 
-                         products=products_with_regions, 
+    sort = request.args.get('sort', 'new')
+    if sort not in ADMIN_PRODUCT_SORTS:
+        sort = 'new'
+    page = request.args.get('page', 1, type=int)
+
+    listing = admin_product_listing(search_query, selected_region, selected_category, sort, page)
+    # Current filters, repeated in the sort and pagination links
+    filter_args = {k: v for k, v in (('search', search_query), ('region', selected_region),
+                                     ('category', selected_category)) if v}
+
+    return render_template('admin_products.html',
+                         products=listing['products'],
+                         total_products=listing['total_products'],
+                         total_pages=listing['total_pages'],
+                         current_page=listing['page'],
                          regions=regions,
-                         categories=categories,
+                         categories=ADMIN_PRODUCT_CATEGORIES,
+                         sorts=ADMIN_PRODUCT_SORTS,
+                         sort=sort,
+                         filter_args=filter_args,
                          search_query=search_query,
                          selected_region=selected_region,
                          selected_category=selected_category)
@@ -2194,24 +4629,13 @@ def admin_product_new():
         product_id = cursor.lastrowid
         conn.close()
 
-        # Save image and attach to product
+        # Queue the image; the worker attaches it to the product once encoded
         if 'image' in request.files and request.files['image'].filename != '':
-            file = request.files['image']
-            image_path = save_product_image(file, product_id)
-            if image_path:
-                conn = get_db()
-                conn.execute('UPDATE products SET image_path=? WHERE id=?', (image_path, product_id))
-                conn.commit(); conn.close()
+            queue_product_image(request.files['image'], product_id)
         
-        # Assign regions - if 'all' was selected, assign to all active regions
-        if 'all' in selected_regions:
-            conn = get_db()
-            all_regions = conn.execute(SQL_SELECT_REGION_ID_NAME_ORDERED).fetchall()
-            conn.close()
-            all_region_ids = [str(r['id']) for r in all_regions]
-            set_product_regions(product_id, all_region_ids)
-        else:
-            set_product_regions(product_id, selected_regions)
+        # Assign regions - 'all' means no mappings (available everywhere, including regions added later)
+        set_product_regions(product_id, selected_regions)
+        bump_cache_version('catalog')
         
         flash('Product created successfully', 'success')
         return redirect(url_for('admin_products'))
@@ -2265,13 +4689,9 @@ def admin_product_edit(pid):
         if not selected_regions:
             selected_regions = ['all']
         
-        # If 'all' was selected, assign to all active regions
-        if 'all' in selected_regions:
-            all_regions = conn.execute(SQL_SELECT_REGION_ID_NAME_ORDERED).fetchall()
-            all_region_ids = [str(r['id']) for r in all_regions]
-            set_product_regions(pid, all_region_ids)
-        else:
-            set_product_regions(pid, selected_regions)
+        # 'all' means no mappings (available everywhere, including regions added later)
+        set_product_regions(pid, selected_regions)
+        bump_cache_version('catalog')
         
         flash('Product updated', 'success')
         return redirect(url_for('admin_products'))
@@ -2291,20 +4711,136 @@ def admin_product_delete(pid):
     if not is_admin():
         return redirect(url_for('admin_login'))
     conn = get_db()
-    conn.execute('DELETE FROM products WHERE id=?', (pid,))
-    conn.commit(); conn.close()
+    product = conn.execute('SELECT image_path FROM products WHERE id=?', (pid,)).fetchone()
+    gallery = conn.execute('SELECT image_path FROM product_images WHERE product_id=?', (pid,)).fetchall()
+    try:
+        # Gallery images, regions and reviews go with it (ON DELETE CASCADE)
+        conn.execute('DELETE FROM products WHERE id=?', (pid,))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        # order_items keeps its product reference for order history
+        conn.rollback(); conn.close()
+        flash('This product has orders and cannot be deleted; set its stock to 0 instead', 'error')
+        return redirect(url_for('admin_products'))
+    conn.close()
+    bump_cache_version('catalog')
+    if product:
+        release_image(product['image_path'])
+    for image in gallery:
+        release_image(image['image_path'])
     flash('Product deleted', 'success')
     return redirect(url_for('admin_products'))
 
 
+ADMIN_ORDERS_PER_PAGE = 50
+ORDER_PAYMENT_STATUSES = ['pending', 'paid', 'failed', 'expired']
+
+
+def admin_order_filters(args):
+    """WHERE conditions, params and the cleaned filter values for the order browser."""
+    filters = {key: (args.get(key) or '').strip() for key in ('status', 'date_from', 'date_to', 'city', 'pincode', 'email')}
+    where, params = [], []
+    if filters['status'] in ORDER_PAYMENT_STATUSES:
+        where.append('o.payment_status = ?')
+        params.append(filters['status'])
+    else:
+        filters['status'] = ''
+    # created_at is an ISO timestamp, so dates compare as text prefixes
+    for key, op in (('date_from', '>='), ('date_to', '<')):
+        try:
+            day = datetime.strptime(filters[key], '%Y-%m-%d')
+        except ValueError:
+            filters[key] = ''
+            continue
+        if key == 'date_to':
+            day += timedelta(days=1)
+        where.append(f'o.created_at {op} ?')
+        params.append(day.strftime('%Y-%m-%d'))
+    if filters['city']:
+        where.append('o.city = ? COLLATE NOCASE')
+        params.append(filters['city'])
+    if filters['pincode']:
+        where.append('o.pincode = ?')
+        params.append(filters['pincode'])
+    if filters['email']:
+        where.append('o.email = ?')
+        params.append(filters['email'])
+    return where, params, filters
+
+
+def fetch_order_items(order_ids):
+    """Items of every order in order_ids, in one query: {order_id: [rows]}."""
+    if not order_ids:
+        return {}
+    conn = get_db()
+    rows = conn.execute(
+        f'''SELECT oi.order_id, oi.product_id, oi.quantity, oi.unit_price, p.name AS product_name
+            FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id
+            WHERE oi.order_id IN ({','.join('?' * len(order_ids))}) ORDER BY oi.order_id, oi.id''',
+        list(order_ids)
+    ).fetchall()
+    conn.close()
+    items = {}
+    for row in rows:
+        items.setdefault(row['order_id'], []).append(row)
+    return items
+
+
+def admin_order_page(where, params, before=None, after=None, per_page=ADMIN_ORDERS_PER_PAGE):
+    """Keyset page of orders, newest first: the per_page orders with id < before,
+    or, going back, the per_page orders just above after. Never uses OFFSET, so
+    every page costs the same however deep it is.
+    Returns dict with orders, has_older and has_newer.
+    """
+    where = list(where)
+    params = list(params)
+    if after is not None:
+        where.append('o.id > ?')
+        params.append(after)
+        order_sql = 'o.id ASC'
+    else:
+        if before is not None:
+            where.append('o.id < ?')
+            params.append(before)
+        order_sql = 'o.id DESC'
+    where_sql = ' AND '.join(where) if where else '1'
+    conn = get_db()
+    orders = conn.execute(
+        f'SELECT o.* FROM orders o WHERE {where_sql} ORDER BY {order_sql} LIMIT ?',
+        [*params, per_page + 1]
+    ).fetchall()
+    conn.close()
+    has_more = len(orders) > per_page
+    orders = orders[:per_page]
+    if after is not None:
+        if not has_more:
+            # Reached the newest orders: show a full first page instead
+            return admin_order_page(where[:-1], params[:-1], per_page=per_page)
+        orders.reverse()
+        has_older, has_newer = True, has_more
+    else:
+        has_older, has_newer = has_more, before is not None
+    return {'orders': orders, 'has_older': has_older and bool(orders), 'has_newer': has_newer and bool(orders)}
+
+
 @app.route('/admin/orders')
 def admin_orders():
     if not is_admin():
         return redirect(url_for('admin_login'))
-    conn = get_db()
-    orders = conn.execute('SELECT * FROM orders ORDER BY id DESC').fetchall()
-    conn.close()
-    return render_template('admin_orders.html', orders=orders)
+    where, params, filters = admin_order_filters(request.args)
+    page = admin_order_page(where, params,
+                            before=request.args.get('before', type=int),
+                            after=request.args.get('after', type=int))
+    items = fetch_order_items([o['id'] for o in page['orders']])
+    filter_args = {k: v for k, v in filters.items() if v}
+    return render_template('admin_orders.html',
+                           orders=page['orders'],
+                           order_items=items,
+                           has_older=page['has_older'],
+                           has_newer=page['has_newer'],
+                           filters=filters,
+                           filter_args=filter_args,
+                           statuses=ORDER_PAYMENT_STATUSES)
 
 
 @app.route('/admin/subscribers')
@@ -2312,9 +4848,11 @@ def admin_subscribers():
     if not is_admin():
         return redirect(url_for('admin_login'))
     conn = get_db()
-    subs = conn.execute('SELECT * FROM newsletter_subscribers ORDER BY id DESC').fetchall()
+    subs = conn.execute('SELECT s.*, o.status AS sync_status, o.error AS sync_error FROM newsletter_subscribers s '
+                        'LEFT JOIN newsletter_outbox o ON o.subscriber_id = s.id ORDER BY s.id DESC').fetchall()
     conn.close()
-    return render_template('admin_subscribers.html', subscribers=subs)
+    return render_template('admin_subscribers.html', subscribers=subs,
+                           sync_counts=newsletter_outbox_counts() if brevo_configured() else None)
 
 
 @app.route('/admin/catalog-images')
@@ -2367,7 +4905,7 @@ def admin_catalog_images_upload():
         
         if count >= 4:
             flash('Maximum 4 images allowed per region', 'error')
-            os.remove(os.path.join('static', image_path))
+            release_image(image_path)
             conn.close()
             return redirect(url_for('admin_catalog_images'))
         
@@ -2377,8 +4915,11 @@ def admin_catalog_images_upload():
             (region, next_position, image_path, alt_text, datetime.now().isoformat(), datetime.now().isoformat())
         )
         conn.commit()
+        bump_cache_version('catalog_images')
         flash(f'Image #{next_position} added to {region.capitalize()} region', 'success')
     except Exception as e:
+        conn.rollback()
+        release_image(image_path)
         flash(f'Error saving image: {str(e)}', 'error')
     finally:
         conn.close()
@@ -2400,14 +4941,10 @@ def admin_catalog_images_delete(region, position):
         image_data = conn.execute('SELECT image_path FROM catalog_images WHERE region=? AND position=?', (region, position)).fetchone()
         if image_data:
             image_path = image_data['image_path']
-            filepath = os.path.join('static', image_path)
-            if os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                except OSError:
-                    pass
             conn.execute('DELETE FROM catalog_images WHERE region=? AND position=?', (region, position))
             conn.commit()
+            bump_cache_version('catalog_images')
+            release_image(image_path)
             flash(f'Image deleted from {region.capitalize()} region', 'success')
         else:
             flash('Image not found', 'error')
@@ -2419,6 +4956,29 @@ def admin_catalog_images_delete(region, position):
     return redirect(url_for('admin_catalog_images'))
 
 
+@app.route('/admin/image-jobs')
+def admin_image_jobs():
+    if not is_admin():
+        return redirect(url_for('admin_login'))
+    return render_template('admin_image_jobs.html',
+                           counts=image_jobs.counts(),
+                           jobs=image_jobs.recent(100),
+                           worker=image_worker.stats(),
+                           worker_mode=IMAGE_WORKER)
+
+
+@app.post('/admin/image-jobs/retry')
+def admin_image_jobs_retry():
+    if not is_admin():
+        return redirect(url_for('admin_login'))
+    job_id = request.form.get('job_id', type=int)
+    retried = image_jobs.retry_failed([job_id] if job_id else None)
+    if IMAGE_WORKER == 'thread':
+        image_worker.start_background()
+    flash(f'Requeued {retried} failed job(s)', 'success')
+    return redirect(url_for('admin_image_jobs'))
+
+
 @app.post('/admin/subscribers/<int:sid>/delete')
 def admin_subscriber_delete(sid):
     if not is_admin():
@@ -2430,25 +4990,96 @@ def admin_subscriber_delete(sid):
     return redirect(url_for('admin_subscribers'))
 
 
+# ==========================
+# Data exports
+# ==========================
+
+# name -> download filename, SELECT (WHERE filled in by the route), CSV
+# columns, and for NDJSON the child columns nested under 'items'
+EXPORTS = {
+    'subscribers': {
+        'filename': 'newsletter_subscribers',
+        'sql': 'SELECT id, email, created_at FROM newsletter_subscribers WHERE {where} ORDER BY id DESC',
+        'columns': ['email', 'created_at'],
+    },
+    'orders': {
+        'filename': 'orders',
+        'sql': '''SELECT o.id AS order_id, o.created_at, o.payment_status, o.customer_name, o.email, o.phone,
+                         o.address, o.city, o.pincode, o.total_amount, o.razorpay_order_id,
+                         o.estimated_delivery_date, oi.product_id, p.name AS product_name, oi.quantity, oi.unit_price
+                  FROM orders o
+                  LEFT JOIN order_items oi ON oi.order_id = o.id
+                  LEFT JOIN products p ON p.id = oi.product_id
+                  WHERE {where} ORDER BY o.id DESC, oi.id''',
+        'columns': ['order_id', 'created_at', 'payment_status', 'customer_name', 'email', 'phone', 'address',
+                    'city', 'pincode', 'total_amount', 'razorpay_order_id', 'estimated_delivery_date',
+                    'product_id', 'product_name', 'quantity', 'unit_price'],
+        'group_by': 'order_id',
+        'items': ['product_id', 'product_name', 'quantity', 'unit_price'],
+    },
+    'reviews': {
+        'filename': 'product_reviews',
+        'sql': '''SELECT r.id, r.product_id, p.name AS product_name, r.user_id, u.email AS user_email, r.rating,
+                         r.title, r.body, r.verified_purchase, r.helpful_count, r.is_approved, r.created_at
+                  FROM product_reviews r
+                  LEFT JOIN products p ON p.id = r.product_id
+                  LEFT JOIN users u ON u.id = r.user_id
+                  WHERE {where} ORDER BY r.id DESC''',
+        'columns': ['id', 'product_id', 'product_name', 'user_id', 'user_email', 'rating', 'title', 'body',
+                    'verified_purchase', 'helpful_count', 'is_approved', 'created_at'],
+    },
+    'webhook_events': {
+        'filename': 'webhook_events',
+        'sql': '''SELECT id, event_id, json_extract(payload, '$.event') AS event, status, attempts, error,
+                         created_at, finished_at, payload
+                  FROM webhook_events WHERE {where} ORDER BY id''',
+        'columns': ['event_id', 'event', 'status', 'attempts', 'error', 'created_at', 'finished_at', 'payload'],
+    },
+    'contact_messages': {
+        'filename': 'contact_messages',
+        'sql': 'SELECT id, name, email, subject, message, created_at FROM contact_messages WHERE {where} ORDER BY id DESC',
+        'columns': ['id', 'name', 'email', 'subject', 'message', 'created_at'],
+    },
+}
+
+
+def export_response(name, fmt='csv', compress=False, where=None, params=()):
+    """Stream export name as fmt straight from the cursor (gzip file if compress)."""
+    spec = EXPORTS[name]
+    conn = get_db()
+    cursor = conn.execute(spec['sql'].format(where=' AND '.join(where) if where else '1'), params)
+    records = iter_cursor(cursor)
+    if fmt == 'ndjson' and spec.get('group_by'):
+        records = group_rows(records, spec['group_by'], 'items', spec['items'])
+    chunks = export_stream(records, fmt, spec['columns'], compress=compress)
+    filename = f"{spec['filename']}.{fmt}{'.gz' if compress else ''}"
+    response = app.response_class(stream_with_context(chunks),
+                                  mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.get('/admin/export/<name>.<fmt>')
+def admin_export(name, fmt):
+    """Download a table as CSV or NDJSON; ?gzip=1 compresses the stream.
+    The orders export accepts the order browser filters."""
+    if not is_admin():
+        return redirect(url_for('admin_login'))
+    if name not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    where, params = [], []
+    if name == 'orders':
+        where, params, _ = admin_order_filters(request.args)
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    return export_response(name, fmt, compress, where, params)
+
+
 @app.get('/admin/subscribers/export')
 def admin_subscribers_export():
     if not is_admin():
         return redirect(url_for('admin_login'))
-    conn = get_db()
-    rows = conn.execute('SELECT email, created_at FROM newsletter_subscribers ORDER BY id DESC').fetchall()
-    conn.close()
-    # Build CSV
-    csv_lines = ['email,created_at']
-    for r in rows:
-        email = r['email'] or ''
-        created = r['created_at'] or ''
-        # escape commas minimally (not expecting commas in email)
-        csv_lines.append(f"{email},{created}")
-    csv_data = "\n".join(csv_lines)
-    return (csv_data, 200, {
-        'Content-Type': 'text/csv; charset=utf-8',
-        'Content-Disposition': 'attachment; filename="newsletter_subscribers.csv"'
-    })
+    return export_response('subscribers', 'csv')
 
 
 @app.route('/admin/order/<int:oid>/status', methods=['POST'])
@@ -2456,12 +5087,20 @@ def admin_order_status(oid):
     if not is_admin():
         return redirect(url_for('admin_login'))
     status = request.form.get('status')
+    if status not in ORDER_PAYMENT_STATUSES:
+        flash('Invalid order status', 'error')
+        return redirect(url_for('admin_orders'))
     est_date = request.form.get('estimated_delivery_date')
-    conn = get_db()
-    conn.execute('UPDATE orders SET payment_status=?, estimated_delivery_date=? WHERE id=?', (status, est_date, oid))
-    conn.commit(); conn.close()
-    flash('Order updated', 'success')
-    return redirect(url_for('admin_orders'))
+    oversold = set_order_status(oid, status, estimated_delivery_date=est_date)
+    if oversold:
+        flash(f"Order updated, but stock is now negative for: {', '.join(oversold)}", 'error')
+    else:
+        flash('Order updated', 'success')
+    # Back to the same filtered page of the order browser
+    return_to = request.form.get('return_to', '')
+    if not return_to.startswith('/admin/orders'):
+        return_to = url_for('admin_orders')
+    return redirect(return_to)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmarks
+
+Reproducible micro-benchmarks for the database and request paths in app.py.
+Every scenario runs against a throwaway database in a temporary directory,
+so it is safe to run next to a live store.db.
+
+Scenarios:
+- write-concurrency: parallel order/review/like writers plus catalog readers,
+  compared across database profiles (see DB_PROFILES in app.py)
+- search: product search latency, LIKE '%q%' scan vs the FTS5 index
+- page-cache: anonymous catalog page requests with the page cache off vs on
+- admin-products: admin product list, one region query per product vs one
+  paginated query plus one grouped region query
+- checkout: parallel checkouts racing for scarce stock; verifies nothing is
+  oversold and reports throughput
+- sessions: request overhead vs cart size, signed-cookie sessions vs the
+  SQLite session store (read-only and cart-updating requests)
+- community-likes: parallel like/unlike toggles on one hot post, COUNT(*)
+  recompute per click vs the +-1 counter; verifies the stored count
+
+Usage:
+    python benchmark.py write-concurrency
+    python benchmark.py write-concurrency --workers 8 --ops 200
+    python benchmark.py write-concurrency --profiles legacy wal
+    python benchmark.py search --sizes 10000 100000
+    python benchmark.py page-cache --requests 500
+    python benchmark.py admin-products --sizes 1000 5000 20000
+    python benchmark.py checkout --workers 8 --attempts 50 --stock 100
+    python benchmark.py sessions --cart-sizes 0 10 50 200
+    python benchmark.py community-likes --workers 8 --toggles 200 --existing 20000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('ADMIN_DEFAULT_PASSWORD', 'benchmark')
+
+
+def load_app(db_path, profile=None):
+    """Import app.py pointed at db_path (optionally with a given DB profile)."""
+    import app as store_app
+    store_app.DB_PATH = db_path
+    if profile:
+        store_app.DB_PROFILE = profile
+    store_app.db_pool.clear()
+    store_app.server_sessions.reset()
+    return store_app
+
+
+def create_database(db_path, products=200, profile=None):
+    """Create a schema-complete database seeded with synthetic products."""
+    store_app = load_app(db_path, profile)
+    store_app.init_db()
+    conn = store_app.get_db()
+    categories = ['Products', 'gutcare', 'gutfeast', 'seasonal', 'corporate', 'gifts']
+    conn.executemany(
+        'INSERT INTO products (name, description, price, stock, category, product_status, is_homepage) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [
+            (f'Product {i}', f'Organic item number {i} grown in Karnataka', float(10 + i % 90),
+             1000, categories[i % len(categories)], store_app.VALID_PRODUCT_STATUSES[i % 3], i % 2)
+            for i in range(products)
+        ]
+    )
+    conn.execute('INSERT INTO users (email, password_hash, full_name, created_at) VALUES (?, ?, ?, ?)',
+                 ('bench@example.com', 'x', 'Bench User', datetime.now().isoformat()))
+    conn.execute('INSERT INTO community_posts (user_id, title, body, created_at) VALUES (1, ?, ?, ?)',
+                 ('Hot post', 'Benchmark post', datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+    return store_app
+
+
+SEARCH_VOCABULARY = [
+    'organic', 'apple', 'banana', 'mango', 'turmeric', 'ginger', 'millet', 'ragi', 'jaggery', 'honey',
+    'kombucha', 'kefir', 'ghee', 'rice', 'basmati', 'dal', 'pepper', 'cardamom', 'coffee', 'tea',
+    'coconut', 'tamarind', 'spinach', 'tomato', 'onion', 'garlic', 'chilli', 'lemon', 'probiotic', 'pickle',
+]
+
+
+def seed_search_catalog(store_app, count, seed=42):
+    """Insert count products with random multi-word names and descriptions.
+
+    Besides the common SEARCH_VOCABULARY words, each text draws from a long tail
+    of synthetic brand/variety words so most queries are selective, as in a
+    real catalog.
+    """
+    rng = random.Random(seed)
+    syllables = ['ka', 'ra', 'mi', 'to', 'su', 'ne', 'lo', 'vi', 'da', 'po', 'shi', 'gu']
+    rare_words = sorted({''.join(rng.choice(syllables) for _ in range(3)) for _ in range(3000)})
+    words = lambda n: [rng.choice(SEARCH_VOCABULARY) if rng.random() < 0.5 else rng.choice(rare_words)
+                       for _ in range(n)]
+    conn = store_app.get_db()
+    batch = []
+    for i in range(count):
+        name = ' '.join(words(3)).title()
+        description = ' '.join(words(25))
+        batch.append((name, description, float(rng.randint(20, 900)), 10, 'Products', 'Final Product'))
+        if len(batch) == 5000:
+            conn.executemany('INSERT INTO products (name, description, price, stock, category, product_status) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO products (name, description, price, stock, category, product_status) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', batch)
+    conn.commit()
+    conn.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ==========================
+# write-concurrency
+# ==========================
+
+def _writer(args):
+    db_path, profile, ops, worker_id = args
+    store_app = load_app(db_path, profile)
+    latencies, errors = [], 0
+    for i in range(ops):
+        started = time.perf_counter()
+        conn = store_app.get_db()
+        try:
+            now = datetime.now().isoformat()
+            cur = conn.execute(
+                'INSERT INTO orders (customer_name, email, total_amount, payment_status, created_at) '
+                'VALUES (?, ?, ?, ?, ?)', (f'w{worker_id}', 'bench@example.com', 100.0, 'pending', now))
+            order_id = cur.lastrowid
+            conn.executemany('INSERT INTO order_items (order_id, product_id, quantity, unit_price) VALUES (?, ?, ?, ?)',
+                             [(order_id, (i + k) % 200 + 1, 1, 10.0) for k in range(3)])
+            conn.execute('INSERT INTO product_reviews (product_id, user_id, rating, body, created_at) VALUES (?, 1, 5, ?, ?)',
+                         (i % 200 + 1, 'benchmark review body', now))
+            conn.execute('UPDATE community_posts SET likes_count = likes_count + 1 WHERE id = 1')
+            conn.commit()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+        finally:
+            conn.close()
+    return latencies, errors
+
+
+def _reader(db_path, profile, stop, counter):
+    store_app = load_app(db_path, profile)
+    while not stop.is_set():
+        conn = store_app.get_db()
+        try:
+            conn.execute("SELECT * FROM products WHERE category = 'Products' ORDER BY id DESC").fetchall()
+            conn.execute('SELECT product_id, AVG(rating), COUNT(*) FROM product_reviews GROUP BY product_id').fetchall()
+            with counter.get_lock():
+                counter.value += 1
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+
+
+def bench_write_concurrency(args):
+    print(f"write-concurrency: {args.workers} writers x {args.ops} transactions, {args.readers} readers")
+    print(f"{'profile':<12} {'tx/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'locked':>7} {'reads':>7}")
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            create_database(db_path, profile=profile)
+            ctx = multiprocessing.get_context()
+            stop, reads = ctx.Event(), ctx.Value('i', 0)
+            readers = [ctx.Process(target=_reader, args=(db_path, profile, stop, reads)) for _ in range(args.readers)]
+            for proc in readers:
+                proc.start()
+            with ctx.Pool(args.workers) as pool:
+                started = time.perf_counter()
+                results = pool.map(_writer, [(db_path, profile, args.ops, w) for w in range(args.workers)])
+                elapsed = time.perf_counter() - started
+            stop.set()
+            for proc in readers:
+                proc.join()
+            latencies = [lat for lats, _ in results for lat in lats]
+            locked = sum(err for _, err in results)
+            print(f"{profile:<12} {len(latencies) / elapsed:>8.1f} {statistics.median(latencies) if latencies else 0:>8.2f} "
+                  f"{percentile(latencies, 95):>8.2f} {max(latencies) if latencies else 0:>8.2f} {locked:>7} {reads.value:>7}")
+
+
+# ==========================
+# search
+# ==========================
+
+def bench_search(args):
+    queries = ['kasumi', 'rami tosu', 'turmeric ginger', 'kombu', 'organic honey', 'zzz']
+    print(f"search: {len(queries)} queries x {args.repeat} runs, first page of results")
+    print(f"{'products':>9} {'engine':<6} {'p50 ms':>8} {'p95 ms':>8} {'hits':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            store_app = create_database(db_path, products=0)
+            seed_search_catalog(store_app, size)
+            store_app._search_fts_enabled = None
+            for engine in ('like', 'fts'):
+                latencies, hits = [], 0
+                for q in queries:
+                    for _ in range(args.repeat):
+                        where, params = store_app.catalog_filters()
+                        if engine == 'like':
+                            like = f'%{q}%'
+                            where.append('(p.name LIKE ? OR p.description LIKE ?)')
+                            params.extend([like, like])
+                            from_sql, order_by = 'products p', None
+                        else:
+                            from_sql = store_app.search_filters(q, where, params) or 'products p'
+                            order_by = store_app.SQL_SEARCH_RELEVANCE
+                        started = time.perf_counter()
+                        listing = store_app.fetch_product_listing(where, params, page=1, from_sql=from_sql, order_by=order_by)
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    hits += listing['total_products']
+                print(f"{size:>9} {engine:<6} {statistics.median(latencies):>8.2f} {percentile(latencies, 95):>8.2f} {hits:>8}")
+
+
+# ==========================
+# page-cache
+# ==========================
+
+def bench_page_cache(args):
+    paths = ['/', '/?sort=price_low', '/?page=2', '/category/gutcare', '/product/1', '/product/2']
+    print(f"page-cache: {args.requests} anonymous requests over {len(paths)} pages, {args.products} products")
+    print(f"{'cache':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        store_app = create_database(os.path.join(tmp, 'bench.db'), products=args.products)
+        store_app.page_cache.stamps = store_app.VersionStamps(os.path.join(tmp, 'stamps'))
+        client = store_app.app.test_client()
+        for label, ttl in (('off', 0), ('on', 60)):
+            store_app.page_cache.ttl = ttl
+            store_app.page_cache.clear()
+            latencies = []
+            started = time.perf_counter()
+            for i in range(args.requests):
+                t0 = time.perf_counter()
+                client.get(paths[i % len(paths)])
+                latencies.append((time.perf_counter() - t0) * 1000)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<6} {args.requests / elapsed:>8.1f} {statistics.median(latencies):>8.2f} "
+                  f"{percentile(latencies, 95):>8.2f}")
+        print(store_app.page_cache.stats())
+
+
+# ==========================
+# admin-products
+# ==========================
+
+def legacy_admin_products(store_app, region_id=''):
+    """The admin list before pagination: every product, then its regions one by one."""
+    conn = store_app.get_db()
+    query, params = 'SELECT DISTINCT p.* FROM products p', []
+    if region_id:
+        query += ' LEFT JOIN product_regions pr ON p.id = pr.product_id WHERE (pr.region_id = ? OR pr.region_id IS NULL)'
+        params.append(region_id)
+    products = conn.execute(query + ' ORDER BY p.id DESC', params).fetchall()
+    listing = [{'product': p, 'regions': conn.execute(
+        'SELECT r.id, r.name FROM regions r JOIN product_regions pr ON r.id = pr.region_id '
+        'WHERE pr.product_id = ? ORDER BY r.name', [p['id']]).fetchall()} for p in products]
+    conn.close()
+    return listing
+
+
+def bench_admin_products(args):
+    print(f"admin-products: {args.repeat} runs per variant, first page and region-filtered first page")
+    print(f"{'products':>9} {'variant':<10} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store_app = create_database(os.path.join(tmp, 'bench.db'), products=size)
+            store_app.site_cache.stamps = store_app.VersionStamps(os.path.join(tmp, 'stamps'))
+            conn = store_app.get_db()
+            region_ids = [r['id'] for r in conn.execute('SELECT id FROM regions').fetchall()]
+            rng = random.Random(7)
+            conn.executemany(store_app.SQL_INSERT_PRODUCT_REGION, [
+                (pid, rid) for pid in range(1, size + 1) for rid in rng.sample(region_ids, rng.randint(0, 3))
+            ])
+            conn.commit()
+            conn.close()
+            variants = {
+                'n+1': lambda region: legacy_admin_products(store_app, region),
+                'paginated': lambda region: store_app.admin_product_listing(region_id=region),
+            }
+            for label, fetch in variants.items():
+                latencies = []
+                for i in range(args.repeat):
+                    started = time.perf_counter()
+                    fetch(str(region_ids[0]) if i % 2 else '')
+                    latencies.append((time.perf_counter() - started) * 1000)
+                print(f"{size:>9} {label:<10} {statistics.median(latencies):>8.2f} {percentile(latencies, 95):>8.2f}")
+
+
+# ==========================
+# checkout
+# ==========================
+
+def _checkout_worker(args):
+    db_path, stamp_dir, attempts, worker_id = args
+    store_app = load_app(db_path)
+    store_app.cache_stamps.directory = stamp_dir
+    rng = random.Random(worker_id)
+    placed, units, rejected, busy, latencies = 0, 0, 0, 0, []
+    for _ in range(attempts):
+        qty = rng.randint(1, 3)
+        cart = [{'id': 1, 'name': 'Hot item', 'price': 1.0, 'quantity': qty},
+                {'id': rng.randint(2, 20), 'name': 'Other', 'price': 1.0, 'quantity': 1}]
+        started = time.perf_counter()
+        try:
+            store_app.place_order(cart, {'name': f'w{worker_id}', 'email': 'bench@example.com'})
+            placed += 1
+            units += qty
+        except store_app.CheckoutError:
+            rejected += 1
+        except sqlite3.OperationalError:
+            busy += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    return placed, units, rejected, busy, latencies
+
+
+def bench_checkout(args):
+    print(f"checkout: {args.workers} workers x {args.attempts} checkouts of 1-3 units, hot item stock {args.stock}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        store_app = create_database(db_path, products=20)
+        conn = store_app.get_db()
+        conn.execute('UPDATE products SET stock = ? WHERE id = 1', (args.stock,))
+        conn.commit()
+        conn.close()
+        stamp_dir = os.path.join(tmp, 'stamps')
+        os.makedirs(stamp_dir)
+        ctx = multiprocessing.get_context()
+        with ctx.Pool(args.workers) as pool:
+            started = time.perf_counter()
+            results = pool.map(_checkout_worker, [(db_path, stamp_dir, args.attempts, w) for w in range(args.workers)])
+            elapsed = time.perf_counter() - started
+        placed, units, rejected, busy = (sum(r[i] for r in results) for i in range(4))
+        latencies = [lat for r in results for lat in r[4]]
+        conn = store_app.get_db()
+        final_stock = conn.execute('SELECT stock FROM products WHERE id = 1').fetchone()[0]
+        ordered = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = 1').fetchone()[0]
+        conn.close()
+        print(f"orders placed {placed}, rejected (out of stock) {rejected}, busy {busy}")
+        print(f"{placed / elapsed:.1f} orders/s, p50 {statistics.median(latencies):.2f} ms, p95 {percentile(latencies, 95):.2f} ms")
+        print(f"hot item: stock {args.stock} -> {final_stock}, units ordered {ordered} (placed {units})")
+        consistent = final_stock >= 0 and ordered == units == args.stock - final_stock
+        print('OK: no oversell' if consistent else 'FAIL: stock and orders disagree')
+
+
+# ==========================
+# sessions
+# ==========================
+
+def bench_sessions(args):
+    print(f"sessions: {args.requests} requests per cart size; read = GET /robots.txt, write = GET /add_to_cart/1")
+    print(f"{'backend':<8} {'items':>6} {'cookie B':>9} {'read p50':>9} {'read p95':>9} {'write p50':>10} {'write p95':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        store_app = create_database(os.path.join(tmp, 'bench.db'), products=max(args.cart_sizes + [1]))
+        store_app.page_cache.stamps = store_app.VersionStamps(os.path.join(tmp, 'stamps'))
+        backends = (('cookie', store_app.SecureCookieSessionInterface()), ('sqlite', store_app.server_sessions))
+        for label, interface in backends:
+            store_app.app.session_interface = interface
+            for size in args.cart_sizes:
+                client = store_app.app.test_client()
+                with client.session_transaction() as sess:
+                    sess['region_id'] = '1'
+                    sess['cart'] = [{'id': i, 'name': f'Product {i} organic', 'price': 10.0 + i, 'quantity': 1}
+                                    for i in range(1, size + 1)]
+                cookie = client.get_cookie('session')
+                timings = {}
+                for kind, path in (('read', '/robots.txt'), ('write', '/add_to_cart/1')):
+                    latencies = []
+                    for _ in range(args.requests):
+                        t0 = time.perf_counter()
+                        client.get(path)
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                    timings[kind] = latencies
+                print(f"{label:<8} {size:>6} {len(cookie.value) if cookie else 0:>9} "
+                      f"{statistics.median(timings['read']):>9.2f} {percentile(timings['read'], 95):>9.2f} "
+                      f"{statistics.median(timings['write']):>10.2f} {percentile(timings['write'], 95):>10.2f}")
+        print(store_app.server_sessions.stats())
+
+
+# ==========================
+# community-likes
+# ==========================
+
+def legacy_toggle_like(store_app, post_id, user_id):
+    """The like route before incremental counters: check, write, recount, read back."""
+    conn = store_app.get_db()
+    try:
+        liked = conn.execute('SELECT id FROM community_likes WHERE post_id = ? AND user_id = ?',
+                             (post_id, user_id)).fetchone()
+        if liked:
+            conn.execute('DELETE FROM community_likes WHERE post_id = ? AND user_id = ?', (post_id, user_id))
+        else:
+            conn.execute('INSERT INTO community_likes (post_id, user_id, created_at) VALUES (?, ?, ?)',
+                         (post_id, user_id, datetime.now().isoformat()))
+        conn.execute('UPDATE community_posts SET likes_count = (SELECT COUNT(*) FROM community_likes WHERE post_id = ?) '
+                     'WHERE id = ?', (post_id, post_id))
+        conn.commit()
+        count = conn.execute('SELECT likes_count FROM community_posts WHERE id = ?', (post_id,)).fetchone()[0]
+        return not liked, count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _like_worker(args):
+    db_path, variant, toggles, user_ids = args
+    store_app = load_app(db_path)
+    toggle = (lambda uid: legacy_toggle_like(store_app, 1, uid)) if variant == 'recompute' \
+        else (lambda uid: store_app.toggle_community_like('post', 1, uid))
+    rng = random.Random(user_ids[0])
+    done, busy, latencies = 0, 0, []
+    for _ in range(toggles):
+        started = time.perf_counter()
+        try:
+            toggle(rng.choice(user_ids))
+            done += 1
+        except sqlite3.OperationalError:
+            busy += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    return done, busy, latencies
+
+
+def bench_community_likes(args):
+    print(f"community-likes: {args.workers} workers x {args.toggles} toggles on one post "
+          f"with {args.existing} existing likes, {args.users} users per worker")
+    print(f"{'variant':<10} {'toggles/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'busy':>5} {'stored':>8} {'actual':>8}")
+    for variant in ('recompute', 'counter'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            store_app = create_database(db_path, products=20)
+            total_users = args.existing + args.workers * args.users
+            conn = store_app.get_db()
+            conn.executemany('INSERT INTO users (email, password_hash, full_name) VALUES (?, ?, ?)',
+                             [(f'liker{i}@example.com', 'x', f'Liker {i}') for i in range(total_users)])
+            conn.execute('INSERT INTO community_likes (post_id, user_id) SELECT 1, id FROM users WHERE id > 1 LIMIT ?',
+                          (args.existing,))
+            conn.execute('UPDATE community_posts SET likes_count = ? WHERE id = 1', (args.existing,))
+            conn.commit()
+            conn.close()
+            first = args.existing + 2
+            jobs = [(db_path, variant, args.toggles,
+                     list(range(first + w * args.users, first + (w + 1) * args.users))) for w in range(args.workers)]
+            with multiprocessing.get_context().Pool(args.workers) as pool:
+                started = time.perf_counter()
+                results = pool.map(_like_worker, jobs)
+                elapsed = time.perf_counter() - started
+            done, busy = sum(r[0] for r in results), sum(r[1] for r in results)
+            latencies = [lat for r in results for lat in r[2]]
+            conn = store_app.get_db()
+            stored = conn.execute('SELECT likes_count FROM community_posts WHERE id = 1').fetchone()[0]
+            actual = conn.execute('SELECT COUNT(*) FROM community_likes WHERE post_id = 1').fetchone()[0]
+            conn.close()
+            print(f"{variant:<10} {done / elapsed:>10.1f} {statistics.median(latencies):>8.2f} "
+                  f"{percentile(latencies, 95):>8.2f} {busy:>5} {stored:>8} {actual:>8}")
+            if stored != actual:
+                print(f'FAIL: {variant} stored count drifted from the likes table')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Performance benchmarks for the store',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest='scenario', required=True)
+
+    p = sub.add_parser('write-concurrency', help='Parallel writers under each database profile')
+    p.add_argument('--workers', type=int, default=6, help='Concurrent writer processes (default: 6)')
+    p.add_argument('--readers', type=int, default=2, help='Concurrent reader processes (default: 2)')
+    p.add_argument('--ops', type=int, default=150, help='Transactions per writer (default: 150)')
+    p.add_argument('--profiles', nargs='+', default=['legacy', 'wal'], help='Profiles to compare')
+    p.set_defaults(func=bench_write_concurrency)
+
+    p = sub.add_parser('search', help='Search latency: LIKE scan vs FTS5 index')
+    p.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Catalog sizes to test')
+    p.add_argument('--repeat', type=int, default=5, help='Runs per query (default: 5)')
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser('page-cache', help='Catalog page latency with the page cache off vs on')
+    p.add_argument('--requests', type=int, default=500, help='Requests per run (default: 500)')
+    p.add_argument('--products', type=int, default=2000, help='Catalog size (default: 2000)')
+    p.set_defaults(func=bench_page_cache)
+
+    p = sub.add_parser('admin-products', help='Admin product list latency vs catalog size')
+    p.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000], help='Catalog sizes to test')
+    p.add_argument('--repeat', type=int, default=10, help='Runs per variant (default: 10)')
+    p.set_defaults(func=bench_admin_products)
+
+    p = sub.add_parser('checkout', help='Parallel checkouts racing for scarce stock (oversell check)')
+    p.add_argument('--workers', type=int, default=8, help='Concurrent checkout processes (default: 8)')
+    p.add_argument('--attempts', type=int, default=50, help='Checkouts per worker (default: 50)')
+    p.add_argument('--stock', type=int, default=100, help='Initial stock of the contested product (default: 100)')
+    p.set_defaults(func=bench_checkout)
+
+    p = sub.add_parser('sessions', help='Request overhead vs cart size: cookie vs SQLite sessions')
+    p.add_argument('--cart-sizes', type=int, nargs='+', default=[0, 10, 50, 200], help='Cart items to test')
+    p.add_argument('--requests', type=int, default=300, help='Requests per cart size and kind (default: 300)')
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser('community-likes', help='Like toggles on a hot post: COUNT(*) recompute vs +-1 counter')
+    p.add_argument('--workers', type=int, default=8, help='Concurrent toggling processes (default: 8)')
+    p.add_argument('--toggles', type=int, default=200, help='Toggles per worker (default: 200)')
+    p.add_argument('--users', type=int, default=20, help='Distinct users per worker (default: 20)')
+    p.add_argument('--existing', type=int, default=20000, help='Likes on the post before the run (default: 20000)')
+    p.set_defaults(func=bench_community_likes)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Database Connection Pool
+
+Per-process pool of SQLite connections shared by the request handlers in app.py.
+
+This module enables:
+- Reusing connections across requests instead of connect/close per helper call
+- Bounded pool size with a borrow timeout
+- Health checks on connections that have been idle for a while
+- Fork safety (a pool inherited by a gunicorn worker starts fresh)
+- Counters for borrows, creations and borrow wait time
+
+Usage in app.py:
+
+    from db_pool import ConnectionPool, PooledConnection
+
+    def _connect():
+        return sqlite3.connect('store.db', factory=PooledConnection, check_same_thread=False)
+
+    pool = ConnectionPool(_connect, size=8, timeout=10.0)
+
+    conn = pool.acquire()
+    try:
+        conn.execute('SELECT 1')
+    finally:
+        pool.release(conn)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no connection could be borrowed within the pool timeout."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() is a no-op while it is borrowed from a pool.
+
+    Existing code calls conn.close() after every helper; while the connection is
+    pool-managed those calls are ignored and the pool decides when to really close.
+    """
+
+    _pool_managed = False
+
+    def close(self):
+        if self._pool_managed:
+            return
+        super().close()
+
+    def really_close(self):
+        """Close the underlying connection regardless of pool ownership."""
+        self._pool_managed = False
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded pool of sqlite3 connections for a single process."""
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        size: int = 8,
+        timeout: float = 10.0,
+        health_check_interval: float = 30.0,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            connect: Factory returning a new connection (should use PooledConnection)
+            size: Maximum number of connections held by this process
+            timeout: Seconds to wait for a free connection before raising PoolTimeout
+            health_check_interval: Idle seconds after which a connection is pinged on borrow
+        """
+        if size < 1:
+            raise ValueError('Pool size must be at least 1')
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._counters = {
+            'borrows': 0,
+            'created': 0,
+            'discarded': 0,
+            'health_checks': 0,
+            'timeouts': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+        }
+
+    def _check_fork(self):
+        # Connections must never cross a fork; a worker starts with an empty pool.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_state()
+
+    def _new_connection(self) -> sqlite3.Connection:
+        conn = self.connect()
+        conn._pool_managed = True
+        conn._pool_row_factory = conn.row_factory
+        self._counters['created'] += 1
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            if hasattr(conn, 'really_close'):
+                conn.really_close()
+            else:
+                conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._counters['discarded'] += 1
+
+    def _is_healthy(self, conn: sqlite3.Connection, idle_since: float) -> bool:
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        self._counters['health_checks'] += 1
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """Borrow a connection, creating one if the pool is not yet full."""
+        self._check_fork()
+        started = time.perf_counter()
+        conn = None
+        while conn is None:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._new_connection()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    break
+                remaining = self.timeout - (time.perf_counter() - started)
+                try:
+                    conn, idle_since = self._idle.get(timeout=max(remaining, 0.001))
+                except queue.Empty:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout}s '
+                        f'(pool size {self.size})'
+                    ) from None
+            if not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                conn = None
+
+        waited_ms = (time.perf_counter() - started) * 1000
+        self._counters['borrows'] += 1
+        self._counters['wait_total_ms'] += waited_ms
+        if waited_ms > self._counters['wait_max_ms']:
+            self._counters['wait_max_ms'] = waited_ms
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a borrowed connection, rolling back any uncommitted work."""
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            # Callers occasionally swap row_factory; hand the next borrower a clean one.
+            conn.row_factory = conn._pool_row_factory
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def clear(self):
+        """Close all idle connections (e.g. after the database file was replaced)."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        """Snapshot of pool counters for diagnostics."""
+        counters = dict(self._counters)
+        borrows = counters['borrows']
+        counters['wait_avg_ms'] = round(counters['wait_total_ms'] / borrows, 3) if borrows else 0.0
+        counters['wait_total_ms'] = round(counters['wait_total_ms'], 3)
+        counters['wait_max_ms'] = round(counters['wait_max_ms'], 3)
+        counters.update({
+            'size': self.size,
+            'open': self._created,
+            'idle': self._idle.qsize(),
+            'pid': self._pid,
+        })
+        return counters
@@ -0,0 +1,330 @@
+"""
+Background Job Queue
+
+Durable job queue stored in an SQLite table, plus a worker that drains it with
+a process pool so CPU-heavy work (image encoding, ...) never runs inside a
+request handler.
+
+This module enables:
+- Enqueueing jobs in the same transaction as the row they belong to
+- Atomic claiming (UPDATE ... RETURNING), safe with several workers/processes
+- Retries with exponential backoff, then a terminal 'failed' state
+- Recovery of jobs left 'processing' by a worker that died
+- Status counts and throughput metrics for the admin pages
+
+Job table (created by the app's migrations):
+
+    CREATE TABLE image_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,              -- JSON
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        error TEXT,
+        result TEXT,                        -- JSON
+        created_at TEXT NOT NULL,
+        available_at REAL NOT NULL,         -- unix time the job may run
+        started_at TEXT,
+        finished_at TEXT,
+        duration_ms REAL,
+        worker_pid INTEGER
+    )
+
+Usage in app.py:
+
+    from job_queue import JobQueue, JobWorker
+
+    queue = JobQueue(get_db, table='image_jobs')
+    queue.enqueue('product_image', {'product_id': 1, 'raw_path': '...'})
+
+    worker = JobWorker(queue, {'product_image': (process_fn, finish_fn)}, processes=2)
+    worker.run_forever()          # or worker.start_background()
+
+process_fn(payload) runs in the pool and must be a picklable module-level
+function; finish_fn(job, result) runs in the worker thread and does the
+database writes.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+JOB_STATUSES = ('queued', 'processing', 'done', 'failed')
+
+
+class JobQueue:
+    """SQLite-backed queue of JSON jobs."""
+
+    def __init__(self, connect: Callable, table: str = 'jobs', max_attempts: int = 3, retry_delay: float = 5.0):
+        """
+        Initialize the queue.
+
+        Args:
+            connect: Returns a connection with row_factory=sqlite3.Row (closed after use)
+            table: Job table name
+            max_attempts: Default attempts before a job is marked failed
+            retry_delay: Base delay in seconds, doubled after every failed attempt
+        """
+        self.connect = connect
+        self.table = table
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def enqueue(self, kind: str, payload: dict, conn=None, delay: float = 0.0) -> int:
+        """Add a job; pass conn to commit it together with the caller's own writes."""
+        own_conn = conn is None
+        conn = conn or self.connect()
+        try:
+            cur = conn.execute(
+                f'INSERT INTO {self.table} (kind, payload, status, max_attempts, created_at, available_at) '
+                f"VALUES (?, ?, 'queued', ?, ?, ?)",
+                (kind, json.dumps(payload), self.max_attempts, datetime.now().isoformat(), time.time() + delay)
+            )
+            if own_conn:
+                conn.commit()
+            return cur.lastrowid
+        finally:
+            if own_conn:
+                conn.close()
+
+    def claim(self, limit: int = 1) -> list:
+        """Atomically mark up to limit due jobs as processing and return them."""
+        now = time.time()
+        conn = self.connect()
+        try:
+            # Idle polls only read: skip the write lock and commit when nothing is due
+            if conn.execute(f"SELECT 1 FROM {self.table} WHERE status='queued' AND available_at <= ? LIMIT 1",
+                            (now,)).fetchone() is None:
+                return []
+            rows = conn.execute(
+                f"UPDATE {self.table} SET status='processing', attempts=attempts+1, started_at=?, worker_pid=? "
+                f"WHERE id IN (SELECT id FROM {self.table} WHERE status='queued' AND available_at <= ? "
+                f"ORDER BY id LIMIT ?) RETURNING *",
+                (datetime.now().isoformat(), os.getpid(), now, limit)
+            ).fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job['payload'] = json.loads(job['payload'])
+        return sorted(jobs, key=lambda j: j['id'])
+
+    def complete(self, job_id: int, result=None, duration_ms: Optional[float] = None):
+        conn = self.connect()
+        try:
+            conn.execute(
+                f"UPDATE {self.table} SET status='done', error=NULL, result=?, finished_at=?, duration_ms=? WHERE id=?",
+                (json.dumps(result) if result is not None else None, datetime.now().isoformat(), duration_ms, job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def fail(self, job_id: int, error: str, duration_ms: Optional[float] = None) -> str:
+        """Record a failed attempt; requeue with backoff or mark failed. Returns the new status."""
+        conn = self.connect()
+        try:
+            row = conn.execute(f'SELECT attempts, max_attempts FROM {self.table} WHERE id=?', (job_id,)).fetchone()
+            if row is None:
+                return 'failed'
+            if row['attempts'] < row['max_attempts']:
+                status = 'queued'
+                available_at = time.time() + self.retry_delay * (2 ** (row['attempts'] - 1))
+            else:
+                status, available_at = 'failed', time.time()
+            conn.execute(
+                f'UPDATE {self.table} SET status=?, error=?, available_at=?, finished_at=?, duration_ms=? WHERE id=?',
+                (status, error[:2000], available_at, datetime.now().isoformat(), duration_ms, job_id)
+            )
+            conn.commit()
+            return status
+        finally:
+            conn.close()
+
+    def requeue_stale(self, older_than: float = 600.0) -> int:
+        """Put back jobs stuck in 'processing' (their worker died) for longer than older_than seconds."""
+        cutoff = datetime.fromtimestamp(time.time() - older_than).isoformat()
+        conn = self.connect()
+        try:
+            cur = conn.execute(
+                f"UPDATE {self.table} SET status='queued', available_at=? WHERE status='processing' AND started_at < ?",
+                (time.time(), cutoff)
+            )
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def retry_failed(self, job_ids=None) -> int:
+        """Requeue failed jobs (all, or the given ids) with a fresh attempt budget."""
+        conn = self.connect()
+        try:
+            sql = f"UPDATE {self.table} SET status='queued', attempts=0, error=NULL, available_at=? WHERE status='failed'"
+            params = [time.time()]
+            if job_ids:
+                sql += f" AND id IN ({','.join('?' * len(job_ids))})"
+                params.extend(job_ids)
+            cur = conn.execute(sql, params)
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def counts(self) -> dict:
+        conn = self.connect()
+        try:
+            rows = conn.execute(f'SELECT status, COUNT(*) AS c FROM {self.table} GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({r['status']: r['c'] for r in rows})
+        return counts
+
+    def recent(self, limit: int = 50) -> list:
+        conn = self.connect()
+        try:
+            rows = conn.execute(f'SELECT * FROM {self.table} ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        finally:
+            conn.close()
+        jobs = [dict(row) for row in rows]
+        for job in jobs:
+            job['payload'] = json.loads(job['payload'])
+        return jobs
+
+
+class JobWorker:
+    """Claims jobs from a JobQueue and runs them on a process pool."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Tuple[Callable, Optional[Callable]]],
+        processes: int = 2,
+        batch_size: Optional[int] = None,
+        poll_interval: float = 1.0,
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            queue: Queue to drain
+            handlers: kind -> (process_fn(payload) run in the pool, finish_fn(job, result) or None)
+            processes: Pool size; 0 runs process_fn inline in the worker thread
+            batch_size: Jobs claimed per round (default: one per process)
+            poll_interval: Seconds to sleep when the queue is empty
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.processes = processes
+        self.batch_size = batch_size or max(processes, 1)
+        self.poll_interval = poll_interval
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._started = None
+        self._counters = {'done': 0, 'failed': 0, 'retried': 0, 'busy_seconds': 0.0, 'job_ms_total': 0.0}
+
+    def _pool(self):
+        if self.processes and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self._executor
+
+    def _finish(self, job, result, duration_ms):
+        _, finish_fn = self.handlers[job['kind']]
+        if finish_fn:
+            finish_fn(job, result)
+        self.queue.complete(job['id'], result, duration_ms)
+        self._counters['done'] += 1
+        self._counters['job_ms_total'] += duration_ms
+
+    def _failed(self, job, error, duration_ms):
+        status = self.queue.fail(job['id'], error, duration_ms)
+        self._counters['failed' if status == 'failed' else 'retried'] += 1
+
+    def run_once(self) -> int:
+        """Claim and process one batch; returns the number of jobs handled."""
+        jobs = self.queue.claim(self.batch_size)
+        if not jobs:
+            return 0
+        started = time.perf_counter()
+        pool = self._pool()
+        pending = []
+        for job in jobs:
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                self._failed(job, f"No handler for job kind '{job['kind']}'", 0.0)
+                continue
+            job_started = time.perf_counter()
+            if pool:
+                pending.append((job, job_started, pool.submit(handler[0], job['payload'])))
+                continue
+            try:
+                result = handler[0](job['payload'])
+                self._finish(job, result, (time.perf_counter() - job_started) * 1000)
+            except Exception as e:
+                self._failed(job, f'{type(e).__name__}: {e}', (time.perf_counter() - job_started) * 1000)
+        for job, job_started, future in pending:
+            try:
+                result = future.result()
+                self._finish(job, result, (time.perf_counter() - job_started) * 1000)
+            except Exception as e:
+                self._failed(job, f'{type(e).__name__}: {e}', (time.perf_counter() - job_started) * 1000)
+        self._counters['busy_seconds'] += time.perf_counter() - started
+        return len(jobs)
+
+    def run_forever(self, stop: Optional[threading.Event] = None, requeue_after: float = 600.0):
+        """Drain the queue until stop is set, sleeping poll_interval when idle."""
+        stop = stop or self._stop
+        self._started = time.monotonic()
+        self.queue.requeue_stale(requeue_after)
+        try:
+            while not stop.is_set():
+                try:
+                    handled = self.run_once()
+                except Exception as e:
+                    print(f'[WORKER] {type(e).__name__}: {e}')
+                    handled = 0
+                if not handled:
+                    stop.wait(self.poll_interval)
+        finally:
+            self.shutdown()
+
+    def start_background(self) -> threading.Thread:
+        """Run the worker loop in a daemon thread of the current process."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name=f'{self.queue.table}-worker', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """Throughput metrics for this worker process."""
+        counters = dict(self._counters)
+        handled = counters['done']
+        uptime = time.monotonic() - self._started if self._started else 0.0
+        counters.update({
+            'running': bool(self._thread and self._thread.is_alive()),
+            'processes': self.processes,
+            'uptime_seconds': round(uptime, 1),
+            'busy_seconds': round(counters['busy_seconds'], 3),
+            'jobs_per_busy_second': round(handled / counters['busy_seconds'], 2) if counters['busy_seconds'] else 0.0,
+            'avg_job_ms': round(counters['job_ms_total'] / handled, 1) if handled else 0.0,
+        })
+        del counters['job_ms_total']
+        return counters
@@ -0,0 +1,162 @@
+"""
+Mock External Services
+
+Small local stand-ins for the HTTP APIs the store calls, for development and
+failure testing without real credentials or network access.
+
+This module enables:
+- A fake Razorpay Orders API (create, list by receipt, fetch)
+- A fake Brevo contacts API (bulk import into lists, list contents)
+- Fault injection per service: added latency, a share of failed calls, the
+  HTTP status to fail with, or a hard outage
+
+Usage:
+
+    python mock_services.py --port 9010
+    RAZORPAY_KEY_ID=rzp_test_x RAZORPAY_KEY_SECRET=secret \\
+        RAZORPAY_API_BASE=http://127.0.0.1:9010/v1 flask run
+
+    BREVO_API_KEY=test BREVO_LIST_ID=2 BREVO_API_BASE=http://127.0.0.1:9010/v3 flask run
+
+    # make half of the Razorpay calls fail with a 503 after 2s
+    curl -X POST localhost:9010/__faults/razorpay -H 'Content-Type: application/json' \\
+        -d '{"latency": 2, "fail_rate": 0.5, "status": 503}'
+
+    # rate-limit Brevo: 429 with a 10s reset window
+    curl -X POST localhost:9010/__faults/brevo -H 'Content-Type: application/json' \\
+        -d '{"down": true, "status": 429, "reset": 10}'
+"""
+
+import argparse
+import itertools
+import random
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_orders = {}
+_faults = {}
+_calls = {}
+_brevo_lists = {}
+_brevo_imports = []
+
+
+def _inject_faults(service):
+    """Apply the configured faults; returns an error response or None."""
+    with _lock:
+        _calls[service] = _calls.get(service, 0) + 1
+        faults = dict(_faults.get(service, {}))
+    if faults.get('latency'):
+        time.sleep(float(faults['latency']))
+    if faults.get('down') or random.random() < float(faults.get('fail_rate', 0)):
+        status = int(faults.get('status', 503))
+        body = {'error': {'code': 'SERVER_ERROR', 'description': f'Injected {status} from mock {service}'}}
+        headers = {}
+        if status == 429:
+            reset = str(faults.get('reset', 1))
+            headers = {'Retry-After': reset, 'x-sib-ratelimit-reset': reset}
+        return jsonify(body), status, headers
+    return None
+
+
+@app.route('/__faults/<service>', methods=['GET', 'POST', 'DELETE'])
+def faults(service):
+    """POST a JSON object of faults (latency, fail_rate, status, down), DELETE to clear."""
+    with _lock:
+        if request.method == 'POST':
+            _faults[service] = request.get_json(force=True) or {}
+        elif request.method == 'DELETE':
+            _faults.pop(service, None)
+        return jsonify({'faults': _faults.get(service, {}), 'calls': _calls.get(service, 0)})
+
+
+########################
+# Razorpay Orders API
+########################
+
+@app.route('/v1/orders', methods=['POST'])
+def razorpay_create_order():
+    error = _inject_faults('razorpay')
+    if error:
+        return error
+    data = request.get_json(force=True) or {}
+    if not isinstance(data.get('amount'), int) or data['amount'] < 100:
+        return jsonify({'error': {'code': 'BAD_REQUEST_ERROR',
+                                  'description': 'The amount must be atleast INR 1.00'}}), 400
+    with _lock:
+        order_id = f'order_mock{next(_ids):010d}'
+        order = _orders[order_id] = {
+            'id': order_id, 'entity': 'order', 'amount': data['amount'], 'amount_paid': 0,
+            'amount_due': data['amount'], 'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'), 'notes': data.get('notes') or {}, 'status': 'created',
+            'attempts': 0, 'created_at': int(time.time()),
+        }
+    return jsonify(order)
+
+
+@app.route('/v1/orders', methods=['GET'])
+def razorpay_list_orders():
+    error = _inject_faults('razorpay')
+    if error:
+        return error
+    receipt = request.args.get('receipt')
+    with _lock:
+        items = [o for o in _orders.values() if receipt is None or o['receipt'] == receipt]
+    items.sort(key=lambda o: o['created_at'], reverse=True)
+    return jsonify({'entity': 'collection', 'count': len(items), 'items': items})
+
+
+@app.route('/v1/orders/<order_id>', methods=['GET'])
+def razorpay_fetch_order(order_id):
+    error = _inject_faults('razorpay')
+    if error:
+        return error
+    with _lock:
+        order = _orders.get(order_id)
+    if order is None:
+        return jsonify({'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}}), 400
+    return jsonify(order)
+
+
+########################
+# Brevo contacts API
+########################
+
+@app.route('/v3/contacts/import', methods=['POST'])
+def brevo_import_contacts():
+    if not request.headers.get('api-key'):
+        return jsonify({'code': 'unauthorized', 'message': 'Key not found'}), 401
+    error = _inject_faults('brevo')
+    if error:
+        return error
+    data = request.get_json(force=True) or {}
+    contacts = data.get('jsonBody') or []
+    if not data.get('listIds') or not contacts or any('@' not in (c.get('email') or '') for c in contacts):
+        return jsonify({'code': 'invalid_parameter', 'message': 'listIds and valid jsonBody emails are required'}), 400
+    with _lock:
+        for list_id in data['listIds']:
+            _brevo_lists.setdefault(int(list_id), set()).update(c['email'].lower() for c in contacts)
+        _brevo_imports.append(len(contacts))
+        process_id = len(_brevo_imports)
+    return jsonify({'processId': process_id}), 202
+
+
+@app.route('/v3/contacts/lists/<int:list_id>/contacts', methods=['GET'])
+def brevo_list_contacts(list_id):
+    with _lock:
+        emails = sorted(_brevo_lists.get(list_id, ()))
+        imports = list(_brevo_imports)
+    return jsonify({'contacts': [{'email': e} for e in emails], 'count': len(emails), 'imports': imports})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run mock external services')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9010)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,150 @@
+"""
+Resilience Helpers
+
+Guards for calls to external HTTP services (payment gateway, newsletter API)
+so a slow or failing dependency degrades one feature instead of tying up
+every worker.
+
+This module enables:
+- Retrying transient failures with exponential backoff and jitter
+- A circuit breaker that fails fast while a service keeps erroring, then
+  lets a single trial call through after a cool-down (half-open)
+- Counters for the admin diagnostics
+
+Breaker state lives in the process, so each gunicorn worker trips on its own.
+
+Usage in app.py:
+
+    from resilience import CircuitBreaker, CircuitOpenError, retry_call
+
+    breaker = CircuitBreaker('razorpay', failure_threshold=5, reset_timeout=30)
+
+    try:
+        result = breaker.call(retry_call, lambda attempt: api.create(...), attempts=3,
+                              retry_on=(requests.ConnectionError,))
+    except CircuitOpenError:
+        ...                                   # skipped, service marked down
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple, Type
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+def retry_call(
+    fn: Callable[[int], object],
+    attempts: int = 3,
+    backoff: float = 0.5,
+    max_backoff: float = 5.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    deadline: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """
+    Call fn(attempt) until it succeeds or attempts run out.
+
+    Args:
+        fn: Called with the 1-based attempt number (lets it check for the
+            effect of an earlier attempt that timed out)
+        attempts: Total tries
+        backoff: Delay before the second try, doubled after each failure
+        max_backoff: Cap on a single delay
+        retry_on: Exception types worth retrying; anything else propagates at once
+        deadline: Total seconds for all tries; no retry starts after the backoff
+            would pass it (fn should bound its own calls by the same budget)
+        sleep: Injectable for tests
+
+    Returns:
+        fn's return value; the last exception is re-raised when all tries fail
+    """
+    started = time.monotonic()
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(attempt)
+        except retry_on:
+            delay = min(max_backoff, backoff * (2 ** (attempt - 1))) * random.uniform(0.5, 1.0)
+            if attempt == attempts or (deadline is not None and time.monotonic() - started + delay >= deadline):
+                raise
+            sleep(delay)
+
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures; after
+    reset_timeout one trial call is allowed (half-open) and its outcome closes
+    or re-opens the circuit."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 counted: Tuple[Type[BaseException], ...] = (Exception,)):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Service name (diagnostics, error messages)
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+            counted: Exception types that count as service failures (others,
+                e.g. a rejected request, pass through and count as success)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.counted = counted
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def _before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial_running):
+                self._counters['rejected'] += 1
+                raise CircuitOpenError(f'{self.name} is unavailable (circuit open)')
+            if state == 'half-open':
+                self._trial_running = True
+            self._counters['calls'] += 1
+
+    def _record(self, failed: bool):
+        with self._lock:
+            self._trial_running = False
+            if not failed:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            self._counters['failures'] += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self._counters['opened'] += 1
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) through the breaker."""
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except self.counted:
+            self._record(failed=True)
+            raise
+        except BaseException:
+            self._record(failed=False)
+            raise
+        self._record(failed=False)
+        return result
+
+    def stats(self) -> dict:
+        return {**self._counters, 'state': self.state, 'consecutive_failures': self._failures}
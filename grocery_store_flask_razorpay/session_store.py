@@ -0,0 +1,330 @@
+"""
+Server-Side Sessions
+
+Flask session interface that keeps session data in an SQLite table and puts
+only a signed session id in the cookie, so carts and filters no longer make
+every request and response carry (and re-sign) the whole session.
+
+This module enables:
+- Compact storage: Flask's tagged JSON, zlib-compressed above a size threshold
+- An in-process LRU read cache; the cookie carries the session's revision, so
+  a cached copy is used only when it is the revision the browser last saw
+- Writes only when the session changed; expiry is extended at most once per
+  touch_interval instead of on every request
+- TTL expiry: expired rows are ignored on read and swept in small batches
+- Taking over an existing signed-cookie session on first visit (no lost carts)
+- session.regenerate() to move the data to a new id on login/logout
+
+Session table (created by the app's migrations):
+
+    CREATE TABLE sessions (
+        sid TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        rev INTEGER NOT NULL,
+        expires_at REAL NOT NULL          -- unix time
+    ) WITHOUT ROWID
+
+Usage in app.py:
+
+    from session_store import SqliteSessionInterface
+
+    app.session_interface = SqliteSessionInterface(_connect, legacy=SecureCookieSessionInterface())
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+SESSION_NEW_LIFETIME = 24 * 3600  # seconds a non-permanent session is kept
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict with the id and revision of its stored row."""
+
+    def __init__(self, initial=None, sid: Optional[str] = None, rev: int = 0):
+        super().__init__(initial)
+        self.new = sid is None
+        self.sid = sid or secrets.token_urlsafe(24)
+        self.rev = rev
+        self.expires_at = 0.0
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id (call on login/logout); the old row is
+        deleted when the session is saved, so a planted or leaked id is dead."""
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(24)
+        self.new = True
+        self.rev = 0
+        self.modified = True
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Sessions stored in an SQLite table, looked up by a signed cookie id."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(
+        self,
+        connect: Callable,
+        table: str = 'sessions',
+        cache_size: int = 2048,
+        compress_min: int = 256,
+        touch_interval: float = 3600.0,
+        sweep_interval: float = 300.0,
+        sweep_batch: int = 500,
+        legacy: Optional[SessionInterface] = None,
+    ):
+        """
+        Initialize the interface.
+
+        Args:
+            connect: Opens a new standalone connection with row_factory=sqlite3.Row.
+                The store keeps one per thread and never uses a request's
+                connection, so its commits cannot include a handler's
+                uncommitted writes (save_session also runs for 500 responses)
+            table: Session table name
+            cache_size: Sessions kept in the in-process read cache
+            compress_min: Encoded size in bytes from which data is zlib-compressed
+            touch_interval: Seconds between expiry extensions of an unchanged session
+            sweep_interval: Minimum seconds between opportunistic sweeps of expired rows
+            sweep_batch: Rows deleted per sweep statement
+            legacy: Interface whose cookies are converted on first visit (e.g. Flask's default)
+        """
+        self.connect = connect
+        self.table = table
+        self.cache_size = cache_size
+        self.compress_min = compress_min
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.legacy = legacy
+        self._cache = OrderedDict()   # sid -> (rev, expires_at, encoded data)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._last_sweep = time.monotonic()
+        self._counters = {'cache_hits': 0, 'db_reads': 0, 'writes': 0, 'touches': 0,
+                          'deleted': 0, 'swept': 0, 'converted': 0}
+
+    # -- encoding ---------------------------------------------------------
+
+    def encode(self, data: dict) -> bytes:
+        raw = self.serializer.dumps(data).encode('utf-8')
+        if len(raw) >= self.compress_min:
+            return b'z' + zlib.compress(raw, 6)
+        return b'j' + raw
+
+    def decode(self, blob: bytes) -> dict:
+        raw = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+        return self.serializer.loads(raw.decode('utf-8'))
+
+    # -- connection -------------------------------------------------------
+
+    @contextmanager
+    def _db(self):
+        """This thread's own connection; commits on success, rolls back on error."""
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.key != (os.getpid(), self._generation):
+            local.conn = self.connect()
+            local.key = (os.getpid(), self._generation)
+        try:
+            yield local.conn
+            local.conn.commit()
+        except BaseException:
+            local.conn.rollback()
+            raise
+
+    def reset(self):
+        """Reopen connections on next use (e.g. after the database file was replaced)."""
+        self._generation += 1
+
+    # -- cache ------------------------------------------------------------
+
+    def _cache_put(self, sid, rev, expires_at, blob):
+        with self._lock:
+            self._cache[sid] = (rev, expires_at, blob)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, sid):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                self._cache.move_to_end(sid)
+            return entry
+
+    def _cache_drop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    # -- SessionInterface -------------------------------------------------
+
+    def _signer(self, app) -> Signer:
+        return Signer(app.secret_key, salt='server-session')
+
+    def _load(self, sid: str, rev: int, now: float):
+        """Return (rev, expires_at, blob) for a live session, or None."""
+        entry = self._cache_get(sid)
+        if entry is not None and entry[0] == rev and entry[1] > now:
+            self._counters['cache_hits'] += 1
+            return entry
+        self._counters['db_reads'] += 1
+        with self._db() as conn:
+            row = conn.execute(f'SELECT rev, expires_at, data FROM {self.table} WHERE sid=?', (sid,)).fetchone()
+        if row is None or row['expires_at'] <= now:
+            self._cache_drop(sid)
+            return None
+        entry = (row['rev'], row['expires_at'], bytes(row['data']))
+        self._cache_put(sid, *entry)
+        return entry
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return ServerSession()
+        try:
+            sid, rev = self._signer(app).unsign(value).decode('ascii').rsplit('.', 1)
+            rev = int(rev)
+        except (BadSignature, ValueError):
+            return self._convert_legacy(app, request)
+        now = time.time()
+        try:
+            entry = self._load(sid, rev, now)
+        except sqlite3.OperationalError:
+            # Table not created yet (first request before migrations ran)
+            return ServerSession()
+        if entry is None:
+            # Expired or unknown: start over with a fresh id, never the client's
+            return ServerSession()
+        session = ServerSession(self.decode(entry[2]), sid=sid, rev=entry[0])
+        session.expires_at = entry[1]
+        return session
+
+    def _convert_legacy(self, app, request):
+        if self.legacy is None:
+            return ServerSession()
+        old = self.legacy.open_session(app, request)
+        session = ServerSession(dict(old) if old else None)
+        if old:
+            session.modified = True
+            self._counters['converted'] += 1
+        return session
+
+    def _lifetime(self, app, session) -> float:
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return SESSION_NEW_LIFETIME
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.replaced_sid:
+            self.delete(session.replaced_sid)
+            session.replaced_sid = None
+
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app, session)
+        if session.modified or session.new:
+            session.expires_at = now + lifetime
+            blob = self.encode(dict(session))
+            with self._db() as conn:
+                # The revision comes from the row, so two processes saving the
+                # same session never hand out one rev for different data
+                session.rev = conn.execute(
+                    f'INSERT INTO {self.table} (sid, data, rev, expires_at) VALUES (?, ?, 1, ?) '
+                    f'ON CONFLICT(sid) DO UPDATE SET data=excluded.data, rev={self.table}.rev + 1, '
+                    f'expires_at=excluded.expires_at RETURNING rev',
+                    (session.sid, blob, session.expires_at)
+                ).fetchone()[0]
+            self._cache_put(session.sid, session.rev, session.expires_at, blob)
+            self._counters['writes'] += 1
+        elif session.expires_at - now < lifetime - self.touch_interval:
+            session.expires_at = now + lifetime
+            with self._db() as conn:
+                conn.execute(f'UPDATE {self.table} SET expires_at=? WHERE sid=?', (session.expires_at, session.sid))
+            entry = self._cache_get(session.sid)
+            if entry is not None:
+                self._cache_put(session.sid, entry[0], session.expires_at, entry[2])
+            self._counters['touches'] += 1
+        else:
+            # Unchanged and recently extended: nothing to write or send
+            self._maybe_sweep()
+            return
+
+        value = self._signer(app).sign(f'{session.sid}.{session.rev}'.encode('ascii')).decode('ascii')
+        response.set_cookie(name, value, expires=self.get_expiration_time(app, session), httponly=httponly,
+                            domain=domain, path=path, secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+        self._maybe_sweep()
+
+    # -- maintenance ------------------------------------------------------
+
+    def delete(self, sid: str):
+        self._cache_drop(sid)
+        with self._db() as conn:
+            conn.execute(f'DELETE FROM {self.table} WHERE sid=?', (sid,))
+        self._counters['deleted'] += 1
+
+    def sweep(self, now: Optional[float] = None, max_batches: Optional[int] = None) -> int:
+        """Delete expired sessions sweep_batch rows at a time; returns the count."""
+        now = now or time.time()
+        deleted = batches = 0
+        while max_batches is None or batches < max_batches:
+            with self._db() as conn:
+                cur = conn.execute(
+                    f'DELETE FROM {self.table} WHERE sid IN '
+                    f'(SELECT sid FROM {self.table} WHERE expires_at <= ? LIMIT ?)',
+                    (now, self.sweep_batch)
+                )
+            deleted += cur.rowcount
+            batches += 1
+            if cur.rowcount < self.sweep_batch:
+                break
+        self._counters['swept'] += deleted
+        return deleted
+
+    def _maybe_sweep(self):
+        """One small sweep batch at most every sweep_interval seconds per process."""
+        if time.monotonic() - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = time.monotonic()
+        try:
+            self.sweep(max_batches=1)
+        except sqlite3.Error as e:
+            print(f'[SESSION] Sweep failed: {e}')
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached = len(self._cache)
+        return {**self._counters, 'cached': cached, 'cache_size': self.cache_size}
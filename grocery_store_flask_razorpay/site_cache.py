@@ -0,0 +1,182 @@
+"""
+Site Cache Module
+
+In-process caches for data that only changes when an admin edits it, with
+invalidation that reaches every worker process.
+
+This module enables:
+- Version stamps: tiny files whose identity changes on every bump, so any
+  process can detect a change with a single os.stat() (no database query)
+- VersionedCache: values cached until one of their stamps is bumped
+- PageCache: bounded LRU of rendered pages with a TTL, also tied to stamps
+- Hit/miss counters for diagnostics
+
+Usage in app.py:
+
+    from site_cache import VersionStamps, VersionedCache
+
+    stamps = VersionStamps('data/cache_stamps')
+    cache = VersionedCache(stamps)
+
+    regions = cache.get('regions', ('regions',), load_regions)   # cached
+    stamps.bump('regions')                                        # after an admin write
+
+    pages = PageCache(stamps, max_entries=256, ttl=60)
+    version = pages.version(('catalog',))
+    html = pages.get(key, version)                 # None on a miss
+    pages.put(key, version, html)
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+
+class VersionStamps:
+    """Named version stamps shared between processes through the filesystem."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.stamp')
+
+    def current(self, name: str) -> Optional[Tuple[int, int]]:
+        """Return an opaque token that changes whenever the stamp is bumped."""
+        try:
+            st = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        # os.replace() in bump() always swaps in a new inode, so the pair changes
+        # even when two bumps land within the filesystem's mtime resolution.
+        return (st.st_ino, st.st_mtime_ns)
+
+    def modified_at(self, name: str) -> Optional[float]:
+        """Unix time of the last bump (None if never bumped)."""
+        try:
+            return os.stat(self._path(name)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def bump(self, name: str):
+        """Invalidate everything cached against this stamp, in every process."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{name}.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{time.time()} {uuid.uuid4().hex}\n')
+            os.replace(tmp_path, self._path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class VersionedCache:
+    """Cache of loader results, each valid until one of its stamps is bumped."""
+
+    def __init__(self, stamps: VersionStamps):
+        self.stamps = stamps
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, stamp_names: Iterable[str]) -> tuple:
+        return tuple(self.stamps.current(name) for name in stamp_names)
+
+    def get(self, key: str, stamp_names: Iterable[str], loader: Callable):
+        """Return the cached value for key, calling loader() if any stamp changed.
+
+        The version is read before loading, so a bump racing with the load
+        leaves an entry that is already stale and reloads on the next call.
+        Exceptions from loader() propagate and nothing is cached.
+        """
+        version = self.version(stamp_names)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self.misses += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class PageCache:
+    """Bounded LRU cache of rendered pages, each valid for ttl seconds or until
+    one of its stamps is bumped, whichever comes first."""
+
+    def __init__(self, stamps: VersionStamps, max_entries: int = 256, ttl: float = 60.0):
+        self.stamps = stamps
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def version(self, stamp_names: Iterable[str]) -> tuple:
+        return tuple(self.stamps.current(name) for name in stamp_names)
+
+    def get(self, key, version: tuple):
+        """Return the cached page for key, or None if missing, expired or stale."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, expires_at, value = entry
+            if entry_version != version or expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, version: tuple, value):
+        """Store value under key. Pass the version read before rendering, so a
+        page that raced with a bump is already stale when stored."""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'expired': self.expired,
+            'evictions': self.evictions,
+        }
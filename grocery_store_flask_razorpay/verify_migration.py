@@ -10,6 +10,7 @@ Checks:
 - All expected columns exist in tables
 - Data counts before/after migration
 - Schema version tracking
+- Secondary indexes exist and are chosen by the query planner
 - Key relationships and constraints
 - Performance metrics
 
@@ -50,6 +51,51 @@ class DatabaseVerifier:
         'schema_version': ['id', 'version', 'description', 'applied_at', 'status'],
     }
     
+    # Secondary indexes added by migrations v6+ (index name -> table)
+    EXPECTED_INDEXES = {
+        'idx_products_category': 'products',
+        'idx_products_homepage': 'products',
+        'idx_orders_email': 'orders',
+        'idx_orders_razorpay_order_id': 'orders',
+        'idx_order_items_order': 'order_items',
+        'idx_order_items_product': 'order_items',
+        'idx_product_reviews_product': 'product_reviews',
+        'idx_community_comments_post': 'community_comments',
+        'idx_community_posts_featured': 'community_posts',
+    }
+    
+    # Hot queries from app.py and the index EXPLAIN QUERY PLAN must report for each
+    QUERY_PLAN_CHECKS = [
+        ('catalog listing by category',
+         "SELECT * FROM products WHERE category = 'Products' ORDER BY id DESC",
+         'idx_products_category'),
+        ('homepage products',
+         "SELECT * FROM products WHERE is_homepage = 1 AND category = 'Products' ORDER BY id DESC",
+         'idx_products_homepage'),
+        ('orders by customer email',
+         "SELECT * FROM orders WHERE email = 'a@example.com' ORDER BY created_at DESC",
+         'idx_orders_email'),
+        ('payment callback lookup',
+         "UPDATE orders SET payment_status = 'paid' WHERE razorpay_order_id = 'order_x'",
+         'idx_orders_razorpay_order_id'),
+        ('order items of an order',
+         'SELECT oi.*, p.name FROM order_items oi JOIN products p ON oi.product_id = p.id WHERE order_id = 1',
+         'idx_order_items_order'),
+        ('verified purchase check',
+         "SELECT COUNT(*) FROM orders o JOIN order_items oi ON oi.order_id = o.id "
+         "WHERE o.email = 'a@example.com' AND o.payment_status = 'paid' AND oi.product_id = 1",
+         'idx_order_items_product'),
+        ('product review stats',
+         'SELECT rating, COUNT(*) FROM product_reviews WHERE product_id = 1 AND is_approved = 1 GROUP BY rating',
+         'idx_product_reviews_product'),
+        ('comments of a post',
+         'SELECT * FROM community_comments WHERE post_id = 1 ORDER BY created_at DESC',
+         'idx_community_comments_post'),
+        ('community feed',
+         'SELECT * FROM community_posts ORDER BY is_featured DESC, created_at DESC LIMIT 10',
+         'idx_community_posts_featured'),
+    ]
+    
     def __init__(self, db_path='store.db'):
         """Initialize verifier with database path."""
         self.db_path = db_path
@@ -71,6 +117,8 @@ class DatabaseVerifier:
             ('Column Definitions', self.check_column_definitions),
             ('Data Integrity', self.check_data_integrity),
             ('Schema Versions', self.check_schema_versions),
+            ('Indexes Exist', self.check_indexes_exist),
+            ('Query Plans', self.check_query_plans),
             ('Data Counts', self.check_data_counts),
         ]
         
@@ -275,6 +323,68 @@ class DatabaseVerifier:
                 'message': str(e),
             }
     
+    def check_indexes_exist(self):
+        """Check that all expected secondary indexes exist on the right tables."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cur = conn.cursor()
+            
+            cur.execute("SELECT name, tbl_name FROM sqlite_master WHERE type='index'")
+            existing = {row[0]: row[1] for row in cur.fetchall()}
+            conn.close()
+            
+            issues = []
+            for index_name, table_name in self.EXPECTED_INDEXES.items():
+                if index_name not in existing:
+                    issues.append(f"{index_name}: missing (expected on {table_name})")
+                elif existing[index_name] != table_name:
+                    issues.append(f"{index_name}: on {existing[index_name]}, expected {table_name}")
+            
+            status = 'PASS' if not issues else 'FAIL'
+            return {
+                'status': status,
+                'message': f"{f'✓ All {len(self.EXPECTED_INDEXES)} indexes present' if not issues else f'✗ {len(issues)} issue(s)'}",
+                'issues': issues,
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e),
+            }
+    
+    def check_query_plans(self):
+        """Check that hot queries are planned with their intended index."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            
+            issues = []
+            plans = {}
+            for description, sql, index_name in self.QUERY_PLAN_CHECKS:
+                try:
+                    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                except sqlite3.OperationalError as e:
+                    issues.append(f"{description}: {e}")
+                    continue
+                details = [row[3] for row in rows]
+                plans[description] = details
+                if not any(f"INDEX {index_name}" in detail for detail in details):
+                    issues.append(f"{description}: expected {index_name}, plan was {'; '.join(details)}")
+            
+            conn.close()
+            
+            status = 'PASS' if not issues else 'FAIL'
+            return {
+                'status': status,
+                'message': f"{f'✓ {len(plans)} queries use their indexes' if not issues else f'✗ {len(issues)} issue(s)'}",
+                'issues': issues,
+                'plans': plans,
+            }
+        except Exception as e:
+            return {
+                'status': 'ERROR',
+                'message': str(e),
+            }
+    
     def check_data_counts(self):
         """Check data row counts in key tables."""
         try: